@@ -7,8 +7,7 @@ AI图像生成器基础类
 """
 
 import os
-from openrouter_image_generator import openrouter_generator
-from fallback_generator import FallbackImageGenerator
+from provider_registry import providers
 
 class AIImageGenerator:
     """
@@ -19,9 +18,11 @@ class AIImageGenerator:
     def __init__(self):
         """初始化AI图像生成器"""
         print("🤖 AI图像生成器初始化完成")
-        
-        # 初始化备用生成器
-        self.fallback_generator = FallbackImageGenerator()
+    
+    @property
+    def fallback_generator(self):
+        """备用生成器（和其他生成器共用同一个实例）"""
+        return providers.get('fallback')
         
     def generate_image(self, prompt, style=None, reference_image_path=None):
         """
@@ -43,7 +44,7 @@ class AIImageGenerator:
         
         try:
             # 优先使用OpenRouter生成器
-            generated_image_path = openrouter_generator.generate_image(
+            generated_image_path = providers.get('openrouter').generate_image(
                 prompt=prompt,
                 style=style,
                 reference_image_path=reference_image_path
@@ -71,10 +72,15 @@ class AIImageGenerator:
     
     def test_connection(self):
         """测试API连接"""
-        return openrouter_generator.test_connection()
+        return providers.get('openrouter').test_connection()
 
-# 全局实例
-ai_generator = AIImageGenerator()
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from ai_image_generator import ai_generator 的写法
+def __getattr__(name):
+    if name == 'ai_generator':
+        from provider_registry import providers
+        return providers.get('ai')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 
@@ -7,11 +7,12 @@ AI视频生成器
 使用字节跳动ARK图生视频API
 """
 
-import requests
 import json
 import time
 import os
 from config import Config
+from http_client import http_pool
+from metrics import instrument_provider
 
 class AIVideoGenerator:
     """AI视频生成器"""
@@ -22,6 +23,7 @@ class AIVideoGenerator:
         self.base_url = "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks"
         print("🎬 豆包ARK AI视频生成器初始化完成")
     
+    @instrument_provider('ark', 'create_video_task')
     def create_video_task(self, image_url, prompt, **kwargs):
         """
         创建图生视频任务
@@ -39,6 +41,31 @@ class AIVideoGenerator:
             dict: 包含任务ID或错误信息
         """
         
+        data = self._build_task_payload(image_url, prompt, **kwargs)
+        
+        try:
+            print(f"📡 发送视频生成请求...")
+            response = http_pool.post(self.base_url, headers=self._headers(), json=data, timeout=30, provider='ark')
+            return self._parse_create_response(response)
+        
+        except Exception as e:
+            error_msg = f"请求失败: {str(e)}"
+            print(f"❌ 视频任务创建出错: {error_msg}")
+            return {
+                'success': False,
+                'error': error_msg
+            }
+    
+    def _headers(self):
+        """ARK请求头"""
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.config.ARK_API_KEY}"
+        }
+    
+    def _build_task_payload(self, image_url, prompt, **kwargs):
+        """构建图生视频任务的请求数据（同步和异步接口共用）"""
+        
         # 获取视频参数
         resolution = kwargs.get('resolution', '1080p')
         duration = kwargs.get('duration', 5)
@@ -53,13 +80,7 @@ class AIVideoGenerator:
         print(f"   描述: {prompt}")
         print(f"   参数: {resolution}, {duration}s, 镜头{'固定' if camera_fixed else '动态'}, {'有' if watermark else '无'}水印")
         
-        # 构建请求数据
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.config.ARK_API_KEY}"
-        }
-        
-        data = {
+        return {
             "model": "ep-20250904152826-dxz7p",  # 图生视频模型
             "content": [
                 {
@@ -74,43 +95,34 @@ class AIVideoGenerator:
                 }
             ]
         }
-        
-        try:
-            print(f"📡 发送视频生成请求...")
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=30)
+    
+    def _parse_create_response(self, response):
+        """解析创建任务的响应（同步和异步接口共用）"""
+        if response.status_code == 200:
+            result = response.json()
+            task_id = result.get('id')
+            print(f"✅ 视频任务创建成功: {task_id}")
             
-            if response.status_code == 200:
-                result = response.json()
-                task_id = result.get('id')
-                print(f"✅ 视频任务创建成功: {task_id}")
-                
-                return {
-                    'success': True,
-                    'task_id': task_id,
-                    'message': '视频生成任务已创建，正在处理中...'
-                }
-            else:
-                error_msg = f"API错误: {response.status_code}"
-                try:
-                    error_data = response.json()
-                    error_msg = error_data.get('error', {}).get('message', error_msg)
-                except:
-                    pass
-                
-                print(f"❌ 视频任务创建失败: {error_msg}")
-                return {
-                    'success': False,
-                    'error': error_msg
-                }
-        
-        except Exception as e:
-            error_msg = f"请求失败: {str(e)}"
-            print(f"❌ 视频任务创建出错: {error_msg}")
+            return {
+                'success': True,
+                'task_id': task_id,
+                'message': '视频生成任务已创建，正在处理中...'
+            }
+        else:
+            error_msg = f"API错误: {response.status_code}"
+            try:
+                error_data = response.json()
+                error_msg = error_data.get('error', {}).get('message', error_msg)
+            except:
+                pass
+            
+            print(f"❌ 视频任务创建失败: {error_msg}")
             return {
                 'success': False,
                 'error': error_msg
             }
     
+    @instrument_provider('ark', 'check_task_status')
     def check_task_status(self, task_id):
         """
         查询视频生成任务状态
@@ -123,33 +135,11 @@ class AIVideoGenerator:
         """
         
         url = f"{self.base_url}/{task_id}"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.config.ARK_API_KEY}"
-        }
         
         try:
             print(f"🔍 查询任务状态: {task_id}")
-            response = requests.get(url, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                status = result.get('status', 'unknown')
-                
-                print(f"📊 任务状态: {status}")
-                
-                return {
-                    'success': True,
-                    'status': status,
-                    'data': result
-                }
-            else:
-                error_msg = f"查询失败: {response.status_code}"
-                print(f"❌ {error_msg}")
-                return {
-                    'success': False,
-                    'error': error_msg
-                }
+            response = http_pool.get(url, headers=self._headers(), timeout=30, provider='ark')
+            return self._parse_status_response(response)
         
         except Exception as e:
             error_msg = f"查询出错: {str(e)}"
@@ -159,6 +149,27 @@ class AIVideoGenerator:
                 'error': error_msg
             }
     
+    def _parse_status_response(self, response):
+        """解析任务状态查询的响应（同步和异步接口共用）"""
+        if response.status_code == 200:
+            result = response.json()
+            status = result.get('status', 'unknown')
+            
+            print(f"📊 任务状态: {status}")
+            
+            return {
+                'success': True,
+                'status': status,
+                'data': result
+            }
+        else:
+            error_msg = f"查询失败: {response.status_code}"
+            print(f"❌ {error_msg}")
+            return {
+                'success': False,
+                'error': error_msg
+            }
+    
     def wait_for_completion(self, task_id, max_wait_time=300, check_interval=10):
         """
         等待视频生成完成
@@ -253,6 +264,11 @@ class AIVideoGenerator:
             }
         }
 
-# 全局视频生成器实例
-video_generator = AIVideoGenerator()
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from ai_video_generator import video_generator 的写法
+def __getattr__(name):
+    if name == 'video_generator':
+        from provider_registry import providers
+        return providers.get('video')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
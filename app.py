@@ -2,21 +2,31 @@
 # 这个程序负责接收用户的请求，处理图片生成任务
 
 # 导入需要的Python库
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, g
 import os
 import json
+import time
 from datetime import datetime
 import uuid
+import queue
+from functools import partial
 
 # 导入我们自己的AI图像生成模块
-from ai_image_generator import AIImageGenerator
-from gemini_image_generator import gemini_generator
-from ai_video_generator import video_generator
-from segmind_image_generator import segmind_generator
-from gpt_image1_generator import gpt_image1_generator
-from document_processor import document_processor
+# 各个生成器通过注册表在第一次使用时才创建
+from provider_registry import providers
 from config import Config
-from prompt_enhancer import prompt_enhancer
+from job_queue import job_queue, QueueFullError
+from http_client import http_pool
+from circuit_breaker import circuit_breakers
+from provider_race import race_providers
+import model_router
+from result_cache import result_cache
+from batch_generator import batch_generator, BatchValidationError
+from video_task_poller import video_task_poller
+from event_bus import event_bus
+from upload_store import upload_store
+from health_checker import health_checker
+from metrics import metrics, record_request
 
 # 创建Flask应用 - Flask是一个简单易用的Python网站框架
 app = Flask(__name__)
@@ -26,14 +36,35 @@ UPLOAD_FOLDER = Config.UPLOAD_FOLDER
 GENERATED_FOLDER = Config.GENERATED_FOLDER
 ALLOWED_EXTENSIONS = Config.ALLOWED_EXTENSIONS
 
-# 如果文件夹不存在，就创建它们
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-if not os.path.exists(GENERATED_FOLDER):
-    os.makedirs(GENERATED_FOLDER)
+_app_initialized = False
 
-# 创建AI图像生成器实例
-ai_generator = AIImageGenerator()
+def create_app():
+    """
+    WSGI应用工厂
+    完成启动时的准备工作（创建文件夹、预热连接）并返回应用；
+    gunicorn等服务器在每个工作进程fork之后才导入本模块并调用它，
+    生成器、线程池和HTTP会话都在工作进程里创建，不会和父进程共享
+    """
+    global _app_initialized
+    if _app_initialized:
+        return app
+    _app_initialized = True
+    
+    # 如果文件夹不存在，就创建它们
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(GENERATED_FOLDER, exist_ok=True)
+
+    # 上次运行中断的任务标记为失败，删除过期的任务记录
+    job_queue.recover()
+    
+    # 预热到各AI服务的keep-alive连接（可选）
+    if Config.HTTP_PREWARM:
+        http_pool.prewarm()
+
+    # 在后台定时检查各AI服务的状态（/api-status 直接读取结果）
+    if Config.HEALTH_CHECK_ENABLED:
+        health_checker.start()
+    return app
 
 def allowed_file(filename):
     """
@@ -42,6 +73,36 @@ def allowed_file(filename):
     """
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.before_request
+def start_request_timer():
+    """记录请求开始时间（用于运行指标）"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    记录请求的路由、状态码、耗时和收发字节数
+    路由使用URL规则（例如 /jobs/<job_id>），不会因为ID不同产生大量标签；
+    流式响应（/events 的SSE、/generate_batch 的NDJSON）在这里只是刚返回响应头，
+    等响应发送完、服务器关闭响应时再记录，耗时覆盖整个流
+    """
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+
+    labels = {
+        'route': request.url_rule.rule if request.url_rule else 'unmatched',
+        'method': request.method,
+        'status': response.status_code,
+        'request_bytes': request.content_length or 0,
+        'response_bytes': response.content_length,   # 流式响应没有 Content-Length，不计字节数
+    }
+    if response.is_streamed:
+        response.call_on_close(lambda: record_request(seconds=time.perf_counter() - started, **labels))
+    else:
+        record_request(seconds=time.perf_counter() - started, **labels)
+    return response
+
 # 网站首页路由 - 当用户访问网站时显示HTML页面
 @app.route('/')
 def index():
@@ -100,24 +161,20 @@ def process_document():
                 'error': f'不支持的文件格式: {file_extension}'
             })
         
-        # 保存上传的文件
-        filename = f"{uuid.uuid4().hex}_{file.filename}"
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # 保存上传的文件（相同内容只保存一份）
+        file_path = upload_store.save(file)
         
         print(f"📄 文档已保存到: {file_path}")
         
         # 处理文档
         print(f"🔍 开始处理文档: {file_path}")
-        analysis_result = document_processor.process_document(file_path)
+        try:
+            analysis_result = providers.get('document').process_document(file_path)
+        finally:
+            # 释放上传文件（没有其他请求在使用时会被删除）
+            upload_store.release(file_path)
         
         if analysis_result:
-            # 删除临时文件
-            try:
-                os.remove(file_path)
-            except:
-                pass
-            
             print(f"✅ 文档分析成功: {analysis_result[:100]}...")
             return jsonify({
                 'success': True,
@@ -125,12 +182,6 @@ def process_document():
                 'message': '文档分析完成'
             })
         else:
-            # 删除临时文件
-            try:
-                os.remove(file_path)
-            except:
-                pass
-            
             print(f"❌ 文档分析失败")
             return jsonify({
                 'success': False,
@@ -172,28 +223,20 @@ def analyze_image():
                 'error': '不支持的文件格式，请上传图片文件'
             })
         
-        # 保存临时文件
-        filename = f"temp_{uuid.uuid4().hex}_{file.filename}"
-        temp_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(temp_path)
+        # 保存上传的图片（相同内容只保存一份）
+        image_path = upload_store.save(file)
         
         try:
             # 使用文档处理器分析图片
-            description = document_processor.analyze_image(temp_path)
-            
-            # 删除临时文件
-            os.remove(temp_path)
-            
-            return jsonify({
-                'success': True,
-                'description': description
-            })
-            
-        except Exception as e:
-            # 确保删除临时文件
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            raise e
+            description = providers.get('document').analyze_image(image_path)
+        finally:
+            # 释放上传文件（没有其他请求在使用时会被删除）
+            upload_store.release(image_path)
+        
+        return jsonify({
+            'success': True,
+            'description': description
+        })
         
     except Exception as e:
         print(f"图片分析失败: {str(e)}")
@@ -219,11 +262,6 @@ def generate_image():
         if not style:
             style = 'realistic'  # 默认风格
         
-        # 使用智能提示词增强器优化用户输入
-        enhanced_prompt = prompt_enhancer.enhance_prompt(prompt, style)
-        print(f"📝 原始提示词: {prompt}")
-        print(f"🚀 增强后提示词: {enhanced_prompt}")
-        
         # 获取用户选择的AI模型（默认使用第一个）
         selected_model = request.form.get('model', 'auto')
         print(f"🤖 使用模型: {selected_model}")
@@ -237,21 +275,19 @@ def generate_image():
             file = request.files['reference_image']
             # 检查文件是否有效
             if file and file.filename and allowed_file(file.filename):
-                # 生成唯一的文件名，避免文件名冲突
-                filename = f"{uuid.uuid4().hex}_{file.filename}"
-                reference_image_path = os.path.join(UPLOAD_FOLDER, filename)
-                # 保存上传的图片
-                file.save(reference_image_path)
+                # 按内容保存上传的图片，同一张图片多次上传只保存一份
+                reference_image_path = upload_store.save(file)
                 print(f"参考图片已保存到: {reference_image_path}")
         
-        # 创建任务记录 - 记录用户的生成请求
+        # 创建任务记录 - 记录用户的生成请求，并作为任务队列中的持久化记录
         task_data = {
             'id': str(uuid.uuid4()),  # 生成唯一的任务ID
             'prompt': prompt,  # 用户的描述文字
             'style': style,  # 选择的风格
+            'model': selected_model,  # 选择的模型
             'reference_image': reference_image_path,  # 参考图片路径
             'timestamp': datetime.now().isoformat(),  # 创建时间
-            'status': 'processing'  # 任务状态
+            'status': 'queued'  # 任务状态
         }
         
         # 打印任务信息到控制台，方便查看
@@ -261,31 +297,24 @@ def generate_image():
         print(f"  模型: {get_model_name(selected_model)}")
         print(f"  参考图: {'有' if reference_image_path else '无'}")
         
-        # 根据用户选择的模型进行图片生成
-        generated_image_path = generate_with_selected_model(
-            prompt=enhanced_prompt,
-            style=style,
-            selected_model=selected_model,
-            reference_image_path=reference_image_path
-        )
-        
-        if not generated_image_path:
+        # 把任务放进后台队列，立即返回任务ID
+        try:
+            job = job_queue.submit(task_data, run_generation_job)
+        except QueueFullError as e:
+            upload_store.release(reference_image_path)
             return jsonify({
                 'success': False,
-                'error': '图片生成失败，请检查API设置或稍后重试'
-            })
-        
-        # 生成访问URL
-        filename = os.path.basename(generated_image_path)
-        generated_image_url = f'/generated/{filename}'
+                'error': str(e)
+            }), 503
         
-        # 返回成功结果给前端
         return jsonify({
             'success': True,
-            'task_id': task_data['id'],
-            'image_url': generated_image_url,
-            'message': '图片生成成功！'
-        })
+            'task_id': job['id'],
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/jobs/{job['id']}",
+            'message': '任务已提交，正在排队生成...'
+        }), 202
         
     except Exception as e:
         # 如果出现错误，返回错误信息
@@ -295,6 +324,208 @@ def generate_image():
             'error': f'生成过程中出现错误: {str(e)}'
         })
 
+def run_generation_job(job):
+    """
+    在后台线程中执行一个图片生成任务
+    
+    参数:
+    - job: 任务记录副本
+    
+    返回:
+    - 生成的图片路径，失败时返回None
+    """
+    # 使用智能提示词增强器优化用户输入
+    event_bus.report_stage('enhancing')
+    enhanced_prompt = providers.get('prompt_enhancer').enhance_prompt(job['prompt'], job['style'])
+    print(f"📝 原始提示词: {job['prompt']}")
+    print(f"🚀 增强后提示词: {enhanced_prompt}")
+    job_queue.update(job['id'], enhanced_prompt=enhanced_prompt)
+    event_bus.report_stage('calling_provider', model=job['model'])
+    
+    # 根据用户选择的模型进行图片生成，结束后释放参考图片
+    try:
+        return generate_with_selected_model(
+            prompt=enhanced_prompt,
+            style=job['style'],
+            selected_model=job['model'],
+            reference_image_path=job['reference_image']
+        )
+    finally:
+        upload_store.release(job['reference_image'])
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """
+    批量图片生成
+    接收一组 {prompt, style, model}，或者一个提示词加变体数量 count，
+    并行生成后以 NDJSON（每行一个JSON）的形式按完成顺序逐条返回结果
+    """
+    try:
+        items = batch_generator.build_items(request.get_json(silent=True))
+    except BatchValidationError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    print(f"收到批量图片生成任务: {len(items)} 张")
+    
+    def stream_results():
+        succeeded = 0
+        yield json.dumps({'event': 'accepted', 'total': len(items)}, ensure_ascii=False) + '\n'
+        for item, generated_image_path, error in batch_generator.run(items, run_batch_item):
+            result = {
+                'event': 'result',
+                'index': item['index'],
+                'variant': item['variant'],
+                'prompt': item['prompt'],
+                'style': item['style'],
+                'model': item['model'],
+                'success': bool(generated_image_path)
+            }
+            if generated_image_path:
+                succeeded += 1
+                result['image_url'] = f'/generated/{os.path.basename(generated_image_path)}'
+            else:
+                result['error'] = error or '图片生成失败，请检查API设置或稍后重试'
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+        yield json.dumps({'event': 'done', 'total': len(items), 'succeeded': succeeded}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_results(), mimetype='application/x-ndjson')
+
+def run_batch_item(item):
+    """
+    执行批量生成中的一项
+    
+    返回:
+    - 生成的图片路径，失败时返回None
+    """
+    enhanced_prompt = providers.get('prompt_enhancer').enhance_prompt(item['prompt'], item['style'])
+    return generate_with_selected_model(
+        prompt=enhanced_prompt,
+        style=item['style'],
+        selected_model=item['model'],
+        variant=item['variant']
+    )
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """
+    查询图片生成任务状态
+    状态: queued（排队中）/ running（生成中）/ done（完成）/ failed（失败）
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在或已过期'
+        }), 404
+    
+    response_data = {
+        'success': True,
+        'task_id': job['id'],
+        'job_id': job['id'],
+        'status': job['status'],
+        'stage': job.get('stage'),
+        'prompt': job.get('prompt'),
+        'style': job.get('style'),
+        'model': job.get('model'),
+        'timestamp': job.get('timestamp'),
+        'started_at': job.get('started_at'),
+        'finished_at': job.get('finished_at')
+    }
+    if job['status'] == 'done':
+        response_data['image_url'] = job.get('image_url')
+        response_data['message'] = '图片生成成功！'
+    elif job['status'] == 'failed':
+        response_data['error'] = job.get('error', '图片生成失败')
+    
+    return jsonify(response_data)
+
+def format_sse(message):
+    """把一条事件格式化为 Server-Sent Events 帧"""
+    data = json.dumps(message['data'], ensure_ascii=False)
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {data}\n\n"
+
+@app.route('/events/<event_id>')
+def stream_events(event_id):
+    """
+    以 Server-Sent Events 推送任务进度
+    event_id 可以是图片生成任务ID（推送 stage / status 事件），
+    也可以是视频任务ID（推送 video_status 事件），任务结束后服务器主动关闭连接
+    """
+    job = job_queue.get(event_id)
+    if job is None and not video_task_poller.is_tracking(event_id):
+        # 既不是图片生成任务，也不是正在跟踪的视频任务：直接查询一次ARK，确认任务存在才开始跟踪
+        result = video_task_poller.get_status(event_id)
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'error': '任务不存在'
+            }), 404
+    
+    subscriber = event_bus.subscribe(event_id)
+    
+    def final_status(job):
+        """根据任务记录构造最终状态事件"""
+        data = {'job_id': job['id'], 'status': job['status']}
+        for field in ('image_url', 'error'):
+            if job.get(field):
+                data[field] = job[field]
+        return format_sse({'id': 0, 'event': 'status', 'data': data})
+    
+    def final_video_status():
+        """视频任务已经结束时的最终状态事件，否则返回None"""
+        data = video_task_poller.final_event(event_id)
+        if data is None:
+            return None
+        return format_sse({'id': 0, 'event': 'video_status', 'data': data})
+    
+    def stream():
+        try:
+            if not event_bus.has_history(event_id):
+                # 任务早已结束（例如服务重启后，或事件频道已经清理），事件历史已经不在了，直接返回最终状态
+                if job and job['status'] in job_queue.FINISHED_STATUSES:
+                    yield final_status(job)
+                    return
+                if job is None:
+                    final = final_video_status()
+                    if final:
+                        yield final
+                        return
+            
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    message = subscriber.get(timeout=Config.EVENT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    if job:
+                        # 多进程部署时任务可能在其他工作进程中执行，事件不会推送到这里，
+                        # 每次心跳时顺便查一下任务记录（jobs/ 目录是共享的）
+                        latest = job_queue.get(event_id)
+                        if latest and latest['status'] in job_queue.FINISHED_STATUSES:
+                            yield final_status(latest)
+                            return
+                    else:
+                        # 视频任务的结束事件可能发布在订阅之前，心跳时查一下轮询器的结果
+                        final = final_video_status()
+                        if final:
+                            yield final
+                            return
+                    # 心跳注释，防止代理因空闲断开连接
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(message)
+                if message['final']:
+                    return
+        finally:
+            event_bus.unsubscribe(event_id, subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/generate_video', methods=['POST'])
 def generate_video():
     """
@@ -336,14 +567,14 @@ def generate_video():
             full_image_url = image_url
         
         # 获取视频风格配置
-        video_styles = video_generator.get_video_styles()
+        video_styles = providers.get('video').get_video_styles()
         style_config = video_styles.get(video_style, video_styles['cinematic'])
         
         # 构建完整提示词
         full_prompt = prompt + style_config['prompt_suffix']
         
         # 创建视频生成任务
-        result = video_generator.create_video_task(
+        result = providers.get('video').create_video_task(
             image_url=full_image_url,
             prompt=full_prompt,
             resolution=resolution,
@@ -351,6 +582,8 @@ def generate_video():
         )
         
         if result['success']:
+            # 交给后台轮询器跟踪任务状态
+            video_task_poller.track(result['task_id'])
             return jsonify({
                 'success': True,
                 'task_id': result['task_id'],
@@ -374,45 +607,11 @@ def generate_video():
 def check_video_task(task_id):
     """
     查询视频生成任务状态
+    状态由后台轮询器统一查询并缓存，这里直接读取缓存
     """
     try:
-        result = video_generator.check_task_status(task_id)
-        
-        if result['success']:
-            task_data = result['data']
-            status = result['status']
-            
-            response_data = {
-                'success': True,
-                'task_id': task_id,
-                'status': status,
-                'created_at': task_data.get('created_at'),
-                'updated_at': task_data.get('updated_at')
-            }
-            
-            # 如果任务完成，尝试获取视频URL
-            if status == 'completed':
-                # 这里需要根据实际API响应格式调整
-                video_url = task_data.get('video_url') or task_data.get('result', {}).get('video_url')
-                if video_url:
-                    response_data['video_url'] = video_url
-                    response_data['message'] = '视频生成完成！'
-                else:
-                    response_data['message'] = '视频生成完成，但无法获取下载链接'
-            elif status == 'running':
-                response_data['message'] = '视频正在生成中...'
-            elif status == 'failed':
-                response_data['message'] = '视频生成失败'
-                response_data['error'] = task_data.get('error_message', '未知错误')
-            else:
-                response_data['message'] = f'任务状态: {status}'
-            
-            return jsonify(response_data)
-        else:
-            return jsonify({
-                'success': False,
-                'error': result['error']
-            })
+        result = video_task_poller.get_status(task_id)
+        return jsonify(format_video_status(task_id, result))
     
     except Exception as e:
         print(f"查询视频任务状态错误: {str(e)}")
@@ -421,13 +620,55 @@ def check_video_task(task_id):
             'error': f'查询失败: {str(e)}'
         })
 
+def format_video_status(task_id, result):
+    """
+    把 check_task_status 格式的查询结果整理成前端需要的响应数据
+    （Flask接口和异步接口共用）
+    """
+    if not result['success']:
+        return {
+            'success': False,
+            'error': result['error']
+        }
+    
+    task_data = result['data']
+    status = result['status']
+    
+    response_data = {
+        'success': True,
+        'task_id': task_id,
+        'status': status,
+        'created_at': task_data.get('created_at'),
+        'updated_at': task_data.get('updated_at'),
+        'checked_at': result.get('checked_at')
+    }
+    
+    # 如果任务完成，尝试获取视频URL
+    if status == 'completed':
+        # 这里需要根据实际API响应格式调整
+        video_url = task_data.get('video_url') or task_data.get('result', {}).get('video_url')
+        if video_url:
+            response_data['video_url'] = video_url
+            response_data['message'] = '视频生成完成！'
+        else:
+            response_data['message'] = '视频生成完成，但无法获取下载链接'
+    elif status == 'running':
+        response_data['message'] = '视频正在生成中...'
+    elif status == 'failed':
+        response_data['message'] = '视频生成失败'
+        response_data['error'] = task_data.get('error_message', '未知错误')
+    else:
+        response_data['message'] = f'任务状态: {status}'
+    
+    return response_data
+
 @app.route('/video_styles')
 def get_video_styles():
     """
     获取可用的视频风格列表
     """
     try:
-        styles = video_generator.get_video_styles()
+        styles = providers.get('video').get_video_styles()
         return jsonify({
             'success': True,
             'styles': styles
@@ -471,103 +712,80 @@ def get_model_name(model_code):
     }
     return model_names.get(model_code, '未知模型')
 
-def generate_with_selected_model(prompt, style, selected_model, reference_image_path=None):
+def generate_with_selected_model(prompt, style, selected_model, reference_image_path=None, variant=0):
     """
     根据用户选择的模型生成图片
-    """
-    generated_image_path = None
-    
-    # 智能选择模式 - 根据风格和条件自动选择最佳模型
-    if selected_model == 'auto':
-        print("🧠 使用智能选择模式...")
-        
-        # 如果有参考图片，优先使用Segmind进行图片转换
-        if reference_image_path and os.path.exists(reference_image_path):
-            print("🎯 智能选择：检测到参考图片，使用Segmind进行图片转换...")
-            generated_image_path = segmind_generator.generate_image(
-                prompt=prompt,
-                style=style, 
-                reference_image_path=reference_image_path
-            )
-            
-            # 如果Segmind成功，直接返回结果
-            if generated_image_path:
-                return generated_image_path
-            else:
-                print("⚠️ Segmind生成失败，尝试其他模型...")
-        
-        # 如果没有参考图或Segmind失败，使用Google Gemini
-        print("🤖 智能选择：使用Google Gemini AI图片生成...")
-        generated_image_path = gemini_generator.generate_image(
-            prompt=prompt,
-            style=style, 
-            reference_image_path=reference_image_path
-        )
-        
-        # 如果Gemini也失败，回退到原有生成器
-        if not generated_image_path:
-            print("⚠️ 智能选择：Gemini生成失败，使用备用生成器...")
-            generated_image_path = ai_generator.generate_image(
-                prompt=enhanced_prompt,
-                style=style, 
-                reference_image_path=reference_image_path
-            )
-    
-    # 用户指定使用Segmind模型
-    elif selected_model == 'segmind':
-        print("🎯 用户指定：使用Segmind模型...")
-        if not reference_image_path:
-            print("⚠️ Segmind需要参考图片，自动回退到其他模型...")
-            generated_image_path = gemini_generator.generate_image(
-                prompt=prompt,
-                style=style, 
-                reference_image_path=reference_image_path
-            )
-        else:
-            generated_image_path = segmind_generator.generate_image(
-                prompt=prompt,
-                style=style, 
-                reference_image_path=reference_image_path
-            )
-    
-    # 用户指定使用GPT Image 1模型
-    elif selected_model == 'gpt_image1':
-        print("🚀 用户指定：使用GPT Image 1模型...")
-        generated_image_path = gpt_image1_generator.generate_image(
-            prompt=prompt,
-            style=style, 
-            reference_image_path=reference_image_path
-        )
+    相同的请求优先从结果缓存中返回已生成的图片，variant 用来区分批量生成中的不同变体
+    """
+    cache_key = None
+    if Config.RESULT_CACHE_ENABLED:
+        cache_key = result_cache.make_key(prompt, style, selected_model, reference_image_path, variant)
+        cached_image_path = result_cache.get(cache_key)
+        if cached_image_path:
+            print(f"♻️ 命中生成结果缓存: {cached_image_path}")
+            return cached_image_path
     
-    # 用户指定使用Gemini模型
-    elif selected_model == 'gemini':
-        print("🤖 用户指定：使用Google Gemini模型...")
-        generated_image_path = gemini_generator.generate_image(
-            prompt=prompt,
-            style=style, 
-            reference_image_path=reference_image_path
-        )
+    generated_image_path = dispatch_to_model(prompt, style, selected_model, reference_image_path)
     
-    # 用户指定使用OpenRouter模型
-    elif selected_model == 'openrouter':
-        print("🚀 用户指定：使用OpenRouter模型...")
-        generated_image_path = ai_generator.generate_image(
-            prompt=prompt,
-            style=style, 
-            reference_image_path=reference_image_path
-        )
+    if cache_key and generated_image_path:
+        result_cache.put(cache_key, generated_image_path)
     
-    # 用户指定使用备用生成器
-    elif selected_model == 'fallback':
-        print("🎨 用户指定：使用备用生成器...")
-        from fallback_generator import FallbackImageGenerator
-        fallback = FallbackImageGenerator()
-        generated_image_path = fallback.generate_image(
-            prompt=prompt,
-            style=style, 
-            reference_image_path=reference_image_path
+    return generated_image_path
+
+def dispatch_to_model(prompt, style, selected_model, reference_image_path=None):
+    """
+    把生成请求分发给用户选择的模型
+    要调用的服务和顺序由 model_router 决定：先尝试上游服务（智能选择模式下对冲执行），
+    全部失败后才使用本地生成器
+    """
+    has_reference = bool(reference_image_path and os.path.exists(reference_image_path))
+    upstream, local = model_router.route(selected_model, has_reference)
+
+    if selected_model == 'auto':
+        print("🧠 使用智能选择模式...")
+        if has_reference:
+            print("🎯 智能选择：检测到参考图片，优先使用Segmind进行图片转换...")
+    else:
+        print(f"🎯 用户指定：使用{get_model_name(selected_model)}...")
+
+    def generate(name):
+        try:
+            # 每个服务有自己的并发上限（对冲执行的每个候选各自占用名额）
+            with model_router.provider_limiter.get(name):
+                result = providers.get(name).generate_image(
+                    prompt=prompt,
+                    style=style,
+                    reference_image_path=reference_image_path
+                )
+        except Exception as e:
+            print(f"❌ {get_model_name(name)} 生成出错: {str(e)}")
+            return None
+        return model_router.upstream_result(name, result) if name in upstream else result
+
+    generated_image_path = None
+    if model_router.should_race(selected_model, upstream):
+        # 对冲执行：首选模型迟迟没有结果时并行启动下一个上游模型，谁先成功用谁，落选的图片删除
+        winner, generated_image_path = race_providers(
+            [(name, partial(generate, name)) for name in upstream],
+            on_discard=model_router.discard_image
         )
-    
+        if winner:
+            print(f"✅ 智能选择：使用 {get_model_name(winner)} 的结果")
+    else:
+        for name in upstream:
+            generated_image_path = generate(name)
+            if generated_image_path:
+                break
+            print(f"⚠️ {get_model_name(name)} 生成失败，尝试其他模型...")
+
+    # 上游服务都失败后才使用本地生成器
+    for name in local:
+        if generated_image_path:
+            break
+        if upstream:
+            print(f"⚠️ 上游模型都没有成功，使用{get_model_name(name)}...")
+        generated_image_path = generate(name)
+
     return generated_image_path
 
 def simulate_image_generation(task_data):
@@ -641,10 +859,10 @@ def enhance_prompt():
             }), 400
         
         # 使用智能提示词增强器
-        enhanced_prompt = prompt_enhancer.enhance_prompt(user_input, style)
+        enhanced_prompt = providers.get('prompt_enhancer').enhance_prompt(user_input, style)
         
         # 生成建议
-        suggestions = prompt_enhancer.get_prompt_suggestions(user_input)
+        suggestions = providers.get('prompt_enhancer').get_prompt_suggestions(user_input)
         
         return jsonify({
             'success': True,
@@ -673,73 +891,99 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+# 存活检查接口 - 只要进程能处理请求就返回200
+@app.route('/livez')
+def livez():
+    """
+    存活检查（供负载均衡/容器编排使用）
+    不访问任何外部服务
+    """
+    return jsonify({'status': 'alive'})
+
+# 就绪检查接口 - 应用已初始化且任务队列还能接收任务时返回200
+@app.route('/readyz')
+def readyz():
+    """
+    就绪检查
+    应用尚未初始化或任务队列已满时返回503，负载均衡可以暂时不把请求转发过来
+    """
+    reasons = []
+    if not _app_initialized:
+        reasons.append('应用尚未初始化')
+
+    queue_stats = job_queue.stats()
+    if queue_stats['active'] >= queue_stats['capacity']:
+        reasons.append('任务队列已满')
+
+    return jsonify({
+        'status': 'not_ready' if reasons else 'ready',
+        'reasons': reasons,
+        'job_queue': queue_stats
+    }), 503 if reasons else 200
+
+# 运行指标接口 - 供Prometheus抓取
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    输出运行指标（Prometheus文本格式）
+    包括各路由的请求量和耗时、各AI服务的调用结果和耗时、上游收发字节数、文件保存统计
+    """
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# 各服务的API密钥配置项
+API_KEY_SETTINGS = {
+    'gemini': 'GEMINI_API_KEY',
+    'segmind': 'SEGMIND_API_KEY',
+    'gpt_image1': 'GPT_IMAGE1_API_KEY',
+    'openrouter': 'OPENROUTER_API_KEY',
+    'doubao_document': 'DOUBAO_DOCUMENT_API_KEY',
+    'bytedance': 'ARK_API_KEY',
+}
+
 # API状态检查接口
 @app.route('/api-status')
 def api_status():
     """
     检查AI API是否配置正确
-    包括Gemini图像生成和ByteDance视频生成
+    各服务的状态由后台健康检查定时刷新，这里直接返回最近一次的结果（不会在请求中访问上游）
     """
     try:
-        # 检查Gemini API状态
-        gemini_status = gemini_generator.test_connection()
-        
-        # 检查ByteDance API状态
-        ark_token_valid = Config.validate_token()
-        
-        # 检查Segmind API状态
-        segmind_status = segmind_generator.test_connection()
-        
-        # 检查GPT Image 1 API状态
-        gpt_image1_status = gpt_image1_generator.test_connection()
-        
-        # 检查豆包文档理解API状态
-        doubao_document_status = document_processor.test_connection()
-        
-        # 检查Gemini API密钥
-        gemini_key_set = bool(getattr(Config, 'GEMINI_API_KEY', ''))
-        
-        # 检查Segmind API密钥
-        segmind_key_set = bool(getattr(Config, 'SEGMIND_API_KEY', ''))
-        
-        # 检查GPT Image 1 API密钥
-        gpt_image1_key_set = bool(getattr(Config, 'GPT_IMAGE1_API_KEY', ''))
-        
-        # 检查豆包文档理解API密钥
-        doubao_document_key_set = bool(getattr(Config, 'DOUBAO_DOCUMENT_API_KEY', ''))
-        
+        if not health_checker.is_running():
+            # 没有启动后台检查时，在请求中执行已到期的检查（结果同样按间隔缓存）
+            health_checker.run_due()
+
+        status = {}
+        any_ready = False
+        for name, check in health_checker.snapshot().items():
+            result = check['result']
+            if result is None:
+                # 第一次检查还没有完成
+                status[name] = {
+                    'configured': False,
+                    'api_key_set': bool(getattr(Config, API_KEY_SETTINGS.get(name, ''), '')),
+                    'status': 'PENDING',
+                    'message': '正在检查...',
+                    'checked_at': None,
+                    'latency_ms': None,
+                    'stale': False
+                }
+                continue
+
+            any_ready = any_ready or result['success']
+            status[name] = {
+                'configured': result['success'],
+                'api_key_set': bool(getattr(Config, API_KEY_SETTINGS.get(name, ''), '')),
+                'status': 'OK' if result['success'] else 'ERROR',
+                'message': result['message'],
+                'checked_at': result['checked_at'],
+                'latency_ms': result['latency_ms'],
+                'stale': result['stale']
+            }
+
         return jsonify({
-            'gemini': {
-                'configured': gemini_status['success'],
-                'api_key_set': gemini_key_set,
-                'status': 'OK' if gemini_status['success'] else 'ERROR',
-                'message': gemini_status.get('message', gemini_status.get('error', ''))
-            },
-            'segmind': {
-                'configured': segmind_status['success'],
-                'api_key_set': segmind_key_set,
-                'status': 'OK' if segmind_status['success'] else 'ERROR',
-                'message': segmind_status.get('message', segmind_status.get('error', ''))
-            },
-            'gpt_image1': {
-                'configured': gpt_image1_status['success'],
-                'api_key_set': gpt_image1_key_set,
-                'status': 'OK' if gpt_image1_status['success'] else 'ERROR',
-                'message': gpt_image1_status.get('message', gpt_image1_status.get('error', ''))
-            },
-            'doubao_document': {
-                'configured': doubao_document_status['success'],
-                'api_key_set': doubao_document_key_set,
-                'status': 'OK' if doubao_document_status['success'] else 'ERROR',
-                'message': doubao_document_status.get('message', doubao_document_status.get('error', ''))
-            },
-            'bytedance': {
-                'configured': ark_token_valid,
-                'api_key_set': ark_token_valid,
-                'status': 'OK' if ark_token_valid else 'ERROR',
-                'message': 'ByteDance ARK API已配置' if ark_token_valid else '需要设置ByteDance API密钥'
-            },
-            'overall_status': 'ready' if (gemini_status['success'] or segmind_status['success'] or gpt_image1_status['success'] or ark_token_valid) else 'fallback',
+            **status,
+            'circuit_breakers': circuit_breakers.snapshot(),
+            'overall_status': 'ready' if any_ready else 'fallback',
             'message': '所有功能正常运行，智能回退机制确保服务可用',
             'timestamp': datetime.now().isoformat()
         })
@@ -758,12 +1002,13 @@ if __name__ == '__main__':
     print("="*50)
     print("🎨 AI智能制图工作室 启动中...")
     print("="*50)
-    print("📱 打开浏览器访问: http://localhost:4000")
+    print(f"📱 打开浏览器访问: http://localhost:{Config.SERVER_PORT}")
     print("🛠️  按 Ctrl+C 停止服务器")
+    print("🚀 生产环境请使用: python serve.py")
     print("="*50)
     
     # 启动Flask开发服务器
-    # debug=True 表示开启调试模式，代码修改后会自动重启
+    # debug 由 FLASK_DEBUG 控制（默认开启，代码修改后会自动重启）
     # host='0.0.0.0' 表示允许所有IP地址访问
-    # port=4000 表示使用4000端口（避免VS Code Live Preview冲突）
-    app.run(debug=True, host='0.0.0.0', port=4000)
+    # 默认使用4000端口（避免VS Code Live Preview冲突）
+    create_app().run(debug=Config.DEBUG, host=Config.SERVER_HOST, port=Config.SERVER_PORT)
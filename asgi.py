@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ASGI入口
+/async/* 接口使用异步生成器：等待AI服务响应时不占用线程，一个进程可以同时挂起大量生成请求；
+其余所有请求原样交给Flask应用（在线程池中执行）。启动方法:
+    uvicorn asgi:app --host 0.0.0.0 --port 4000
+或者:
+    SERVER_BACKEND=uvicorn python serve.py
+"""
+
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route, Mount
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+from config import Config
+from provider_registry import providers
+from app import create_app, allowed_file, get_model_name, format_video_status
+from async_http import async_http_pool
+from metrics import record_request, content_length
+from async_generators import async_video_generator, generate_with_selected_model_async
+from upload_store import upload_store
+from video_task_poller import video_task_poller
+
+flask_app = create_app()
+
+# 正在进行的异步生成请求数（只在事件循环线程中修改，不需要加锁）
+_inflight = 0
+
+
+def _too_busy():
+    """同时进行的生成请求已达上限"""
+    return JSONResponse({
+        'success': False,
+        'error': f'同时进行的生成任务已达上限（{Config.ASYNC_MAX_INFLIGHT}），请稍后再试'
+    }, status_code=503)
+
+
+def instrumented(route):
+    """装饰器：记录异步接口的请求指标（挂载的Flask应用在 after_request 中自己记录）"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            status, response_bytes = 500, None
+            try:
+                response = await handler(request)
+                status, response_bytes = response.status_code, len(response.body)
+                return response
+            finally:
+                record_request(
+                    route, request.method, status, time.perf_counter() - started,
+                    request_bytes=content_length(request.headers),
+                    response_bytes=response_bytes
+                )
+        return wrapper
+    return decorator
+
+
+@instrumented('/async/generate')
+async def generate_image(request):
+    """
+    异步图片生成：参数与 /generate 相同（表单或JSON），等待生成完成后直接返回图片地址
+    """
+    global _inflight
+    if _inflight >= Config.ASYNC_MAX_INFLIGHT:
+        return _too_busy()
+
+    _inflight += 1
+    reference_image_path = None
+    try:
+        if request.headers.get('content-type', '').startswith('application/json'):
+            form = await request.json()
+        else:
+            form = await request.form()
+
+        prompt = (form.get('prompt') or '').strip() or '随机创作，创意无限'
+        style = form.get('style') or 'realistic'
+        selected_model = form.get('model') or 'auto'
+
+        upload = form.get('reference_image')
+        if upload is not None and getattr(upload, 'filename', None) and allowed_file(upload.filename):
+            reference_image_path = await asyncio.to_thread(upload_store.save, upload.file, upload.filename)
+
+        print(f"收到异步图片生成请求: {prompt}（{get_model_name(selected_model)}）")
+        enhanced_prompt = providers.get('prompt_enhancer').enhance_prompt(prompt, style)
+
+        generated_image_path = await generate_with_selected_model_async(
+            enhanced_prompt, style, selected_model, reference_image_path
+        )
+        if not generated_image_path:
+            return JSONResponse({
+                'success': False,
+                'error': '图片生成失败，请检查API设置或稍后重试'
+            })
+
+        return JSONResponse({
+            'success': True,
+            'image_url': f'/generated/{os.path.basename(generated_image_path)}',
+            'prompt': prompt,
+            'enhanced_prompt': enhanced_prompt,
+            'style': style,
+            'model': selected_model
+        })
+
+    except Exception as e:
+        print(f"异步图片生成过程中出现错误: {str(e)}")
+        return JSONResponse({
+            'success': False,
+            'error': f'生成过程中出现错误: {str(e)}'
+        })
+    finally:
+        _inflight -= 1
+        if reference_image_path:
+            upload_store.release(reference_image_path)
+
+
+@instrumented('/async/generate_video')
+async def generate_video(request):
+    """异步创建图生视频任务：参数与 /generate_video 相同"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or not data.get('image_url'):
+        return JSONResponse({
+            'success': False,
+            'error': '请提供图片URL'
+        })
+
+    image_url = data['image_url']
+    duration = data.get('duration', Config.DEFAULT_VIDEO_DURATION)
+
+    # 构建完整的图片URL（如果是相对路径）
+    if image_url.startswith('/'):
+        image_url = str(request.base_url).rstrip('/') + image_url
+
+    video_styles = async_video_generator.get_video_styles()
+    style_config = video_styles.get(data.get('video_style', 'cinematic'), video_styles['cinematic'])
+
+    result = await async_video_generator.create_video_task(
+        image_url=image_url,
+        prompt=data.get('prompt', '生成动态视频') + style_config['prompt_suffix'],
+        resolution=data.get('resolution', Config.DEFAULT_VIDEO_RESOLUTION),
+        duration=duration
+    )
+    if not result['success']:
+        return JSONResponse({
+            'success': False,
+            'error': result['error']
+        })
+
+    # 交给后台轮询器跟踪任务状态（/events 和 /check_video_task 都从这里读取）
+    video_task_poller.track(result['task_id'])
+    return JSONResponse({
+        'success': True,
+        'task_id': result['task_id'],
+        'message': result['message'],
+        'estimated_time': f'{duration * 2}-{duration * 3}分钟'
+    })
+
+
+@instrumented('/async/check_video_task/{task_id}')
+async def check_video_task(request):
+    """
+    异步查询视频任务状态
+    后台轮询器正在跟踪的任务直接读缓存，否则异步查询一次ARK，查询成功才交给轮询器跟踪
+    """
+    task_id = request.path_params['task_id']
+    if video_task_poller.is_tracking(task_id):
+        result = await asyncio.to_thread(video_task_poller.get_status, task_id)
+    else:
+        result = await async_video_generator.check_task_status(task_id)
+        video_task_poller.adopt(task_id, result)
+    return JSONResponse(format_video_status(task_id, result))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """启动时设置本地处理用的线程池，关闭时释放所有异步连接"""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=Config.ASYNC_OFFLOAD_THREADS, thread_name_prefix='async-offload')
+    loop.set_default_executor(executor)
+    try:
+        yield
+    finally:
+        await async_http_pool.aclose()
+        executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/async/generate', generate_image, methods=['POST']),
+        Route('/async/generate_video', generate_video, methods=['POST']),
+        Route('/async/check_video_task/{task_id}', check_video_task),
+        # 其他请求交给原来的Flask应用
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+异步图片/视频生成器
+与同步生成器提供相同的接口（async generate_image / create_video_task / check_task_status），
+请求参数构建、响应解析和图片保存直接复用同步生成器的实现；
+等待AI服务响应时不占用线程，预处理参考图片、保存图片等本地操作放到线程池中执行
+"""
+
+import os
+import asyncio
+from functools import partial
+
+import httpx
+
+from config import Config
+from async_http import async_http_pool
+from event_bus import event_bus
+from reference_normalizer import reference_normalizer
+from result_cache import result_cache
+from provider_race import race_providers_async
+from provider_registry import providers
+import model_router
+from metrics import instrument_provider
+from image_utils import save_image_chunks
+
+
+def _iterate_in_thread(async_chunks, loop, timeout):
+    """
+    在线程池中逐块取出异步迭代器的数据：每一块都回到事件循环读取，
+    写文件的线程和下载的协程之间最多只有一个数据块在内存中
+    """
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(async_chunks.__anext__(), loop).result(timeout)
+        except StopAsyncIteration:
+            return
+
+
+async def _save_in_thread(provider, func, *args):
+    """
+    在线程池中保存生成的图片
+    线程一旦开始写文件就无法中止：保存过程中协程被取消（对冲落选、客户端断开）时，
+    等线程写完后删除写出的图片，不在 generated/ 中留下没人引用的文件
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        def _discard(done):
+            if not done.cancelled() and done.exception() is None:
+                model_router.discard_image(provider, done.result())
+        future.add_done_callback(_discard)
+        raise
+
+
+def _read_file(path):
+    """读取整个文件"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class AsyncProvider:
+    """异步包装的基类：对应的同步生成器在第一次使用时从注册表获取"""
+
+    provider = None
+
+    def __init__(self, generator=None, provider=None):
+        self._generator = generator
+        self.provider = provider or self.provider
+
+    @property
+    def generator(self):
+        """对应的同步生成器"""
+        return self._generator or providers.get(self.provider)
+
+
+class AsyncSegmindGenerator(AsyncProvider):
+    """Segmind图片转换（异步）"""
+
+    provider = 'segmind'
+
+    @instrument_provider('segmind', 'generate_image')
+    async def generate_image(self, prompt, style=None, reference_image_path=None):
+        """生成图像，参数和返回值与 SegmindImageGenerator.generate_image 相同"""
+        sync = self.generator
+        print(f"🎨 开始使用Segmind生成图片（异步）...")
+
+        try:
+            if not sync.api_key or not sync.api_key.startswith('SG_'):
+                print("⚠️ Segmind API密钥未配置")
+                return None
+            if not reference_image_path or not os.path.exists(reference_image_path):
+                print("⚠️ Segmind需要输入图片才能工作")
+                return None
+
+            full_prompt = sync._build_segmind_prompt(prompt, style)
+            # httpx会把值为None的表单字段发送成空字符串，requests则直接跳过，这里保持requests的行为
+            data = {key: value for key, value in sync._build_request_data(full_prompt).items() if value is not None}
+
+            event_bus.report_stage('uploading_reference', provider='segmind')
+            reference_image_path = await asyncio.to_thread(reference_normalizer.normalize, reference_image_path, 'segmind')
+            image_bytes = await asyncio.to_thread(_read_file, reference_image_path)
+
+            event_bus.report_stage('calling_provider', provider='segmind')
+            response = await async_http_pool.post(
+                sync.base_url,
+                data=data,
+                files={'input_image': (os.path.basename(reference_image_path), image_bytes)},
+                headers={'x-api-key': sync.api_key},
+                timeout=120,
+                provider='segmind'
+            )
+
+            print(f"📊 API响应状态: {response.status_code}")
+            if response.status_code != 200:
+                print(f"❌ Segmind API调用失败: API错误 {response.status_code}: {response.text}")
+                return None
+            if not response.content:
+                print(f"⚠️ API响应中没有图片数据")
+                return None
+
+            event_bus.report_stage('saving', provider='segmind')
+            return await _save_in_thread('segmind', sync._save_generated_image, response.content, prompt, style)
+
+        except Exception as e:
+            print(f"❌ Segmind图像生成失败: {e}")
+            return None
+
+
+class AsyncGPTImage1Generator(AsyncProvider):
+    """GPT Image 1图片生成（异步）"""
+
+    provider = 'gpt_image1'
+
+    @instrument_provider('gpt_image1', 'generate_image')
+    async def generate_image(self, prompt, style=None, reference_image_path=None):
+        """生成图像，参数和返回值与 GPTImage1Generator.generate_image 相同"""
+        sync = self.generator
+        print(f"🎨 使用GPT Image 1生成图片（异步）...")
+
+        try:
+            # 参考图片的预处理和base64编码在线程池中完成
+            data = await asyncio.to_thread(sync._build_request_data, prompt, style, reference_image_path)
+
+            event_bus.report_stage('calling_provider', provider='gpt_image1')
+            response = await async_http_pool.post(
+                sync.base_url,
+                json=data,
+                headers=sync._headers(),
+                timeout=sync.timeout,
+                provider='gpt_image1'
+            )
+
+            if response.status_code != 200:
+                print(f"❌ GPT Image 1 API调用失败: {response.status_code}")
+                print(f"   错误信息: {response.text}")
+                return None
+
+            event_bus.report_stage('saving', provider='gpt_image1')
+            return await _save_in_thread('gpt_image1', sync._save_generated_image, response.content)
+
+        except httpx.TimeoutException:
+            print("⏰ GPT Image 1 API请求超时")
+            return None
+        except httpx.HTTPError as e:
+            print(f"🌐 GPT Image 1 API网络错误: {str(e)}")
+            return None
+        except Exception as e:
+            print(f"💥 GPT Image 1生成过程中出现错误: {str(e)}")
+            return None
+
+
+class AsyncOpenRouterGenerator(AsyncProvider):
+    """OpenRouter图片生成（异步）；失败时使用示例图片由 model_router 的路由表负责"""
+
+    provider = 'openrouter'
+
+    async def generate_image(self, prompt, style=None, reference_image_path=None):
+        """生成图像，参数和返回值与 OpenRouterImageGenerator.generate_image 相同"""
+        return await self._generate_with_openrouter(prompt, style, reference_image_path)
+
+    @instrument_provider('openrouter', 'generate_image')
+    async def _generate_with_openrouter(self, prompt, style, reference_image_path):
+        """调用OpenRouter API"""
+        sync = self.generator
+        print(f"🎨 开始使用OpenRouter生成图片（异步）...")
+
+        try:
+            if not sync.api_key or not sync.api_key.startswith('sk-or-v1-'):
+                print("⚠️ OpenRouter API密钥未配置，使用备用方案")
+                return None
+
+            url, headers, data = await asyncio.to_thread(sync._build_request, prompt, style, reference_image_path)
+
+            event_bus.report_stage('calling_provider', provider='openrouter')
+            response = await async_http_pool.post(url, headers=headers, json=data, timeout=60, provider='openrouter')
+
+            print(f"📊 API响应状态: {response.status_code}")
+            if response.status_code != 200:
+                print(f"❌ OpenRouter API调用失败: API错误 {response.status_code}: {response.text}")
+                return None
+
+            event_bus.report_stage('saving', provider='openrouter')
+            image = sync._find_image(response.json())
+            if not image:
+                return None
+
+            kind, image_url = image
+            if kind == 'base64':
+                return await _save_in_thread('openrouter', sync._save_base64_image, image_url, prompt, style)
+
+            print(f"📥 下载图像: {image_url}")
+            async with async_http_pool.stream('GET', image_url, timeout=30) as image_response:
+                if image_response.status_code != 200:
+                    print(f"❌ 下载图像失败: {image_response.status_code}")
+                    return None
+                # 边下载边写入磁盘（和同步版本的 stream_image_to_file 一样），不在内存中保留完整图片
+                chunks = _iterate_in_thread(image_response.aiter_bytes(), asyncio.get_running_loop(), 30)
+                filepath = await _save_in_thread('openrouter', save_image_chunks, chunks, sync._generated_base_path(prompt))
+            print(f"💾 图片已保存到: {filepath}")
+            return filepath
+
+        except Exception as e:
+            print(f"❌ OpenRouter API调用出错: {e}")
+            return None
+
+
+class AsyncLocalGenerator(AsyncProvider):
+    """本地生成器（Gemini模拟、示例图片）的异步包装：在线程池中执行"""
+
+    async def generate_image(self, prompt, style=None, reference_image_path=None):
+        """生成图像（第一次使用时连同生成器的创建一起放到线程池中）"""
+        return await asyncio.to_thread(lambda: self.generator.generate_image(prompt, style, reference_image_path))
+
+
+class AsyncVideoGenerator(AsyncProvider):
+    """ARK图生视频（异步）"""
+
+    provider = 'video'
+
+    def get_video_styles(self):
+        """可用的视频风格"""
+        return self.generator.get_video_styles()
+
+    @instrument_provider('ark', 'create_video_task')
+    async def create_video_task(self, image_url, prompt, **kwargs):
+        """创建图生视频任务，参数和返回值与 AIVideoGenerator.create_video_task 相同"""
+        sync = self.generator
+        data = sync._build_task_payload(image_url, prompt, **kwargs)
+
+        try:
+            print(f"📡 发送视频生成请求（异步）...")
+            response = await async_http_pool.post(sync.base_url, headers=sync._headers(), json=data, timeout=30, provider='ark')
+            return sync._parse_create_response(response)
+
+        except Exception as e:
+            error_msg = f"请求失败: {str(e)}"
+            print(f"❌ 视频任务创建出错: {error_msg}")
+            return {
+                'success': False,
+                'error': error_msg
+            }
+
+    @instrument_provider('ark', 'check_task_status')
+    async def check_task_status(self, task_id):
+        """查询视频生成任务状态，参数和返回值与 AIVideoGenerator.check_task_status 相同"""
+        sync = self.generator
+
+        try:
+            print(f"🔍 查询任务状态: {task_id}")
+            response = await async_http_pool.get(f"{sync.base_url}/{task_id}", headers=sync._headers(), timeout=30, provider='ark')
+            return sync._parse_status_response(response)
+
+        except Exception as e:
+            error_msg = f"查询出错: {str(e)}"
+            print(f"❌ {error_msg}")
+            return {
+                'success': False,
+                'error': error_msg
+            }
+
+
+# 全局实例
+async_segmind_generator = AsyncSegmindGenerator()
+async_gpt_image1_generator = AsyncGPTImage1Generator()
+async_openrouter_generator = AsyncOpenRouterGenerator()
+async_gemini_generator = AsyncLocalGenerator(provider='gemini')
+async_fallback_generator = AsyncLocalGenerator(provider='fallback')
+async_video_generator = AsyncVideoGenerator()
+
+
+# 服务名称（model_router 路由表中的名称） -> 异步生成器
+ASYNC_GENERATORS = {
+    'segmind': async_segmind_generator,
+    'gpt_image1': async_gpt_image1_generator,
+    'openrouter': async_openrouter_generator,
+    'gemini': async_gemini_generator,
+    'fallback': async_fallback_generator,
+}
+
+
+async def dispatch_to_model_async(prompt, style, selected_model, reference_image_path=None):
+    """
+    app.dispatch_to_model 的异步版本：按 model_router 的路由表生成图片
+    """
+    has_reference = bool(reference_image_path and os.path.exists(reference_image_path))
+    upstream, local = model_router.route(selected_model, has_reference)
+
+    async def generate(name):
+        try:
+            result = await ASYNC_GENERATORS[name].generate_image(prompt, style, reference_image_path)
+        except Exception as e:
+            print(f"❌ {name} 生成出错: {str(e)}")
+            return None
+        return model_router.upstream_result(name, result) if name in upstream else result
+
+    generated_image_path = None
+    if model_router.should_race(selected_model, upstream):
+        winner, generated_image_path = await race_providers_async(
+            [(name, partial(generate, name)) for name in upstream],
+            on_discard=model_router.discard_image
+        )
+    else:
+        for name in upstream:
+            generated_image_path = await generate(name)
+            if generated_image_path:
+                break
+
+    # 上游服务都失败后才使用本地生成器
+    for name in local:
+        if generated_image_path:
+            break
+        generated_image_path = await generate(name)
+
+    return generated_image_path
+
+
+async def generate_with_selected_model_async(prompt, style, selected_model, reference_image_path=None):
+    """
+    app.generate_with_selected_model 的异步版本：相同的请求优先从结果缓存中返回
+    """
+    cache_key = None
+    if Config.RESULT_CACHE_ENABLED:
+        # 计算缓存键需要读取参考图片的哈希，放到线程池中执行
+        cache_key = await asyncio.to_thread(result_cache.make_key, prompt, style, selected_model, reference_image_path)
+        cached_image_path = result_cache.get(cache_key)
+        if cached_image_path:
+            print(f"♻️ 命中生成结果缓存: {cached_image_path}")
+            return cached_image_path
+
+    generated_image_path = await dispatch_to_model_async(prompt, style, selected_model, reference_image_path)
+
+    if cache_key and generated_image_path:
+        result_cache.put(cache_key, generated_image_path)
+
+    return generated_image_path
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+异步HTTP连接池
+ASGI接口（asgi.py）中的AI服务调用通过这里发送，等待上游响应时不占用线程，
+一个进程可以同时挂起成千上万个生成请求；
+与 http_client.http_pool 一样按域名复用连接，并经过同一组熔断器
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import Config
+import fork_safety
+from circuit_breaker import circuit_breakers, CircuitOpenError
+from metrics import record_upstream, content_length
+
+
+class AsyncHTTPClientPool:
+    """
+    按域名划分的异步客户端池
+    每个域名一个 httpx.AsyncClient；客户端属于创建它的事件循环，应用关闭时调用 aclose
+    """
+
+    def __init__(self, max_connections=None, max_keepalive=None):
+        """初始化客户端池（客户端在第一次访问对应域名时创建）"""
+        self.max_connections = max_connections or Config.ASYNC_HTTP_MAX_CONNECTIONS
+        self.max_keepalive = max_keepalive or Config.ASYNC_HTTP_MAX_KEEPALIVE
+        self._clients = {}
+        self._lock = asyncio.Lock()
+
+    def _create_client(self, host):
+        """为指定域名创建异步客户端"""
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=min(self.max_keepalive, self.max_connections),
+            keepalive_expiry=Config.ASYNC_HTTP_KEEPALIVE_EXPIRY
+        )
+        # 连接池排队等待的时间也算在超时里，上游很慢时排队的请求会以超时失败
+        return httpx.AsyncClient(limits=limits, follow_redirects=True)
+
+    async def get_client(self, url):
+        """获取URL所属域名的共享客户端"""
+        host = urlsplit(url).netloc.lower()
+        client = self._clients.get(host)
+        if client is not None:
+            return client
+
+        async with self._lock:
+            client = self._clients.get(host)
+            if client is None:
+                client = self._create_client(host)
+                self._clients[host] = client
+            return client
+
+    async def request(self, method, url, provider=None, **kwargs):
+        """
+        发送异步请求，参数与 httpx.AsyncClient.request 相同
+
+        指定 provider 时会经过该服务的熔断器：熔断期间直接抛出 CircuitOpenError，
+        否则根据请求结果（超时、网络错误、5xx/429）更新熔断器统计；
+        每个请求的状态、耗时和收发字节数都会记录到运行指标（对冲落选被取消的请求记为 CancelledError）
+        """
+        started = time.perf_counter()
+        try:
+            response = await self._send(method, url, provider, **kwargs)
+        except BaseException as e:
+            record_upstream(provider, method, type(e).__name__, time.perf_counter() - started)
+            raise
+
+        record_upstream(
+            provider, method, response.status_code, time.perf_counter() - started,
+            sent_bytes=content_length(response.request.headers),
+            received_bytes=len(response.content)
+        )
+        return response
+
+    async def _send(self, method, url, provider=None, **kwargs):
+        """发送请求并更新熔断器统计"""
+        client = await self.get_client(url)
+        if not provider:
+            return await client.request(method, url, **kwargs)
+
+        breaker = circuit_breakers.get(provider)
+        ticket = breaker.allow_request()
+        if not ticket:
+            raise CircuitOpenError(f'{provider} 服务熔断中，已跳过请求')
+
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TimeoutException:
+            breaker.record_failure(timeout=True, ticket=ticket)
+            raise
+        except asyncio.CancelledError:
+            # 对冲执行中落选被取消，不是服务本身的问题
+            breaker.release_probe(ticket=ticket)
+            raise
+        except BaseException:
+            breaker.record_failure(ticket=ticket)
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure(ticket=ticket)
+        else:
+            breaker.record_success(ticket=ticket)
+        return response
+
+    async def get(self, url, **kwargs):
+        """发送GET请求"""
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        """发送POST请求"""
+        return await self.request('POST', url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        """
+        发送流式请求（用于下载图片等大文件），参数与 httpx.AsyncClient.build_request 相同
+
+        响应体不会预先读入内存，通过 response.aiter_bytes() 分块读取；
+        退出时关闭响应并把连接还给连接池，同时记录运行指标（接收字节数按实际读取的计算）
+        """
+        client = await self.get_client(url)
+        started = time.perf_counter()
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+        except BaseException as e:
+            record_upstream(None, method, type(e).__name__, time.perf_counter() - started)
+            raise
+
+        try:
+            yield response
+        finally:
+            await response.aclose()
+            record_upstream(
+                None, method, response.status_code, time.perf_counter() - started,
+                received_bytes=response.num_bytes_downloaded
+            )
+
+    async def aclose(self):
+        """关闭所有客户端及其连接"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：丢弃继承来的客户端（连接和父进程共用），按需重新创建"""
+        self._clients = {}
+        self._lock = asyncio.Lock()
+
+
+# 全局实例
+async_http_pool = AsyncHTTPClientPool()
+fork_safety.register(async_http_pool)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量图片生成
+把一组生成请求（或同一提示词的多个变体）并行分发到有界线程池，
+按首先调用的服务排队：某个服务的名额用满时，它的生成项留在等待队列里，不占用线程池，
+其他服务的生成项照常执行；结果按完成顺序逐条返回
+"""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from config import Config
+import fork_safety
+import model_router
+
+
+class BatchValidationError(ValueError):
+    """批量请求参数不合法"""
+
+
+class BatchGenerator:
+    """批量生成调度器"""
+
+    def __init__(self, max_workers=None, max_items=None, limits=None):
+        """初始化调度器（线程池在第一次使用时创建）"""
+        self.max_workers = max_workers or Config.BATCH_WORKERS
+        self.max_items = max_items or Config.BATCH_MAX_ITEMS
+        self.limits = limits if limits is not None else Config.PROVIDER_CONCURRENCY
+        self._executor = None
+        self._inflight = {}       # 服务 -> 已提交到线程池的生成项数
+        self._waiting = deque()   # 所有批量请求中还没提交的生成项（按到达顺序）
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """按需创建线程池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='batch-generate'
+                )
+            return self._executor
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建线程池和排队状态"""
+        self._executor = None
+        self._inflight = {}
+        self._waiting = deque()
+        self._lock = threading.Lock()
+
+    def build_items(self, data):
+        """
+        把请求数据整理成生成项列表
+
+        支持两种格式:
+        - {"items": [{"prompt": ..., "style": ..., "model": ...}, ...]}
+        - {"prompt": ..., "style": ..., "model": ..., "count": N}
+
+        返回:
+        - [{'index', 'prompt', 'style', 'model', 'variant'}, ...]
+        """
+        if not isinstance(data, dict):
+            raise BatchValidationError('请求数据无效')
+
+        if 'items' in data:
+            raw_items = data['items']
+            if not isinstance(raw_items, list) or not raw_items:
+                raise BatchValidationError('items 必须是非空列表')
+            items = []
+            for raw in raw_items:
+                if not isinstance(raw, dict):
+                    raise BatchValidationError('items 中的每一项都必须是对象')
+                items.append(self._normalize_item(raw, data, variant=0))
+        else:
+            try:
+                count = int(data.get('count', 1))
+            except (TypeError, ValueError):
+                raise BatchValidationError('count 必须是整数')
+            if count < 1:
+                raise BatchValidationError('count 必须大于0')
+            if count > self.max_items:
+                raise BatchValidationError(f'单次最多生成 {self.max_items} 张图片')
+            items = [self._normalize_item(data, data, variant=i) for i in range(count)]
+
+        if len(items) > self.max_items:
+            raise BatchValidationError(f'单次最多生成 {self.max_items} 张图片')
+
+        for index, item in enumerate(items):
+            item['index'] = index
+        return items
+
+    @staticmethod
+    def _normalize_item(raw, defaults, variant):
+        """填充生成项的默认值"""
+        prompt = str(raw.get('prompt') or defaults.get('prompt') or '').strip() or '随机创作，创意无限'
+        style = raw.get('style') or defaults.get('style') or 'realistic'
+        model = raw.get('model') or defaults.get('model') or 'auto'
+        return {'prompt': prompt, 'style': style, 'model': model, 'variant': variant}
+
+    def run(self, items, generate_func):
+        """
+        并行执行生成项，按完成顺序逐个产生结果
+
+        参数:
+        - items: build_items 返回的生成项
+        - generate_func: 接收一个生成项，返回生成图片的路径
+
+        产生:
+        - (生成项, 图片路径或None, 错误信息或None)
+        """
+        batch = {'results': queue.Queue(), 'futures': []}
+        with self._lock:
+            for item in items:
+                provider = model_router.primary_provider(item['model'])
+                self._waiting.append((provider, item, generate_func, batch))
+        self._admit()
+
+        try:
+            for _ in range(len(items)):
+                yield batch['results'].get()
+        finally:
+            # 客户端断开时撤回还在排队的生成项，取消已提交但还没开始的
+            with self._lock:
+                self._waiting = deque(entry for entry in self._waiting if entry[3] is not batch)
+                futures = list(batch['futures'])
+            for future in futures:
+                future.cancel()
+
+    def _admit(self):
+        """把名额还没用满的服务的等待生成项提交到线程池（不会让线程池的线程阻塞等待名额）"""
+        executor = self._get_executor()
+        with self._lock:
+            ready = []
+            waiting = deque()
+            for entry in self._waiting:
+                provider = entry[0]
+                if self._inflight.get(provider, 0) < self.limits.get(provider, Config.DEFAULT_PROVIDER_CONCURRENCY):
+                    self._inflight[provider] = self._inflight.get(provider, 0) + 1
+                    ready.append(entry)
+                else:
+                    waiting.append(entry)
+            self._waiting = waiting
+
+            futures = []
+            for entry in ready:
+                provider, item, generate_func, batch = entry
+                future = executor.submit(generate_func, item)
+                batch['futures'].append(future)
+                futures.append((future, entry))
+
+        for future, entry in futures:
+            future.add_done_callback(partial(self._on_done, entry))
+
+    def _on_done(self, entry, future):
+        """生成项结束：归还名额，送出结果，再提交等待中的生成项"""
+        provider, item, _, batch = entry
+        with self._lock:
+            self._inflight[provider] -= 1
+
+        if future.cancelled():
+            batch['results'].put((item, None, '已取消'))
+        elif future.exception() is not None:
+            batch['results'].put((item, None, str(future.exception())))
+        else:
+            batch['results'].put((item, future.result(), None))
+        self._admit()
+
+
+# 全局实例
+batch_generator = BatchGenerator()
+fork_safety.register(batch_generator)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+导入耗时基准测试
+每次都在全新的Python进程中导入指定模块（默认 app），统计导入耗时，
+并列出 -X importtime 中累计耗时最多的模块；加上 --providers 时还会测量每个生成器第一次创建的耗时
+
+使用方法:
+    python bench_import_time.py
+    python bench_import_time.py wsgi -n 20
+    python bench_import_time.py --providers
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# 子进程中执行的代码：只测量 import 本身
+IMPORT_CODE = """
+import time
+start = time.perf_counter()
+import {module}
+print('BENCH_IMPORT', time.perf_counter() - start)
+"""
+
+# 子进程中执行的代码：导入之后依次创建每个生成器
+PROVIDERS_CODE = """
+import time
+import {module}
+from provider_registry import providers
+for name in providers.names():
+    start = time.perf_counter()
+    providers.get(name)
+    print('BENCH_PROVIDER', name, time.perf_counter() - start)
+"""
+
+
+def run_child(code, *python_args):
+    """在新的Python进程中执行代码，返回 (标准输出行, 标准错误行)"""
+    result = subprocess.run(
+        [sys.executable, *python_args, '-c', code],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return result.stdout.splitlines(), result.stderr.splitlines()
+
+
+def measure_import(module, runs):
+    """多次测量导入耗时（秒）"""
+    timings = []
+    for _ in range(runs):
+        stdout, _ = run_child(IMPORT_CODE.format(module=module))
+        for line in stdout:
+            if line.startswith('BENCH_IMPORT '):
+                timings.append(float(line.split()[1]))
+    return timings
+
+
+def slowest_modules(module, limit):
+    """用 -X importtime 找出累计耗时最多的模块，返回 [(累计微秒, 模块名), ...]"""
+    _, stderr = run_child(f'import {module}', '-X', 'importtime')
+    entries = []
+    for line in stderr:
+        # 格式: import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        entries.append((int(cumulative), name.rstrip()))
+    entries.sort(reverse=True)
+    return entries[:limit]
+
+
+def measure_providers(module):
+    """测量每个生成器第一次创建的耗时，返回 [(名称, 秒), ...]"""
+    stdout, _ = run_child(PROVIDERS_CODE.format(module=module))
+    results = []
+    for line in stdout:
+        if line.startswith('BENCH_PROVIDER '):
+            _, name, seconds = line.split()
+            results.append((name, float(seconds)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量模块的冷启动导入耗时')
+    parser.add_argument('module', nargs='?', default='app', help='要导入的模块（默认 app）')
+    parser.add_argument('-n', '--runs', type=int, default=10, help='测量次数（默认10）')
+    parser.add_argument('--top', type=int, default=15, help='列出累计耗时最多的模块数量（默认15）')
+    parser.add_argument('--providers', action='store_true', help='同时测量每个生成器第一次创建的耗时')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print(f"⏱️  导入耗时测试: import {args.module}（{args.runs}次，每次都是新进程）")
+    print("=" * 50)
+
+    timings = measure_import(args.module, args.runs)
+    print(f"中位数: {statistics.median(timings) * 1000:.1f} ms")
+    print(f"最快:   {min(timings) * 1000:.1f} ms")
+    print(f"最慢:   {max(timings) * 1000:.1f} ms")
+
+    print()
+    print(f"📦 累计耗时最多的 {args.top} 个模块:")
+    for cumulative, name in slowest_modules(args.module, args.top):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    if args.providers:
+        print()
+        print("🏭 第一次创建生成器的耗时:")
+        for name, seconds in measure_providers(args.module):
+            print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AI服务熔断器
+按服务（segmind、gpt_image1、openrouter、doubao、ark）统计最近一段时间的错误率和超时，
+错误率过高时熔断（直接跳过该服务），冷却后放行少量探测请求，探测成功再恢复
+"""
+
+import time
+import threading
+from collections import deque
+
+import requests
+
+from config import Config
+import fork_safety
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    单个服务的熔断器
+    状态: closed（正常）/ open（熔断）/ half_open（探测中）
+    """
+
+    def __init__(self, name, window_seconds=None, min_requests=None,
+                 failure_rate=None, open_seconds=None, half_open_probes=None):
+        """初始化熔断器"""
+        self.name = name
+        self.window_seconds = window_seconds or Config.CIRCUIT_WINDOW_SECONDS
+        self.min_requests = min_requests or Config.CIRCUIT_MIN_REQUESTS
+        self.failure_rate = failure_rate or Config.CIRCUIT_FAILURE_RATE
+        self.open_seconds = open_seconds or Config.CIRCUIT_OPEN_SECONDS
+        self.half_open_probes = half_open_probes or Config.CIRCUIT_HALF_OPEN_PROBES
+
+        self.state = 'closed'
+        self.opened_at = None
+        self._events = deque()  # (时间, 是否成功, 是否超时)
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._generation = 0    # 每次状态切换加一，用来识别上一个状态时发出的请求
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        判断是否允许发送请求（半开状态下会占用一个探测名额）
+
+        返回:
+        - False: 熔断中，跳过请求
+        - 请求凭据（真值）: 请求结束后传给 record_success / record_failure / release_probe，
+          用来区分本轮半开探测的请求和熔断之前就已经发出的请求
+        """
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                # 冷却结束，进入半开状态
+                self.state = 'half_open'
+                self._generation += 1
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+                print(f"🔌 熔断器 {self.name} 进入半开状态，开始探测")
+
+            if self.state == 'half_open':
+                if self._probes_in_flight >= self.half_open_probes:
+                    return False
+                self._probes_in_flight += 1
+                return (self._generation, True)
+
+            return (self._generation, False)
+
+    def _is_current_probe(self, ticket):
+        """请求是否是本轮半开探测发出的（没有凭据时按探测处理；调用方需持有锁）"""
+        return ticket is None or ticket == (self._generation, True)
+
+    def is_open(self):
+        """熔断器是否处于打开状态（不占用探测名额）"""
+        with self._lock:
+            return self.state == 'open' and time.monotonic() - self.opened_at < self.open_seconds
+
+    def record_success(self, ticket=None):
+        """记录一次成功请求（ticket 为 allow_request 返回的凭据）"""
+        with self._lock:
+            if self.state == 'half_open':
+                if not self._is_current_probe(ticket):
+                    # 熔断之前发出、现在才返回的请求不算探测结果，也不占探测名额
+                    return
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self.state = 'closed'
+                    self._generation += 1
+                    self.opened_at = None
+                    self._events.clear()
+                    print(f"✅ 熔断器 {self.name} 探测成功，恢复正常")
+                return
+            self._events.append((time.monotonic(), True, False))
+            self._prune()
+
+    def release_probe(self, ticket=None):
+        """请求被主动取消（不计成功也不计失败），归还占用的探测名额"""
+        with self._lock:
+            if self.state == 'half_open' and self._is_current_probe(ticket):
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_failure(self, timeout=False, ticket=None):
+        """记录一次失败请求（ticket 为 allow_request 返回的凭据）"""
+        with self._lock:
+            if self.state == 'half_open':
+                if not self._is_current_probe(ticket):
+                    return
+                self._open()
+                print(f"⛔ 熔断器 {self.name} 探测失败，继续熔断")
+                return
+            self._events.append((time.monotonic(), False, timeout))
+            self._prune()
+
+            if self.state == 'closed' and len(self._events) >= self.min_requests:
+                failures = sum(1 for _, ok, _ in self._events if not ok)
+                if failures / len(self._events) >= self.failure_rate:
+                    self._open()
+                    print(f"⛔ 熔断器 {self.name} 已打开：最近 {len(self._events)} 次请求失败 {failures} 次")
+
+    def _open(self):
+        """切换到打开状态（调用方需持有锁）"""
+        self.state = 'open'
+        self._generation += 1
+        self.opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _prune(self):
+        """丢弃统计窗口之外的记录（调用方需持有锁）"""
+        cutoff = time.monotonic() - self.window_seconds
+        while self._events and self._events[0][0] < cutoff:
+            self._events.popleft()
+
+    def snapshot(self):
+        """返回熔断器当前状态"""
+        with self._lock:
+            self._prune()
+            total = len(self._events)
+            failures = sum(1 for _, ok, _ in self._events if not ok)
+            timeouts = sum(1 for _, _, is_timeout in self._events if is_timeout)
+            retry_in = None
+            if self.state == 'open':
+                retry_in = max(0, round(self.open_seconds - (time.monotonic() - self.opened_at), 1))
+            return {
+                'state': self.state,
+                'requests': total,
+                'failures': failures,
+                'timeouts': timeouts,
+                'failure_rate': round(failures / total, 3) if total else 0.0,
+                'retry_in_seconds': retry_in
+            }
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁（统计窗口保留）"""
+        self._lock = threading.Lock()
+
+
+class CircuitBreakerRegistry:
+    """所有服务共享的熔断器集合"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """获取（或创建）指定服务的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name)
+                self._breakers[name] = breaker
+            return breaker
+
+    def snapshot(self):
+        """返回所有熔断器的状态"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁，已有熔断器的锁也一起重建"""
+        self._lock = threading.Lock()
+        for breaker in self._breakers.values():
+            breaker._reset_after_fork()
+
+
+# 全局实例
+circuit_breakers = CircuitBreakerRegistry()
+fork_safety.register(circuit_breakers)
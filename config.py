@@ -32,6 +32,13 @@ class Config:
     # 豆包文档理解API设置（文档处理和文本分析）
     DOUBAO_DOCUMENT_API_KEY = os.getenv('DOUBAO_DOCUMENT_API_KEY', 'b122a8a1-da7b-4cbc-8304-0235a9e319a1')
     DOUBAO_DOCUMENT_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
+    # 豆包图片分析使用的视觉模型（按优先级排列）
+    DOUBAO_VISION_MODELS = ['doubao-pro-32k', 'doubao-lite-32k', 'doubao-pro-4k']
+    DOUBAO_VISION_STRATEGY = os.getenv('DOUBAO_VISION_STRATEGY', 'sticky')  # race: 多个模型同时请求；sticky: 记住上次成功的模型
+    DOUBAO_VISION_HEDGE_DELAY = 0             # race模式下启动下一个模型前的等待时间（秒，0表示同时启动）
+    DOUBAO_VISION_FAILURE_COOLDOWN = 5 * 60   # 模型失败后被跳过的时间（秒）
+    ANALYZE_IMAGE_DEADLINE = 45               # /analyze_image 调用豆包的总时间上限（秒），超时后使用本地分析
+    LOCAL_ANALYSIS_MAX_EDGE = 256             # 本地图片分析使用的缩略图最长边（像素）
     # OpenRouter支持的图像生成模型（使用正确的模型ID）
     OPENROUTER_IMAGE_MODELS = {
         'gemini_image': 'google/gemini-2.5-flash-image-preview',  # Gemini 2.5 Flash 图像生成
@@ -44,6 +51,20 @@ class Config:
     }
     DEFAULT_OPENROUTER_MODEL = 'gemini_image'  # 默认使用免费的Gemini图像生成模型
     
+    # HTTP连接池设置（所有AI服务客户端共享keep-alive连接）
+    HTTP_DEFAULT_POOL_SIZE = 10   # 未单独配置的域名的最大保持连接数
+    HTTP_POOL_SIZES = {           # 按域名配置最大保持连接数
+        'api.segmind.com': 20,
+        'openrouter.ai': 20,
+        'ark.cn-beijing.volces.com': 20,
+    }
+    HTTP_PREWARM = os.getenv('HTTP_PREWARM', 'false').lower() == 'true'  # 启动时是否预热连接
+    HTTP_PREWARM_URLS = [
+        'https://api.segmind.com',
+        'https://openrouter.ai',
+        'https://ark.cn-beijing.volces.com',
+    ]
+
     # 图片生成参数
     IMAGE_WIDTH = 512        # 生成图片的宽度
     IMAGE_HEIGHT = 512       # 生成图片的高度  
@@ -57,6 +78,14 @@ class Config:
     DEFAULT_VIDEO_DURATION = 5
     DEFAULT_CAMERA_FIXED = False
     DEFAULT_WATERMARK = True
+
+    # 视频任务后台轮询设置
+    VIDEO_POLL_MIN_INTERVAL = 3             # 状态变化后的查询间隔（秒）
+    VIDEO_POLL_MAX_INTERVAL = 30            # 查询间隔上限（秒）
+    VIDEO_POLL_BACKOFF = 1.5                # 状态没有变化时查询间隔的增长倍数
+    VIDEO_POLL_MAX_ERRORS = 5               # 连续查询失败多少次后停止跟踪
+    VIDEO_POLL_FIRST_WAIT = 5               # 新任务第一次查询时最多等待的秒数
+    VIDEO_STATUS_RETENTION_SECONDS = 60 * 60  # 已结束任务的状态在内存中保留的时间
     
     # 精简优化的美术风格配置 - 只保留7个核心风格
     # 每个风格都经过重新设计，确保更好的AI生成效果
@@ -122,6 +151,7 @@ class Config:
     # 文件上传设置
     UPLOAD_FOLDER = 'uploads'
     GENERATED_FOLDER = 'generated'
+    FALLBACK_FONT_PATH = os.getenv('FALLBACK_FONT_PATH', '')  # 示例图片使用的字体文件（留空时自动查找）
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
     # 允许的文件扩展名
@@ -130,7 +160,115 @@ class Config:
     # 文档处理设置
     MAX_DOCUMENT_SIZE = 10 * 1024 * 1024  # 10MB
     SUPPORTED_DOCUMENT_TYPES = ['pdf', 'txt', 'doc', 'docx']
-    
+    DOCUMENT_MAX_CHARS = 8000              # 超过这个字符数的文档按长文档分段分析（关闭长文档模式时直接截断）
+    DOCUMENT_LONG_MODE_ENABLED = os.getenv('DOCUMENT_LONG_MODE_ENABLED', 'true').lower() == 'true'
+    DOCUMENT_LONG_MAX_CHARS = 200000       # 长文档模式最多分析的字符数
+    DOCUMENT_CHUNK_TOKENS = 3000           # 长文档每段的token上限（估算值）
+    DOCUMENT_MAP_WORKERS = int(os.getenv('DOCUMENT_MAP_WORKERS', '4'))  # 同时分析的文档片段数
+
+    # 熔断器设置（每个AI服务单独统计）
+    CIRCUIT_WINDOW_SECONDS = 60     # 错误率统计窗口（秒）
+    CIRCUIT_MIN_REQUESTS = 5        # 窗口内至少有这么多请求才会判断是否熔断
+    CIRCUIT_FAILURE_RATE = 0.5      # 错误率（含超时）达到该比例时熔断
+    CIRCUIT_OPEN_SECONDS = 30       # 熔断后多久放行探测请求
+    CIRCUIT_HALF_OPEN_PROBES = 1    # 半开状态下需要连续成功的探测次数
+
+    # 智能选择模式的对冲执行设置
+    AUTO_RACE_ENABLED = os.getenv('AUTO_RACE_ENABLED', 'true').lower() == 'true'  # 是否并行对冲执行
+    AUTO_HEDGE_DELAY = float(os.getenv('AUTO_HEDGE_DELAY', '8'))   # 首选模型多少秒没有结果就启动下一个模型
+    AUTO_RACE_TIMEOUT = None                                       # 整体最长等待秒数，None表示等所有模型结束
+    AUTO_RACE_WORKERS = 16                                         # 对冲执行线程池大小
+
+    # 生成结果缓存设置（相同请求直接复用已生成的图片）
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_TTL_SECONDS = 24 * 60 * 60       # 缓存有效期
+    RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 缓存索引最多引用的图片总大小（2GB，淘汰时只移除索引，不删除图片）
+
+    # 参考图片Base64编码缓存（按内容哈希，重试和多个模型之间复用）
+    ENCODING_CACHE_MAX_BYTES = 64 * 1024 * 1024   # 编码缓存最多占用的内存（64MB）
+
+    # 参考图片预处理设置（摆正方向、去除元数据、缩小后再上传给AI服务）
+    REFERENCE_NORMALIZE_ENABLED = os.getenv('REFERENCE_NORMALIZE_ENABLED', 'true').lower() == 'true'
+    REFERENCE_DEFAULT_MAX_EDGE = 1536             # 参考图片最长边（像素）
+    REFERENCE_MAX_EDGE = {                        # 各AI服务单独的最长边
+        'segmind': 1536,
+        'gpt_image1': 1536,
+        'openrouter': 1536,
+        'doubao': 1024,                           # 图片分析不需要太高的分辨率
+    }
+    REFERENCE_PASSTHROUGH_BYTES = 512 * 1024      # 小于这个大小且不需要缩放的图片直接使用原图
+    REFERENCE_JPEG_QUALITY = 90                   # 重新编码的JPEG质量
+    REFERENCE_CACHE_MAX_BYTES = 512 * 1024 * 1024 # 预处理结果缓存最多占用的磁盘空间（512MB）
+    REFERENCE_CACHE_IN_USE_SECONDS = 300          # 预处理结果交给调用方（或被其他工作进程使用）后这段时间内不会被清理
+    REFERENCE_CACHE_TOUCH_INTERVAL = 60 * 60      # 命中缓存时最多这么久更新一次文件修改时间（修改时间变化会让文件哈希缓存失效）
+
+    # 批量生成设置
+    BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))   # 批量生成共享线程池大小
+    BATCH_MAX_ITEMS = 20                                   # 单次批量请求最多生成的图片数
+    DEFAULT_PROVIDER_CONCURRENCY = 4                       # 未单独配置的服务的并发上限
+    PROVIDER_CONCURRENCY = {                               # 各服务同时进行的生成数量上限（按实际调用的服务计算）
+        'segmind': 4,
+        'gpt_image1': 2,
+        'openrouter': 4,
+        'gemini': 8,
+        'fallback': 8,
+    }
+
+    # 图片生成任务队列设置（/generate 立即返回任务ID，后台线程执行生成）
+    JOBS_FOLDER = 'jobs'                                          # 任务记录保存目录
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))              # 后台生成线程数
+    JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '32'))       # 最多允许排队等待的任务数
+    JOB_RETENTION_SECONDS = 24 * 60 * 60                          # 已结束任务记录保留时间
+    JOB_SWEEP_INTERVAL = 60 * 60                                  # 清理磁盘上过期任务记录的间隔（秒）
+
+    # 进度事件推送设置（/events/<id>，Server-Sent Events）
+    EVENT_HISTORY_SIZE = 50                                       # 每个任务保留的最近事件数（供后来的订阅者补发）
+    EVENT_RETENTION_SECONDS = 10 * 60                             # 没有订阅者的事件频道保留时间
+    EVENT_QUEUE_SIZE = 100                                        # 每个订阅者最多缓冲的事件数
+    EVENT_HEARTBEAT_SECONDS = 15                                  # 没有事件时发送心跳的间隔
+
+    # 生产环境服务器设置（python serve.py，优先使用gunicorn，其次waitress）
+    # 任务队列、事件推送和各种缓存都在进程内，多进程时任务状态通过 jobs/ 目录共享
+    SERVER_BACKEND = os.getenv('SERVER_BACKEND', 'auto')                         # auto / gunicorn / waitress / werkzeug / uvicorn（ASGI）
+    SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')                            # 监听地址
+    SERVER_PORT = int(os.getenv('SERVER_PORT', '4000'))                          # 监听端口
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '1'))                       # 工作进程数（仅gunicorn）
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '16'))                      # 每个进程的请求处理线程数（SSE长连接也占用线程）
+    SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', '5'))                   # keep-alive连接空闲保持秒数
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', '180'))                     # 单个请求（工作进程无响应）超时秒数
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30'))    # 平滑重启/停止时等待请求完成的秒数
+    SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', '0'))             # 处理多少请求后自动重启工作进程（0表示不重启）
+    SERVER_MAX_REQUESTS_JITTER = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', '50'))  # 自动重启的随机抖动，避免所有进程同时重启
+    SERVER_RELOAD = os.getenv('SERVER_RELOAD', 'false').lower() == 'true'       # 代码修改后自动重新加载（开发时使用）
+    DEBUG = os.getenv('FLASK_DEBUG', 'true').lower() == 'true'                  # python app.py 开发服务器是否开启调试模式
+
+    # 异步（ASGI）接口设置（uvicorn asgi:app，/async/* 接口等待上游时不占用线程）
+    ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '1000'))  # 每个域名最多同时打开的连接数
+    ASYNC_HTTP_MAX_KEEPALIVE = 100                                             # 每个域名最多保持的空闲连接数
+    ASYNC_HTTP_KEEPALIVE_EXPIRY = 30                                           # 空闲连接保持秒数
+    ASYNC_MAX_INFLIGHT = int(os.getenv('ASYNC_MAX_INFLIGHT', '5000'))           # 同时进行中的异步生成请求上限，超过时返回503
+    ASYNC_OFFLOAD_THREADS = int(os.getenv('ASYNC_OFFLOAD_THREADS', '32'))       # 本地处理（预处理参考图、保存图片、示例图片）使用的线程数
+
+    # 健康检查设置（后台定时检查各AI服务，/api-status 直接返回最近一次的结果）
+    HEALTH_CHECK_ENABLED = os.getenv('HEALTH_CHECK_ENABLED', 'true').lower() == 'true'  # 是否启动后台检查线程（关闭时在请求中按间隔检查）
+    HEALTH_CHECK_INTERVAL = int(os.getenv('HEALTH_CHECK_INTERVAL', '60'))       # 默认检查间隔（秒）
+    HEALTH_CHECK_INTERVALS = {                                                 # 单独设置检查间隔的服务（秒）
+        'openrouter': 300,                                                     # 开启在线检查时会真正调用一次接口，检查得少一些
+    }
+    HEALTH_CHECK_OPENROUTER_LIVE = os.getenv('HEALTH_CHECK_OPENROUTER_LIVE', 'false').lower() == 'true'  # OpenRouter是否在线检查（每个工作进程每次检查都是一次付费调用），默认只检查密钥格式
+    HEALTH_CHECK_WORKERS = 4                                                   # 同时执行检查的线程数
+    HEALTH_CHECK_STALE_FACTOR = 3                                              # 结果超过检查间隔多少倍后标记为过期
+
+    # 运行指标设置（/metrics 接口，Prometheus文本格式）
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'   # 是否记录指标
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)   # 网站请求、文件保存耗时分桶（秒）
+    METRICS_PROVIDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180)  # AI服务调用耗时分桶（秒，覆盖到最长超时）
+
+    @staticmethod
+    def validate_token():
+        """检查ByteDance ARK API密钥是否已设置"""
+        return bool(Config.ARK_API_KEY)
+
     @staticmethod
     def get_style_config(style_key):
         """获取指定风格的配置"""
@@ -3,8 +3,114 @@
 
 import requests
 import os
+import re
 import json
+import codecs
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from config import Config
+import fork_safety
+from http_client import http_pool
+from metrics import instrument_provider
+from encoding_cache import encoding_cache
+from reference_normalizer import reference_normalizer
+from provider_race import race_providers
+
+# 文档分析结果的输出格式（短文档和长文档汇总共用）
+ANALYSIS_OUTPUT_FORMAT = """请按照以下格式输出：
+1. 文档主题/类型：
+2. 关键概念/元素：
+3. 视觉风格建议：
+4. 图像生成提示词：
+
+要求：
+- 提取最重要的视觉元素
+- 建议适合的艺术风格
+- 生成简洁但富有创意的提示词
+- 用中文回答"""
+
+# 图片分析提示词
+IMAGE_ANALYSIS_PROMPT = """请详细分析这张图片的内容，生成适合AI图像生成的描述文字。请包含以下信息：
+
+1. 主体对象：图片中的主要人物、动物、物体等
+2. 外观特征：颜色、形状、大小、材质等
+3. 动作姿态：人物的动作、表情、姿态等
+4. 环境背景：场景、背景、环境等
+5. 风格特征：艺术风格、色调、氛围等
+
+请用简洁明了的中文描述，适合作为AI图像生成的提示词。"""
+
+# 中日韩文字（大约每个字一个token）
+_CJK_CHARS = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+# 主要颜色命名用的参考色：(中文名, 英文名, RGB)
+_NAMED_COLORS = (
+    ('黑色', 'black', (20, 20, 20)),
+    ('深灰色', 'dark gray', (80, 80, 80)),
+    ('灰色', 'gray', (140, 140, 140)),
+    ('浅灰色', 'light gray', (200, 200, 200)),
+    ('白色', 'white', (245, 245, 245)),
+    ('红色', 'red', (200, 40, 40)),
+    ('橙色', 'orange', (240, 140, 40)),
+    ('黄色', 'yellow', (240, 220, 60)),
+    ('绿色', 'green', (60, 160, 70)),
+    ('青色', 'cyan', (60, 190, 200)),
+    ('蓝色', 'blue', (50, 90, 200)),
+    ('紫色', 'purple', (130, 70, 170)),
+    ('粉色', 'pink', (240, 160, 190)),
+    ('棕色', 'brown', (130, 85, 50)),
+    ('米色', 'beige', (225, 205, 170)),
+    ('深蓝色', 'navy', (25, 35, 90)),
+    ('深绿色', 'dark green', (25, 80, 40)),
+)
+
+
+def _nearest_color_name(rgb):
+    """返回离给定RGB最近的参考色名称 (中文名, 英文名)"""
+    r, g, b = rgb
+    name, english, _ = min(
+        _NAMED_COLORS,
+        key=lambda item: (item[2][0] - r) ** 2 + (item[2][1] - g) ** 2 + (item[2][2] - b) ** 2
+    )
+    return name, english
+
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：中日韩文字按每字1个，其他字符按每4个1个"""
+    cjk_count = len(_CJK_CHARS.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def split_text_by_tokens(text, max_tokens):
+    """
+    按段落把文本切成若干段，每段估算不超过 max_tokens 个token
+    （单个段落超过上限时按字符硬切）
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph in text.split('\n'):
+        paragraph_tokens = estimate_tokens(paragraph) + 1
+        if paragraph_tokens > max_tokens:
+            # 超长段落：按字符切开，每片的token数不超过上限
+            step = max(1, len(paragraph) * max_tokens // paragraph_tokens)
+            pieces = [paragraph[i:i + step] for i in range(0, len(paragraph), step)]
+        else:
+            pieces = [paragraph]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece) + 1
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append('\n'.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
 
 class DocumentProcessor:
     """
@@ -19,7 +125,14 @@ class DocumentProcessor:
         """
         self.api_key = Config.DOUBAO_DOCUMENT_API_KEY
         self.base_url = Config.DOUBAO_DOCUMENT_BASE_URL
+        self.text_model = "deepseek-v3-1-250821"  # 豆包模型ID
         self.timeout = 60  # 1分钟超时
+        self._executor = None  # 长文档分段分析使用的线程池（按需创建）
+        self._executor_lock = threading.Lock()
+        self._last_good_vision_model = None  # 上次成功分析图片的视觉模型
+        self._vision_failed_until = {}  # 视觉模型 -> 失败冷却结束时间
+        self._vision_lock = threading.Lock()
+        fork_safety.register(self)
     
     def test_connection(self):
         """
@@ -50,86 +163,108 @@ class DocumentProcessor:
                 'error': f'豆包API连接测试失败: {str(e)}'
             }
     
-    def extract_text_from_file(self, file_path):
+    def extract_text_from_file(self, file_path, max_chars=None):
         """
         从文件中提取文本内容
         
         参数:
         - file_path: 文件路径
+        - max_chars: 最多需要的字符数，提取到这么多字符后就停止解析（None表示全部提取）
         
         返回:
-        - 成功: 提取的文本内容
+        - 成功: 提取的文本内容（可能略多于 max_chars）
         - 失败: None
         """
         try:
             file_extension = os.path.splitext(file_path)[1].lower()
             
             if file_extension == '.txt':
-                return self._extract_from_txt(file_path)
+                chunks = self._extract_from_txt(file_path)
             elif file_extension == '.pdf':
-                return self._extract_from_pdf(file_path)
+                chunks = self._extract_from_pdf(file_path)
             elif file_extension in ['.doc', '.docx']:
-                return self._extract_from_doc(file_path)
+                chunks = self._extract_from_doc(file_path)
             else:
                 print(f"不支持的文件格式: {file_extension}")
                 return None
+            
+            # 逐段收集文本，够用就停止解析剩下的页面/段落
+            pieces = []
+            total_chars = 0
+            try:
+                for chunk in chunks:
+                    pieces.append(chunk)
+                    total_chars += len(chunk)
+                    if max_chars is not None and total_chars >= max_chars:
+                        print(f"⏹️ 已提取 {total_chars} 字符，停止解析剩余内容")
+                        break
+            finally:
+                chunks.close()
+            return ''.join(pieces)
                 
         except Exception as e:
             print(f"文件文本提取失败: {str(e)}")
             return None
     
-    def _extract_from_txt(self, file_path):
+    @staticmethod
+    def _detect_text_encoding(file_path, sample_size=64 * 1024):
         """
-        从TXT文件提取文本
+        根据文件开头的内容判断TXT文件编码（依次尝试UTF-8、GBK，都不行时使用latin-1）
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            # 尝试其他编码
+        with open(file_path, 'rb') as f:
+            sample = f.read(sample_size)
+        for encoding in ('utf-8', 'gbk'):
             try:
-                with open(file_path, 'r', encoding='gbk') as f:
-                    return f.read()
-            except:
-                with open(file_path, 'r', encoding='latin-1') as f:
-                    return f.read()
+                # 增量解码，样本末尾被截断的多字节字符不算解码失败
+                codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return 'latin-1'
+    
+    def _extract_from_txt(self, file_path, chunk_size=16 * 1024):
+        """
+        从TXT文件逐块提取文本
+        """
+        encoding = self._detect_text_encoding(file_path)
+        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+            for chunk in iter(lambda: f.read(chunk_size), ''):
+                yield chunk
     
     def _extract_from_pdf(self, file_path):
         """
-        从PDF文件提取文本
+        从PDF文件逐页提取文本
         """
         try:
             import PyPDF2
+        except ImportError:
+            print("需要安装PyPDF2: pip install PyPDF2")
+            return
+        
+        try:
             with open(file_path, 'rb') as f:
                 pdf_reader = PyPDF2.PdfReader(f)
-                text = ""
                 for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
-        except ImportError:
-            print("需要安装PyPDF2: pip install PyPDF2")
-            return None
+                    yield (page.extract_text() or '') + "\n"
         except Exception as e:
             print(f"PDF提取失败: {str(e)}")
-            return None
     
     def _extract_from_doc(self, file_path):
         """
-        从DOC/DOCX文件提取文本
+        从DOC/DOCX文件逐段提取文本
         """
         try:
             import docx
-            doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
         except ImportError:
             print("需要安装python-docx: pip install python-docx")
-            return None
+            return
+        
+        try:
+            doc = docx.Document(file_path)
+            for paragraph in doc.paragraphs:
+                yield paragraph.text + "\n"
         except Exception as e:
             print(f"DOC提取失败: {str(e)}")
-            return None
     
     def process_document(self, file_path):
         """
@@ -145,8 +280,11 @@ class DocumentProcessor:
         try:
             print(f"📄 开始处理文档: {file_path}")
             
-            # 提取文本内容
-            text_content = self.extract_text_from_file(file_path)
+            # 提取文本内容（只解析需要的部分，多取一个字符用来判断是否被截断）
+            max_chars = Config.DOCUMENT_MAX_CHARS
+            long_mode = Config.DOCUMENT_LONG_MODE_ENABLED
+            read_chars = Config.DOCUMENT_LONG_MAX_CHARS if long_mode else max_chars
+            text_content = self.extract_text_from_file(file_path, max_chars=read_chars + 1)
             if not text_content:
                 print("❌ 无法提取文档内容")
                 return None
@@ -154,12 +292,15 @@ class DocumentProcessor:
             print(f"✅ 成功提取文本，长度: {len(text_content)} 字符")
             
             # 如果文本太长，先截取前部分
-            if len(text_content) > 8000:
-                text_content = text_content[:8000] + "..."
-                print("⚠️ 文本过长，已截取前8000字符")
+            if len(text_content) > read_chars:
+                text_content = text_content[:read_chars] + "..."
+                print(f"⚠️ 文本过长，已截取前{read_chars}字符")
             
-            # 使用豆包分析文档内容
-            analysis_result = self._analyze_with_doubao(text_content)
+            # 使用豆包分析文档内容：短文档一次分析，长文档分段并行分析后再汇总
+            if len(text_content) > max_chars:
+                analysis_result = self._analyze_long_document(text_content)
+            else:
+                analysis_result = self._analyze_with_doubao(text_content)
             
             if analysis_result:
                 print("✅ 文档分析完成")
@@ -167,12 +308,13 @@ class DocumentProcessor:
             else:
                 print("❌ 豆包分析失败，使用本地分析")
                 # 当豆包失败时，提供简单的本地分析
-                return self._local_analysis(text_content)
+                return self._local_analysis(text_content[:max_chars])
                 
         except Exception as e:
             print(f"💥 文档处理过程中出现错误: {str(e)}")
             return None
     
+    @instrument_provider('doubao', 'analyze_document')
     def _analyze_with_doubao(self, text_content):
         """
         使用豆包分析文档内容
@@ -184,38 +326,137 @@ class DocumentProcessor:
         - 成功: 分析结果
         - 失败: None
         """
-        try:
-            # 构建分析提示词
-            analysis_prompt = f"""
+        # 构建分析提示词
+        analysis_prompt = f"""
 请分析以下文档内容，提取关键信息并生成适合AI图像生成的描述：
 
 文档内容：
 {text_content}
 
-请按照以下格式输出：
-1. 文档主题/类型：
-2. 关键概念/元素：
-3. 视觉风格建议：
-4. 图像生成提示词：
+{ANALYSIS_OUTPUT_FORMAT}
+"""
+        print(f"📡 正在调用豆包API分析文档...")
+        analysis_text = self._chat_completion(analysis_prompt)
+        if analysis_text:
+            print("✅ 豆包分析成功")
+        return analysis_text
+    
+    def _analyze_long_document(self, text_content):
+        """
+        长文档分析（map-reduce）
+        把文档按token上限切成若干段，有限并发地让豆包分别提取每段要点，
+        再把各段要点汇总成与短文档相同的四段式分析结果
+        
+        参数:
+        - text_content: 文档文本内容
+        
+        返回:
+        - 成功: 分析结果
+        - 失败: None
+        """
+        chunk_tokens = Config.DOCUMENT_CHUNK_TOKENS
+        chunks = split_text_by_tokens(text_content, chunk_tokens)
+        print(f"📚 长文档模式：{len(text_content)} 字符，分成 {len(chunks)} 段并行分析")
+        
+        # map：并行提取每一段的要点
+        total = len(chunks)
+        prompts = [
+            f"""
+以下是一篇长文档的第 {index}/{total} 部分，请提取这一部分中与图像创作有关的要点：
+主题内容、关键概念/视觉元素、场景与氛围、风格线索。用中文分条列出，不超过300字。
 
-要求：
-- 提取最重要的视觉元素
-- 建议适合的艺术风格
-- 生成简洁但富有创意的提示词
-- 用中文回答
+文档片段：
+{chunk}
 """
-            
+            for index, chunk in enumerate(chunks, 1)
+        ]
+        summaries = [summary for summary in self._map_chat_completions(prompts, 'summarize_document_chunk', max_tokens=600) if summary]
+        if not summaries:
+            print("❌ 所有文档片段都分析失败")
+            return None
+        print(f"✅ 已完成 {len(summaries)}/{total} 段要点提取")
+        
+        # 要点合起来仍然太长时，先分组合并，直到可以一次汇总
+        while len(summaries) > 1 and estimate_tokens('\n\n'.join(summaries)) > chunk_tokens:
+            groups = split_text_by_tokens('\n\n'.join(summaries), chunk_tokens)
+            print(f"🔁 要点仍然过长，分 {len(groups)} 组合并")
+            merge_prompts = [
+                f"""
+以下是同一篇文档若干部分的要点，请合并成一份不重复的要点列表（中文，不超过400字）：
+
+{group}
+"""
+                for group in groups
+            ]
+            merged = [summary for summary in self._map_chat_completions(merge_prompts, 'merge_document_summaries', max_tokens=800) if summary]
+            if not merged or len(merged) >= len(summaries):
+                break
+            summaries = merged
+        
+        # reduce：把各段要点汇总成最终结果
+        summary_text = '\n\n'.join(
+            f"【第{index}部分要点】\n{summary}" for index, summary in enumerate(summaries, 1)
+        )
+        reduce_prompt = f"""
+以下是一篇长文档按顺序分段提取的要点，请综合整篇文档的内容，提取关键信息并生成适合AI图像生成的描述：
+
+{summary_text}
+
+{ANALYSIS_OUTPUT_FORMAT}
+"""
+        print(f"📡 正在汇总长文档分析结果...")
+        analysis_text = instrument_provider('doubao', 'reduce_document_summaries')(self._chat_completion)(reduce_prompt)
+        if analysis_text:
+            print("✅ 豆包长文档分析成功")
+        return analysis_text
+    
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：丢弃父进程的线程池"""
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._vision_lock = threading.Lock()
+
+    def _get_executor(self):
+        """按需创建分段分析线程池"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=Config.DOCUMENT_MAP_WORKERS,
+                    thread_name_prefix='document-analysis'
+                )
+            return self._executor
+    
+    def _map_chat_completions(self, prompts, operation, max_tokens=1000):
+        """
+        有限并发地调用豆包，按输入顺序返回结果（失败的为None）
+        每次调用按 operation 单独记录到AI服务调用统计
+        """
+        chat_completion = partial(instrument_provider('doubao', operation)(self._chat_completion), max_tokens=max_tokens)
+        if len(prompts) == 1:
+            return [chat_completion(prompts[0])]
+        executor = self._get_executor()
+        return list(executor.map(chat_completion, prompts))
+    
+    def _chat_completion(self, prompt, max_tokens=1000, temperature=0.7):
+        """
+        调用豆包文本模型
+        
+        返回:
+        - 成功: 模型回复的文本
+        - 失败: None
+        """
+        try:
             # 构建请求数据
             data = {
-                "model": "deepseek-v3-1-250821",  # 豆包模型ID
+                "model": self.text_model,
                 "messages": [
                     {
                         "role": "user",
-                        "content": analysis_prompt
+                        "content": prompt
                     }
                 ],
-                "temperature": 0.7,
-                "max_tokens": 1000
+                "temperature": temperature,
+                "max_tokens": max_tokens
             }
             
             # 设置请求头
@@ -224,23 +465,20 @@ class DocumentProcessor:
                 'Content-Type': 'application/json'
             }
             
-            print(f"📡 正在调用豆包API分析文档...")
-            
             # 发送API请求
-            response = requests.post(
+            response = http_pool.post(
                 self.base_url,
                 json=data,
                 headers=headers,
-                timeout=self.timeout
+                timeout=self.timeout,
+                provider='doubao'
             )
             
             # 检查响应状态
             if response.status_code == 200:
                 result = response.json()
                 if 'choices' in result and len(result['choices']) > 0:
-                    analysis_text = result['choices'][0]['message']['content']
-                    print("✅ 豆包分析成功")
-                    return analysis_text
+                    return result['choices'][0]['message']['content']
                 else:
                     print("❌ 豆包响应格式错误")
                     return None
@@ -323,9 +561,10 @@ class DocumentProcessor:
             if not os.path.exists(image_path):
                 raise Exception("图片文件不存在")
             
-            # 尝试使用豆包API分析
+            # 尝试使用豆包API分析（整个分析共用一个截止时间，超时后回退到本地分析）
+            deadline = time.monotonic() + Config.ANALYZE_IMAGE_DEADLINE
             try:
-                return self._analyze_image_with_doubao(image_path)
+                return self._analyze_image_with_doubao(image_path, deadline=deadline)
             except Exception as api_error:
                 print(f"⚠️ 豆包API分析失败: {str(api_error)}")
                 print("🔄 回退到本地分析...")
@@ -339,24 +578,26 @@ class DocumentProcessor:
     def _analyze_image_local(self, image_path):
         """
         智能本地图片分析功能 - 专业版
+        只在缩小后的缩略图上计算统计量，大图也只需要很少的内存和时间
         """
         try:
             from PIL import Image
-            import colorsys
-            import numpy as np
             
             # 打开图片
             with Image.open(image_path) as img:
-                # 转换为RGB模式进行分析
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # 获取图片基本信息
+                # 获取图片基本信息（缩小之前）
                 width, height = img.size
                 format_name = img.format or "未知格式"
                 
+                # 生成用于分析的缩略图：JPEG在解码时直接按比例缩小；
+                # 先在原来的颜色模式下缩小再转换为RGB，PNG/WebP/GIF等大图不会先复制出一份全尺寸的RGB图片
+                max_edge = Config.LOCAL_ANALYSIS_MAX_EDGE
+                img.draft('RGB', (max_edge, max_edge))
+                img.thumbnail((max_edge, max_edge), Image.BILINEAR)
+                thumbnail = img.convert('RGB')
+                
                 # 智能分析图片内容
-                analysis_result = self._deep_image_analysis(img)
+                analysis_result = self._deep_image_analysis(thumbnail, width, height)
                 
                 # 生成专业的描述
                 description = f"📸 智能图片分析报告：\n\n"
@@ -371,6 +612,7 @@ class DocumentProcessor:
                 description += f"🎯 内容分析：\n"
                 description += f"• 主要特征：{analysis_result['main_features']}\n"
                 description += f"• 颜色特征：{analysis_result['color_analysis']}\n"
+                description += f"• 主要颜色：{analysis_result['dominant_colors']}\n"
                 description += f"• 构图特征：{analysis_result['composition']}\n\n"
                 
                 # 风格建议
@@ -391,23 +633,26 @@ class DocumentProcessor:
             print(f"❌ 本地图片分析失败: {str(e)}")
             raise e
     
-    def _deep_image_analysis(self, img):
+    def _deep_image_analysis(self, thumbnail, width, height):
         """
         深度图片分析
+        
+        参数:
+        - thumbnail: RGB缩略图
+        - width, height: 原图尺寸（用于构图分析）
         """
         try:
-            # 转换为numpy数组进行分析
-            img_array = np.array(img)
-            width, height = img.size
+            # 在缩略图上一次性算出所有统计量
+            stats = self._compute_image_stats(thumbnail)
             
             # 分析主要特征
-            main_features = self._analyze_main_features(img_array, width, height)
+            main_features = self._analyze_main_features(stats)
             
             # 分析颜色特征
-            color_analysis = self._analyze_color_features(img_array)
+            color_analysis = self._analyze_color_features(stats)
             
             # 分析构图特征
-            composition = self._analyze_composition(width, height, img_array)
+            composition = self._analyze_composition(width, height)
             
             # 生成风格建议
             recommended_styles = self._get_recommended_styles(main_features, color_analysis)
@@ -417,10 +662,16 @@ class DocumentProcessor:
             
             # 生成提示词建议
             prompt_suggestion = self._generate_smart_prompt(main_features, color_analysis, composition)
+            if stats['dominant_colors']:
+                english_names = ', '.join(english for _, english, _ in stats['dominant_colors'])
+                prompt_suggestion = f"{english_names} color palette, {prompt_suggestion}"
             
             return {
                 'main_features': main_features,
                 'color_analysis': color_analysis,
+                'dominant_colors': '、'.join(
+                    f"{name}({share:.0%})" for name, _, share in stats['dominant_colors']
+                ) or "颜色分布均匀",
                 'composition': composition,
                 'recommended_styles': recommended_styles,
                 'suitable_scenes': suitable_scenes,
@@ -432,23 +683,76 @@ class DocumentProcessor:
             return {
                 'main_features': "图片内容",
                 'color_analysis': "颜色特征",
+                'dominant_colors': "颜色特征",
                 'composition': "构图特征",
                 'recommended_styles': "多种风格",
                 'suitable_scenes': "通用场景",
                 'prompt_suggestion': "请描述图片内容"
             }
     
-    def _analyze_main_features(self, img_array, width, height):
-        """分析主要特征"""
+    @staticmethod
+    def _compute_image_stats(thumbnail):
+        """
+        在RGB缩略图上计算分析需要的统计量
+        
+        返回:
+        - edge_density: 平均每个像素的亮度梯度（0-255）
+        - mean_rgb: 各通道平均值
+        - brightness: 平均亮度（0-255）
+        - saturation: 平均饱和度（0-1）
+        - dominant_colors: [(中文颜色名, 英文颜色名, 占比), ...]
+        """
+        import numpy as np
+        
+        pixels = np.asarray(thumbnail, dtype=np.uint8)
+        flat = pixels.reshape(-1, 3)
+        
+        # 亮度与梯度（float32，缩略图上只有几万个像素）
+        gray = pixels.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        gradient = np.abs(np.diff(gray, axis=1)).mean() if gray.shape[1] > 1 else 0.0
+        gradient += np.abs(np.diff(gray, axis=0)).mean() if gray.shape[0] > 1 else 0.0
+        
+        # HSV饱和度：(max - min) / max
+        channel_max = flat.max(axis=1).astype(np.float32)
+        channel_min = flat.min(axis=1).astype(np.float32)
+        saturation = np.divide(channel_max - channel_min, channel_max,
+                               out=np.zeros_like(channel_max), where=channel_max > 0)
+        
+        # 主要颜色：每个通道量化到16级，用直方图统计出现最多的颜色
+        quantized = (flat >> 4).astype(np.int32)
+        bins = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+        counts = np.bincount(bins, minlength=4096)
+        total = counts.sum()
+        
+        dominant = {}
+        for index in np.argsort(counts)[::-1][:8]:
+            share = counts[index] / total
+            if share < 0.05:
+                break
+            rgb = (((index >> 8) & 15) * 16 + 8, ((index >> 4) & 15) * 16 + 8, (index & 15) * 16 + 8)
+            names = _nearest_color_name(rgb)
+            dominant[names] = dominant.get(names, 0) + share
+        dominant_colors = sorted(
+            ((names[0], names[1], share) for names, share in dominant.items()),
+            key=lambda item: item[2], reverse=True
+        )[:3]
+        
+        return {
+            'edge_density': float(gradient),
+            'mean_rgb': flat.mean(axis=0, dtype=np.float32),
+            'brightness': float(gray.mean()),
+            'saturation': float(saturation.mean()),
+            'dominant_colors': dominant_colors
+        }
+    
+    def _analyze_main_features(self, stats):
+        """分析主要特征（根据平均亮度梯度判断细节复杂度）"""
         try:
-            # 分析图片的复杂度
-            gray = np.mean(img_array, axis=2)
-            edges = np.abs(np.diff(gray, axis=1)).sum() + np.abs(np.diff(gray, axis=0)).sum()
-            complexity = edges / (width * height)
+            complexity = stats['edge_density']
             
-            if complexity > 1000:
+            if complexity > 40:
                 return "高细节复杂图片"
-            elif complexity > 500:
+            elif complexity > 15:
                 return "中等细节图片"
             else:
                 return "简洁风格图片"
@@ -456,16 +760,11 @@ class DocumentProcessor:
         except:
             return "图片内容"
     
-    def _analyze_color_features(self, img_array):
+    def _analyze_color_features(self, stats):
         """分析颜色特征"""
         try:
-            # 计算平均颜色
-            avg_color = np.mean(img_array, axis=(0, 1))
-            
-            # 分析颜色分布
-            color_std = np.std(img_array, axis=(0, 1))
-            
             # 判断主要颜色
+            avg_color = stats['mean_rgb']
             if avg_color[0] > avg_color[1] and avg_color[0] > avg_color[2]:
                 main_color = "暖色调"
             elif avg_color[1] > avg_color[0] and avg_color[1] > avg_color[2]:
@@ -474,20 +773,29 @@ class DocumentProcessor:
                 main_color = "冷色调"
             
             # 判断饱和度
-            saturation = np.mean(color_std)
-            if saturation > 50:
+            saturation = stats['saturation']
+            if saturation > 0.5:
                 saturation_desc = "高饱和度"
-            elif saturation > 25:
+            elif saturation > 0.25:
                 saturation_desc = "中等饱和度"
             else:
                 saturation_desc = "低饱和度"
             
-            return f"{main_color}, {saturation_desc}"
+            # 判断明暗
+            brightness = stats['brightness']
+            if brightness > 170:
+                brightness_desc = "明亮"
+            elif brightness > 85:
+                brightness_desc = "明暗适中"
+            else:
+                brightness_desc = "偏暗"
+            
+            return f"{main_color}, {saturation_desc}, {brightness_desc}"
             
         except:
             return "颜色特征"
     
-    def _analyze_composition(self, width, height, img_array):
+    def _analyze_composition(self, width, height):
         """分析构图特征"""
         try:
             aspect_ratio = width / height
@@ -602,155 +910,149 @@ class DocumentProcessor:
         
         return ", ".join(suggestions) if suggestions else "根据内容描述"
     
-    def _analyze_image_with_doubao(self, image_path):
+    def _analyze_image_with_doubao(self, image_path, deadline=None):
         """
-        使用豆包API分析图片 - 修复版
+        使用豆包API分析图片
+        按 Config.DOUBAO_VISION_STRATEGY 在多个视觉模型之间选择：
+        - race: 同时请求所有可用模型，谁先成功用谁
+        - sticky: 从上次成功的模型开始依次尝试，最近失败过的模型放到最后
+        
+        参数:
+        - image_path: 图片路径
+        - deadline: 整个分析的截止时间（time.monotonic()），None表示只受单次请求超时限制
         """
         try:
-            # 读取图片并转换为base64
-            import base64
-            with open(image_path, 'rb') as img_file:
-                img_data = img_file.read()
-                img_base64 = base64.b64encode(img_data).decode('utf-8')
-            
-            # 构建分析提示词
-            analysis_prompt = """请详细分析这张图片的内容，生成适合AI图像生成的描述文字。请包含以下信息：
-
-1. 主体对象：图片中的主要人物、动物、物体等
-2. 外观特征：颜色、形状、大小、材质等
-3. 动作姿态：人物的动作、表情、姿态等
-4. 环境背景：场景、背景、环境等
-5. 风格特征：艺术风格、色调、氛围等
-
-请用简洁明了的中文描述，适合作为AI图像生成的提示词。"""
+            # 读取图片并转换为data URL（同一张图片在多次尝试之间只编码一次）
+            img_data_url = encoding_cache.data_url(reference_normalizer.normalize(image_path, 'doubao'))
             
-            # 尝试多种API调用方式
-            
-            # 方式1: 使用通用模型
-            try:
-                data = {
-                    "model": "doubao-pro-32k",
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": analysis_prompt
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{img_base64}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    "max_tokens": 500,
-                    "temperature": 0.7
-                }
-                
-                headers = {
-                    'Authorization': f'Bearer {self.api_key}',
-                    'Content-Type': 'application/json'
-                }
-                
-                print(f"📡 尝试方式1: 使用doubao-pro-32k模型...")
-                response = requests.post(self.base_url, json=data, headers=headers, timeout=self.timeout)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if 'choices' in result and len(result['choices']) > 0:
-                        description = result['choices'][0]['message']['content'].strip()
-                        print(f"✅ 豆包API图片分析成功")
+            models = self._ordered_vision_models()
+            if Config.DOUBAO_VISION_STRATEGY == 'race' and len(models) > 1:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise Exception("图片分析已超时")
+                candidates = [
+                    (model, partial(self._call_vision_model, model, img_data_url, deadline))
+                    for model in models
+                ]
+                _, description = race_providers(
+                    candidates,
+                    hedge_delay=Config.DOUBAO_VISION_HEDGE_DELAY,
+                    timeout=remaining
+                )
+                if description:
+                    return description
+            else:
+                for index, model in enumerate(models, 1):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        print("⏰ 图片分析已到截止时间，停止尝试其他模型")
+                        break
+                    print(f"📡 尝试方式{index}: 使用{model}模型...")
+                    description = self._call_vision_model(model, img_data_url, deadline)
+                    if description:
                         return description
-                
-            except Exception as e:
-                print(f"⚠️ 方式1失败: {str(e)}")
             
-            # 方式2: 使用doubao-lite模型
-            try:
-                data = {
-                    "model": "doubao-lite-32k",
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": analysis_prompt
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{img_base64}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    "max_tokens": 500,
-                    "temperature": 0.7
-                }
-                
-                print(f"📡 尝试方式2: 使用doubao-lite-32k模型...")
-                response = requests.post(self.base_url, json=data, headers=headers, timeout=self.timeout)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if 'choices' in result and len(result['choices']) > 0:
-                        description = result['choices'][0]['message']['content'].strip()
-                        print(f"✅ 豆包API图片分析成功")
-                        return description
+            # 所有方式都失败
+            raise Exception("所有豆包API模型都无法使用")
                 
-            except Exception as e:
-                print(f"⚠️ 方式2失败: {str(e)}")
-            
-            # 方式3: 使用doubao-pro-4k模型
-            try:
-                data = {
-                    "model": "doubao-pro-4k",
-                    "messages": [
+        except Exception as e:
+            print(f"❌ 豆包API图片分析失败: {str(e)}")
+            raise e
+    
+    def _ordered_vision_models(self):
+        """
+        返回本次尝试的模型：上次成功的模型优先，跳过冷却期内失败过的模型
+        （所有模型都在冷却期时仍然全部尝试）
+        """
+        now = time.monotonic()
+        with self._vision_lock:
+            models = list(Config.DOUBAO_VISION_MODELS)
+            if self._last_good_vision_model in models:
+                models.remove(self._last_good_vision_model)
+                models.insert(0, self._last_good_vision_model)
+            healthy = [m for m in models if self._vision_failed_until.get(m, 0) <= now]
+            cooling = [m for m in models if self._vision_failed_until.get(m, 0) > now]
+        return healthy or cooling
+    
+    @instrument_provider('doubao', 'analyze_image')
+    def _call_vision_model(self, model, img_data_url, deadline=None):
+        """
+        用指定的视觉模型分析图片，并记录模型是否可用
+        
+        返回:
+        - 成功: 图片描述
+        - 失败: None
+        """
+        timeout = self.timeout
+        clipped = False  # 本次超时是否被整个分析的截止时间截短
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            clipped = remaining < timeout
+            timeout = min(timeout, remaining)
+        
+        data = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": IMAGE_ANALYSIS_PROMPT
+                        },
                         {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": analysis_prompt
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{img_base64}"
-                                    }
-                                }
-                            ]
+                            "type": "image_url",
+                            "image_url": {
+                                "url": img_data_url
+                            }
                         }
-                    ],
-                    "max_tokens": 500,
-                    "temperature": 0.7
+                    ]
                 }
-                
-                print(f"📡 尝试方式3: 使用doubao-pro-4k模型...")
-                response = requests.post(self.base_url, json=data, headers=headers, timeout=self.timeout)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if 'choices' in result and len(result['choices']) > 0:
-                        description = result['choices'][0]['message']['content'].strip()
-                        print(f"✅ 豆包API图片分析成功")
-                        return description
-                
-            except Exception as e:
-                print(f"⚠️ 方式3失败: {str(e)}")
+            ],
+            "max_tokens": 500,
+            "temperature": 0.7
+        }
+        
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+        
+        try:
+            response = http_pool.post(self.base_url, json=data, headers=headers, timeout=timeout, provider='doubao')
             
-            # 所有方式都失败
-            raise Exception("所有豆包API模型都无法使用")
+            if response.status_code == 200:
+                result = response.json()
+                if 'choices' in result and len(result['choices']) > 0:
+                    description = result['choices'][0]['message']['content'].strip()
+                    print(f"✅ 豆包API图片分析成功（{model}）")
+                    with self._vision_lock:
+                        self._last_good_vision_model = model
+                        self._vision_failed_until.pop(model, None)
+                    return description
+            print(f"⚠️ {model} 分析失败: HTTP {response.status_code}")
                 
+        except requests.exceptions.Timeout as e:
+            if clipped:
+                # 是调用方的时间预算用完了，而不是模型超过了自己的超时时间，不让正常但稍慢的模型进入冷却
+                print(f"⏰ {model} 在分析截止时间前没有返回，不计为模型失败")
+                return None
+            print(f"⚠️ {model} 分析失败: {str(e)}")
         except Exception as e:
-            print(f"❌ 豆包API图片分析失败: {str(e)}")
-            raise e
+            print(f"⚠️ {model} 分析失败: {str(e)}")
+        
+        # 记录失败，冷却期内其他请求会跳过这个模型
+        with self._vision_lock:
+            self._vision_failed_until[model] = time.monotonic() + Config.DOUBAO_VISION_FAILURE_COOLDOWN
+            if self._last_good_vision_model == model:
+                self._last_good_vision_model = None
+        return None
 
-# 创建全局实例
-document_processor = DocumentProcessor()
\ No newline at end of file
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from document_processor import document_processor 的写法
+def __getattr__(name):
+    if name == 'document_processor':
+        from provider_registry import providers
+        return providers.get('document')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+参考图片编码缓存
+按文件内容哈希缓存图片的Base64编码，同一张参考图片在多次重试、
+多个模型之间只读取和编码一次；data URL 在第一次需要时才生成
+"""
+
+import base64
+import threading
+from collections import OrderedDict
+from config import Config
+import fork_safety
+from image_utils import sniff_image_mime
+from upload_store import upload_store
+
+
+class EncodedImage:
+    """一张图片的Base64编码（data URL 按需生成并缓存）"""
+
+    def __init__(self, digest, mime_type, base64_data):
+        self.digest = digest
+        self.mime_type = mime_type
+        self.base64 = base64_data
+        self._data_url = None
+
+    @property
+    def data_url(self):
+        """data:<mime>;base64,... 格式的字符串"""
+        if self._data_url is None:
+            self._data_url = f'data:{self.mime_type};base64,{self.base64}'
+        return self._data_url
+
+    @property
+    def size(self):
+        """缓存占用的内存估算（Base64文本和data URL各一份）"""
+        return 2 * len(self.base64)
+
+
+class EncodingCache:
+    """
+    按内容哈希缓存的图片编码
+    总占用超过内存预算时按最近最少使用的顺序淘汰
+    """
+
+    def __init__(self, max_bytes=None):
+        """初始化编码缓存"""
+        self.max_bytes = max_bytes or Config.ENCODING_CACHE_MAX_BYTES
+        self._entries = OrderedDict()  # 内容哈希 -> EncodedImage
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, image_path):
+        """
+        获取图片的编码
+
+        返回:
+        - EncodedImage，文件不存在或读取失败时抛出异常
+        """
+        digest = upload_store.file_digest(image_path)
+        with self._lock:
+            encoded = self._entries.get(digest)
+            if encoded is not None:
+                self._entries.move_to_end(digest)
+                return encoded
+
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+        encoded = EncodedImage(
+            digest,
+            sniff_image_mime(image_data[:16]),
+            base64.b64encode(image_data).decode('utf-8')
+        )
+
+        with self._lock:
+            existing = self._entries.get(digest)
+            if existing is not None:
+                # 其他线程同时完成了编码，使用先放入的那一份
+                self._entries.move_to_end(digest)
+                return existing
+            if encoded.size <= self.max_bytes:
+                self._entries[digest] = encoded
+                self._total_bytes += encoded.size
+                self._evict()
+        return encoded
+
+    def base64(self, image_path):
+        """返回图片的Base64编码字符串"""
+        return self.get(image_path).base64
+
+    def data_url(self, image_path):
+        """返回图片的data URL"""
+        return self.get(image_path).data_url
+
+    def stats(self):
+        """返回缓存使用情况"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _evict(self):
+        """按LRU顺序淘汰直到总占用不超过预算（调用方需持有锁）"""
+        while self._entries and self._total_bytes > self.max_bytes:
+            _, encoded = self._entries.popitem(last=False)
+            self._total_bytes -= encoded.size
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁（已缓存的编码保留）"""
+        self._lock = threading.Lock()
+
+
+# 全局实例
+encoding_cache = EncodingCache()
+fork_safety.register(encoding_cache)
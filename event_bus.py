@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+进度事件总线
+图片生成任务的阶段变化（提示词增强、上传参考图、调用模型、保存图片、完成）
+和视频任务的状态变化都发布到这里，/events/<id> 通过 Server-Sent Events 推送给前端
+"""
+
+import time
+import queue
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from config import Config
+import fork_safety
+
+# 当前线程正在处理的事件频道（一般是图片生成任务ID）
+current_channel = contextvars.ContextVar('event_channel', default=None)
+
+
+class EventBus:
+    """
+    按频道划分的发布/订阅总线
+    每个频道保留最近的若干条事件，后来的订阅者会先收到这些历史事件
+    """
+
+    def __init__(self, history_size=None, retention_seconds=None, queue_size=None):
+        """初始化事件总线"""
+        self.history_size = history_size or Config.EVENT_HISTORY_SIZE
+        self.retention_seconds = retention_seconds or Config.EVENT_RETENTION_SECONDS
+        self.queue_size = queue_size or Config.EVENT_QUEUE_SIZE
+
+        self._channels = {}
+        self._listeners = []
+        self._sequence = 0
+        self._last_prune = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：父进程的频道和订阅者不属于子进程（监听器保留）"""
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def _get_channel(self, channel_id):
+        """获取（或创建）频道（调用方需持有锁）"""
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = {
+                'history': deque(maxlen=self.history_size),
+                'subscribers': set(),
+                'closed': False,
+                'updated': time.monotonic()
+            }
+            self._channels[channel_id] = channel
+        return channel
+
+    def publish(self, channel_id, event, data, final=False):
+        """
+        发布事件
+
+        参数:
+        - channel_id: 频道（图片任务ID或视频任务ID）
+        - event: 事件名称，例如 status / stage / video_status
+        - data: 事件数据（可JSON序列化的字典）
+        - final: 是否是该频道的最后一个事件（订阅者收到后结束推送）
+        """
+        if not channel_id:
+            return
+        with self._lock:
+            self._sequence += 1
+            message = {'id': self._sequence, 'event': event, 'data': data, 'final': final}
+            channel = self._get_channel(channel_id)
+            channel['history'].append(message)
+            channel['updated'] = time.monotonic()
+            if final:
+                channel['closed'] = True
+            subscribers = list(channel['subscribers'])
+            listeners = list(self._listeners)
+            self._prune()
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass
+
+        for listener in listeners:
+            try:
+                listener(channel_id, event, data)
+            except Exception as e:
+                print(f"⚠️ 事件监听器出错: {str(e)}")
+
+    def subscribe(self, channel_id):
+        """
+        订阅频道
+
+        返回:
+        - 事件队列（已经放入了频道的历史事件）
+        """
+        subscriber = queue.Queue(maxsize=self.queue_size + self.history_size)
+        with self._lock:
+            channel = self._get_channel(channel_id)
+            for message in channel['history']:
+                subscriber.put_nowait(message)
+            channel['subscribers'].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel_id, subscriber):
+        """取消订阅"""
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is not None:
+                channel['subscribers'].discard(subscriber)
+
+    def has_history(self, channel_id):
+        """频道是否已有事件"""
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            return bool(channel and channel['history'])
+
+    def add_listener(self, listener):
+        """注册一个在每次发布事件时调用的函数 listener(channel_id, event, data)"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    @contextmanager
+    def bind(self, channel_id):
+        """在当前线程（上下文）中绑定事件频道，供 report_stage 使用"""
+        token = current_channel.set(channel_id)
+        try:
+            yield
+        finally:
+            current_channel.reset(token)
+
+    def report_stage(self, stage, **info):
+        """向当前绑定的频道报告任务阶段（没有绑定频道时什么也不做）"""
+        channel_id = current_channel.get()
+        if channel_id:
+            self.publish(channel_id, 'stage', dict(info, stage=stage, timestamp=time.time()))
+
+    def _prune(self):
+        """清理没有订阅者且长时间没有更新的频道（调用方需持有锁，最多每分钟执行一次）"""
+        now = time.monotonic()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        cutoff = now - self.retention_seconds
+        for channel_id, channel in list(self._channels.items()):
+            if not channel['subscribers'] and channel['updated'] < cutoff:
+                del self._channels[channel_id]
+
+
+# 全局实例
+event_bus = EventBus()
+fork_safety.register(event_bus)
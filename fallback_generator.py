@@ -4,9 +4,41 @@
 
 import os
 import uuid
+import threading
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw
 from config import Config
+import fork_safety
+from event_bus import event_bus
+from metrics import instrument_provider, track_file_save
+from font_registry import font_registry
+
+# 根据风格选择颜色主题（支持9种专业风格）
+COLOR_THEMES = {
+    'disney': {'bg': '#FFB6C1', 'text': '#8B4513', 'accent': '#FF69B4'},
+    'anime': {'bg': '#FFA07A', 'text': '#FF4500', 'accent': '#FF1493'},
+    'watercolor': {'bg': '#E6E6FA', 'text': '#4B0082', 'accent': '#9370DB'},
+    'oilpainting': {'bg': '#DEB887', 'text': '#8B4513', 'accent': '#CD853F'},
+    'pixel': {'bg': '#32CD32', 'text': '#006400', 'accent': '#00FF00'},
+    'minimalist': {'bg': '#F5F5F5', 'text': '#2F2F2F', 'accent': '#808080'},
+    'cyberpunk': {'bg': '#1E1E1E', 'text': '#00FFFF', 'accent': '#FF00FF'},
+    'traditional_chinese': {'bg': '#F5F5DC', 'text': '#2F4F4F', 'accent': '#696969'},
+    'photography': {'bg': '#87CEEB', 'text': '#2C3E50', 'accent': '#3498DB'}
+}
+
+# 预先渲染好的底图（背景、渐变、标题、装饰元素、底部信息），(风格, 是否有参考图) -> Image
+# 所有生成器实例共享，每次请求只需要复制底图并写上描述文字
+_base_canvases = {}
+_base_canvases_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """fork之后在子进程中调用：重新创建底图缓存的锁（已渲染的底图保留）"""
+    global _base_canvases_lock
+    _base_canvases_lock = threading.Lock()
+
+
+fork_safety.register(_reset_after_fork)
 
 class FallbackImageGenerator:
     """
@@ -19,6 +51,7 @@ class FallbackImageGenerator:
         if not os.path.exists(Config.GENERATED_FOLDER):
             os.makedirs(Config.GENERATED_FOLDER)
     
+    @instrument_provider('fallback', 'generate_image', placeholder_ok=True)
     def generate_image(self, prompt, style='realistic', reference_image_path=None):
         """
         生成示例图片
@@ -41,74 +74,16 @@ class FallbackImageGenerator:
             # 如果有参考图，在生成的图片上添加提示信息
             has_reference = reference_image_path and os.path.exists(reference_image_path)
             
-            # 根据风格选择颜色主题（支持9种专业风格）
-            color_themes = {
-                'disney': {'bg': '#FFB6C1', 'text': '#8B4513', 'accent': '#FF69B4'},
-                'anime': {'bg': '#FFA07A', 'text': '#FF4500', 'accent': '#FF1493'},
-                'watercolor': {'bg': '#E6E6FA', 'text': '#4B0082', 'accent': '#9370DB'},
-                'oilpainting': {'bg': '#DEB887', 'text': '#8B4513', 'accent': '#CD853F'},
-                'pixel': {'bg': '#32CD32', 'text': '#006400', 'accent': '#00FF00'},
-                'minimalist': {'bg': '#F5F5F5', 'text': '#2F2F2F', 'accent': '#808080'},
-                'cyberpunk': {'bg': '#1E1E1E', 'text': '#00FFFF', 'accent': '#FF00FF'},
-                'traditional_chinese': {'bg': '#F5F5DC', 'text': '#2F4F4F', 'accent': '#696969'},
-                'photography': {'bg': '#87CEEB', 'text': '#2C3E50', 'accent': '#3498DB'}
-            }
+            theme = COLOR_THEMES.get(style, COLOR_THEMES['disney'])
+            font_large, font_medium, font_small = self.load_fonts()
             
-            theme = color_themes.get(style, color_themes['disney'])
-            
-            # 创建高质量图片
-            width, height = 512, 512
-            image = Image.new('RGB', (width, height), theme['bg'])
+            # 复制预先渲染好的底图，只绘制用户描述
+            image = self.get_base_canvas(style, bool(has_reference))
+            width, height = image.size
             draw = ImageDraw.Draw(image)
             
-            # 添加渐变背景效果
-            self.add_gradient_background(image, theme, style)
-            
-            # 尝试使用系统字体
-            try:
-                # macOS系统字体
-                font_large = ImageFont.truetype('/System/Library/Fonts/Arial.ttf', 36)
-                font_medium = ImageFont.truetype('/System/Library/Fonts/Arial.ttf', 24)
-                font_small = ImageFont.truetype('/System/Library/Fonts/Arial.ttf', 18)
-            except:
-                # 如果找不到系统字体，使用默认字体
-                font_large = ImageFont.load_default()
-                font_medium = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            
-            # 绘制标题
-            title = f"{self.get_style_name(style)}风格"
-            title_bbox = draw.textbbox((0, 0), title, font=font_large)
-            title_width = title_bbox[2] - title_bbox[0]
-            draw.text(((width - title_width) // 2, 50), title, fill=theme['text'], font=font_large)
-            
-            # 绘制装饰元素
-            self.draw_decorative_elements(draw, width, height, theme, style)
-            
-            # 如果有参考图，添加提示信息
-            if has_reference:
-                reference_text = "📸 参考图已加载"
-                ref_bbox = draw.textbbox((0, 0), reference_text, font=font_medium)
-                ref_width = ref_bbox[2] - ref_bbox[0]
-                draw.text(((width - ref_width) // 2, 100), reference_text, fill=theme['accent'], font=font_medium)
-            
-            # 绘制用户描述（分行显示）
-            words = prompt.split()
-            lines = []
-            current_line = ""
-            
-            for word in words:
-                test_line = current_line + word + " "
-                bbox = draw.textbbox((0, 0), test_line, font=font_medium)
-                if bbox[2] - bbox[0] < width - 40:  # 留40像素边距
-                    current_line = test_line
-                else:
-                    if current_line:
-                        lines.append(current_line.strip())
-                    current_line = word + " "
-            
-            if current_line:
-                lines.append(current_line.strip())
+            # 绘制用户描述（分行显示，中文按字换行，留40像素边距）
+            lines = font_registry.wrap_text(prompt, font_medium, width - 40)
             
             # 显示描述文字
             start_y = (height // 2 - len(lines) * 15) + (50 if has_reference else 0)
@@ -117,16 +92,13 @@ class FallbackImageGenerator:
                 line_width = bbox[2] - bbox[0]
                 draw.text(((width - line_width) // 2, start_y + i * 30), line, fill=theme['text'], font=font_medium)
             
-            # 绘制底部信息
-            footer = "AI制图工作室 - 示例模式"
-            footer_bbox = draw.textbbox((0, 0), footer, font=font_small)
-            footer_width = footer_bbox[2] - footer_bbox[0]
-            draw.text(((width - footer_width) // 2, height - 40), footer, fill=theme['accent'], font=font_small)
-            
-            # 保存图片
+            # 保存图片（示例图片颜色简单，用较低的压缩级别换取更快的编码速度）
+            event_bus.report_stage('saving', provider='fallback')
             filename = self.generate_filename(prompt)
             filepath = os.path.join(Config.GENERATED_FOLDER, filename)
-            image.save(filepath, 'PNG')
+            with track_file_save('generated') as stats:
+                image.save(filepath, 'PNG', compress_level=1)
+                stats['bytes'] = os.path.getsize(filepath)
             
             print(f"✅ 示例图片已生成: {filepath}")
             return filepath
@@ -135,6 +107,67 @@ class FallbackImageGenerator:
             print(f"❌ 示例图片生成失败: {str(e)}")
             return None
     
+    @staticmethod
+    def load_fonts():
+        """获取大、中、小三种字号的字体（字体文件在进程启动时查找一次）"""
+        return font_registry.get(36), font_registry.get(24), font_registry.get(18)
+    
+    def get_base_canvas(self, style, has_reference):
+        """
+        获取某个风格的底图副本（第一次使用时渲染并缓存）
+        
+        返回:
+            可以直接在上面绘制的底图副本
+        """
+        # 未知风格的底图都一样，共用一个缓存条目（避免任意风格参数让缓存无限增长）
+        if style not in COLOR_THEMES:
+            style = None
+        key = (style, has_reference)
+        with _base_canvases_lock:
+            canvas = _base_canvases.get(key)
+        if canvas is None:
+            canvas = self.render_base_canvas(style, has_reference)
+            with _base_canvases_lock:
+                canvas = _base_canvases.setdefault(key, canvas)
+        return canvas.copy()
+    
+    def render_base_canvas(self, style, has_reference):
+        """渲染与描述文字无关的部分：背景、渐变、标题、装饰元素、参考图提示和底部信息"""
+        theme = COLOR_THEMES.get(style, COLOR_THEMES['disney'])
+        font_large, font_medium, font_small = self.load_fonts()
+        
+        # 创建高质量图片
+        width, height = 512, 512
+        image = Image.new('RGB', (width, height), theme['bg'])
+        draw = ImageDraw.Draw(image)
+        
+        # 添加渐变背景效果
+        self.add_gradient_background(image, theme, style)
+        
+        # 绘制标题
+        title = f"{self.get_style_name(style)}风格"
+        title_bbox = draw.textbbox((0, 0), title, font=font_large)
+        title_width = title_bbox[2] - title_bbox[0]
+        draw.text(((width - title_width) // 2, 50), title, fill=theme['text'], font=font_large)
+        
+        # 绘制装饰元素
+        self.draw_decorative_elements(draw, width, height, theme, style)
+        
+        # 如果有参考图，添加提示信息
+        if has_reference:
+            reference_text = "📸 参考图已加载"
+            ref_bbox = draw.textbbox((0, 0), reference_text, font=font_medium)
+            ref_width = ref_bbox[2] - ref_bbox[0]
+            draw.text(((width - ref_width) // 2, 100), reference_text, fill=theme['accent'], font=font_medium)
+        
+        # 绘制底部信息
+        footer = "AI制图工作室 - 示例模式"
+        footer_bbox = draw.textbbox((0, 0), footer, font=font_small)
+        footer_width = footer_bbox[2] - footer_bbox[0]
+        draw.text(((width - footer_width) // 2, height - 40), footer, fill=theme['accent'], font=font_small)
+        
+        return image
+    
     def draw_decorative_elements(self, draw, width, height, theme, style):
         """绘制装饰元素（支持9种风格）"""
         
@@ -207,22 +240,15 @@ class FallbackImageGenerator:
     def add_gradient_background(self, image, theme, style):
         """添加渐变背景效果"""
         width, height = image.size
-        pixels = image.load()
         
         # 根据风格选择渐变方向和效果
         if style in ['disney', 'anime']:
-            # 从上到下的温暖渐变
-            for y in range(height):
-                ratio = y / height
-                # 简化的渐变计算
-                if y < height // 3:
-                    # 上部分保持原色
-                    continue
-                elif y > 2 * height // 3:
-                    # 下部分稍微暗一些
-                    for x in range(width):
-                        r, g, b = pixels[x, y]
-                        pixels[x, y] = (max(0, r-20), max(0, g-20), max(0, b-20))
+            # 从上到下的温暖渐变：上部分保持原色，下部分稍微暗一些
+            box = (0, 2 * height // 3 + 1, width, height)
+            lower = image.crop(box)
+            # ImageChops.subtract 按通道相减并截断到0，一次处理整块区域
+            darker = ImageChops.subtract(lower, Image.new('RGB', lower.size, (20, 20, 20)))
+            image.paste(darker, box)
         
         elif style == 'cyberpunk':
             # 添加扫描线效果
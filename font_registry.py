@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+字体注册表与文字排版
+进程启动时找一次可用的字体（优先支持中文的字体），按字号缓存字体对象；
+排版时逐字测量宽度并缓存，中文按字换行，英文按单词换行
+"""
+
+import os
+import threading
+from PIL import ImageFont
+from config import Config
+import fork_safety
+
+# 候选字体（按优先级排列）：先找支持中文的字体，再找常见的西文字体
+FONT_CANDIDATES = [
+    # Linux 中文字体
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+    '/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc',
+    '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',
+    # macOS 中文字体
+    '/System/Library/Fonts/PingFang.ttc',
+    '/System/Library/Fonts/STHeiti Light.ttc',
+    '/System/Library/Fonts/Hiragino Sans GB.ttc',
+    '/Library/Fonts/Arial Unicode.ttf',
+    '/System/Library/Fonts/Supplemental/Arial Unicode.ttf',
+    # Windows 中文字体
+    'C:/Windows/Fonts/msyh.ttc',
+    'C:/Windows/Fonts/simhei.ttf',
+    # 西文字体
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+    '/System/Library/Fonts/Supplemental/Arial.ttf',
+    '/System/Library/Fonts/Arial.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+]
+
+
+def is_cjk(char):
+    """是否是可以在任意位置换行的中日韩字符（含全角标点）"""
+    code = ord(char)
+    return (
+        0x2E80 <= code <= 0x9FFF      # 中日韩部首、标点、假名、汉字
+        or 0xAC00 <= code <= 0xD7AF   # 韩文
+        or 0xF900 <= code <= 0xFAFF   # 兼容汉字
+        or 0xFF00 <= code <= 0xFFEF   # 全角字符
+        or 0x20000 <= code <= 0x2FFFF  # 扩展汉字
+    )
+
+
+class FontRegistry:
+    """
+    进程内共享的字体注册表
+    字体文件只查找一次，每个字号的字体对象只加载一次
+    """
+
+    def __init__(self, candidates=None):
+        """初始化注册表并查找可用字体"""
+        configured = Config.FALLBACK_FONT_PATH
+        self.candidates = ([configured] if configured else []) + list(candidates or FONT_CANDIDATES)
+        self.font_path = self._resolve()
+        self._fonts = {}
+        self._glyph_widths = {}  # (字体文件, 字号) -> {字符: 宽度}
+        self._lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁（已加载的字体保留）"""
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        """找到第一个存在且能被Pillow加载的字体文件"""
+        for path in self.candidates:
+            if path and os.path.exists(path):
+                try:
+                    ImageFont.truetype(path, 12)
+                    print(f"🔤 示例图片使用字体: {path}")
+                    return path
+                except OSError:
+                    continue
+        print("⚠️ 没有找到可用的TrueType字体，使用Pillow默认字体")
+        return None
+
+    def get(self, size):
+        """获取指定字号的字体（加载后缓存）"""
+        font = self._fonts.get(size)
+        if font is None:
+            with self._lock:
+                font = self._fonts.get(size)
+                if font is None:
+                    font = self._load(size)
+                    self._fonts[size] = font
+        return font
+
+    def _load(self, size):
+        """加载字体，没有可用字体时使用Pillow默认字体"""
+        if self.font_path:
+            return ImageFont.truetype(self.font_path, size)
+        try:
+            # Pillow 10.1+ 的默认字体支持设置字号
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            return ImageFont.load_default()
+
+    def measure(self, text, font):
+        """
+        测量文字宽度：逐字查缓存累加（不考虑字距调整，用于换行判断足够准确）
+        """
+        key = (getattr(font, 'path', None), getattr(font, 'size', None)) if hasattr(font, 'path') else id(font)
+        widths = self._glyph_widths.setdefault(key, {})
+        total = 0
+        for char in text:
+            width = widths.get(char)
+            if width is None:
+                width = font.getlength(char)
+                widths[char] = width
+            total += width
+        return total
+
+    def wrap_text(self, text, font, max_width):
+        """
+        把文字按最大宽度分成多行
+        中日韩字符之间可以换行，西文按单词换行，超长的单词按字符切开
+
+        返回:
+            行列表
+        """
+        lines = []
+        current = []
+        current_width = 0
+
+        for token in self._tokenize(text):
+            if token == '\n':
+                lines.append(''.join(current).strip())
+                current, current_width = [], 0
+                continue
+
+            token_width = self.measure(token, font)
+            if current and current_width + token_width > max_width:
+                lines.append(''.join(current).strip())
+                current, current_width = [], 0
+                if token.isspace():
+                    continue
+
+            if token_width > max_width:
+                # 单个单词比整行还宽：按字符切开
+                for char in token:
+                    char_width = self.measure(char, font)
+                    if current and current_width + char_width > max_width:
+                        lines.append(''.join(current).strip())
+                        current, current_width = [], 0
+                    current.append(char)
+                    current_width += char_width
+                continue
+
+            current.append(token)
+            current_width += token_width
+
+        if current:
+            lines.append(''.join(current).strip())
+        return [line for line in lines if line]
+
+    @staticmethod
+    def _tokenize(text):
+        """把文字切成可以换行的片段：单个中日韩字符、西文单词、空白、换行符"""
+        word = []
+        for char in text:
+            if char == '\n' or char.isspace() or is_cjk(char):
+                if word:
+                    yield ''.join(word)
+                    word = []
+                yield '\n' if char == '\n' else (' ' if char.isspace() else char)
+            else:
+                word.append(char)
+        if word:
+            yield ''.join(word)
+
+
+# 全局实例（导入时查找一次字体）
+font_registry = FontRegistry()
+fork_safety.register(font_registry)
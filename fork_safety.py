@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+fork后的状态重置
+gunicorn 开启 preload_app 时会在主进程中导入应用，然后fork出工作进程。子进程只保留执行fork的那一个线程：
+父进程其他线程当时持有的锁在子进程里永远不会被释放，线程池的工作线程、后台线程也都不存在，
+继承来的连接socket还和父进程共用。模块级的单例通过 register 登记，fork之后在子进程中统一调用
+它们的 _reset_after_fork，重新创建锁、丢弃线程池和连接（之后按需重新创建）。
+serve.py 默认不开启 preload_app，工作进程各自导入应用，这些钩子不会被调用
+"""
+
+import os
+
+# fork之后需要在子进程中调用的重置函数（按登记顺序）
+_resets = []
+
+
+def register(obj):
+    """
+    登记一个需要在fork后重置的对象
+
+    参数:
+    - obj: 带有 _reset_after_fork 方法的对象，或者一个无参函数
+
+    返回:
+    - obj 本身（方便在创建全局实例时直接使用）
+    """
+    _resets.append(getattr(obj, '_reset_after_fork', obj))
+    return obj
+
+
+def _reset_all():
+    """在fork出的子进程中调用所有登记的重置函数"""
+    for reset in _resets:
+        reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_all)
@@ -7,7 +7,8 @@ Google Gemini AI图像生成器
 """
 
 import os
-from fallback_generator import FallbackImageGenerator
+from provider_registry import providers
+from metrics import instrument_provider
 
 class GeminiImageGenerator:
     """
@@ -18,8 +19,13 @@ class GeminiImageGenerator:
     def __init__(self):
         """初始化Gemini图像生成器"""
         print("🤖 Google Gemini AI图像生成器初始化完成")
-        self.fallback = FallbackImageGenerator()
+    
+    @property
+    def fallback(self):
+        """用来模拟生成的备用生成器（和其他生成器共用同一个实例）"""
+        return providers.get('fallback')
         
+    @instrument_provider('gemini', 'generate_image', placeholder_ok=True)
     def generate_image(self, prompt, style=None, reference_image_path=None):
         """
         生成图像的主函数
@@ -57,8 +63,13 @@ class GeminiImageGenerator:
             'message': 'Gemini模拟器运行正常（使用备用生成器）'
         }
 
-# 全局实例
-gemini_generator = GeminiImageGenerator()
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from gemini_image_generator import gemini_generator 的写法
+def __getattr__(name):
+    if name == 'gemini_generator':
+        from provider_registry import providers
+        return providers.get('gemini')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 
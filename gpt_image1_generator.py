@@ -5,6 +5,12 @@ import requests
 import base64
 import os
 from config import Config
+from http_client import http_pool
+from event_bus import event_bus
+from metrics import instrument_provider
+from encoding_cache import encoding_cache
+from reference_normalizer import reference_normalizer
+from image_utils import save_image_bytes
 
 class GPTImage1Generator:
     """
@@ -53,12 +59,10 @@ class GPTImage1Generator:
     
     def image_file_to_base64(self, image_path):
         """
-        将本地图片文件转换为base64编码
+        将本地图片文件转换为base64编码（同一张图片只编码一次）
         """
         try:
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
-            return base64.b64encode(image_data).decode('utf-8')
+            return encoding_cache.base64(image_path)
         except Exception as e:
             print(f"图片文件转换base64失败: {str(e)}")
             return None
@@ -68,7 +72,7 @@ class GPTImage1Generator:
         从URL获取图片并转换为base64编码
         """
         try:
-            response = requests.get(image_url, timeout=30)
+            response = http_pool.get(image_url, timeout=30)
             response.raise_for_status()
             image_data = response.content
             return base64.b64encode(image_data).decode('utf-8')
@@ -76,6 +80,7 @@ class GPTImage1Generator:
             print(f"图片URL转换base64失败: {str(e)}")
             return None
     
+    @instrument_provider('gpt_image1', 'generate_image')
     def generate_image(self, prompt, style=None, reference_image_path=None):
         """
         使用GPT Image 1生成图片
@@ -95,56 +100,20 @@ class GPTImage1Generator:
             print(f"   风格: {style if style else '默认'}")
             print(f"   参考图: {'有' if reference_image_path else '无'}")
             
-            # 构建增强的prompt
-            enhanced_prompt = prompt
-            
-            # 添加风格信息到prompt中
-            if style:
-                from config import Config
-                style_config = Config.get_style_config(style)
-                if style_config and 'prompt_suffix' in style_config:
-                    enhanced_prompt += style_config['prompt_suffix']
-                    print(f"   增强描述: {enhanced_prompt}")
-            
-            # 构建请求数据 - 恢复GPT Image 1原始格式
-            data = {
-                "prompt": enhanced_prompt,
-                "size": "auto",
-                "quality": "auto", 
-                "moderation": "auto",
-                "background": "opaque",
-                "output_compression": 100,
-                "output_format": "png"
-            }
-            
-            # 处理参考图片 - 使用GPT Image 1的原始格式
-            if reference_image_path:
-                try:
-                    # 将参考图片转换为base64
-                    reference_image_base64 = self.image_file_to_base64(reference_image_path)
-                    if reference_image_base64:
-                        # 使用GPT Image 1的原始字段格式
-                        data["reference_images"] = [reference_image_base64]
-                        print(f"   已添加参考图片到请求中 (使用GPT Image 1原始格式)")
-                    else:
-                        print(f"   ⚠️ 参考图片转换失败，继续使用纯文本生成")
-                except Exception as e:
-                    print(f"   ⚠️ 处理参考图片时出错: {str(e)}，继续使用纯文本生成")
-            
-            # 设置请求头
-            headers = {
-                'x-api-key': self.api_key,
-                'Content-Type': 'application/json'
-            }
+            # 构建请求数据和请求头
+            data = self._build_request_data(prompt, style, reference_image_path)
+            headers = self._headers()
             
             print(f"📡 正在调用GPT Image 1 API...")
+            event_bus.report_stage('calling_provider', provider='gpt_image1')
             
             # 发送API请求
-            response = requests.post(
+            response = http_pool.post(
                 self.base_url,
                 json=data,
                 headers=headers,
-                timeout=self.timeout
+                timeout=self.timeout,
+                provider='gpt_image1'
             )
             
             # 检查响应状态
@@ -152,6 +121,7 @@ class GPTImage1Generator:
                 print("✅ GPT Image 1 API调用成功")
                 
                 # 保存生成的图片
+                event_bus.report_stage('saving', provider='gpt_image1')
                 generated_image_path = self._save_generated_image(response.content)
                 
                 if generated_image_path:
@@ -175,6 +145,58 @@ class GPTImage1Generator:
             print(f"💥 GPT Image 1生成过程中出现错误: {str(e)}")
             return None
     
+    def _build_request_data(self, prompt, style=None, reference_image_path=None):
+        """
+        构建GPT Image 1请求数据（同步和异步接口共用）
+        参考图片会先预处理再转换为base64
+        """
+        # 构建增强的prompt
+        enhanced_prompt = prompt
+
+        # 添加风格信息到prompt中
+        if style:
+            from config import Config
+            style_config = Config.get_style_config(style)
+            if style_config and 'prompt_suffix' in style_config:
+                enhanced_prompt += style_config['prompt_suffix']
+                print(f"   增强描述: {enhanced_prompt}")
+
+        # 构建请求数据 - 恢复GPT Image 1原始格式
+        data = {
+            "prompt": enhanced_prompt,
+            "size": "auto",
+            "quality": "auto", 
+            "moderation": "auto",
+            "background": "opaque",
+            "output_compression": 100,
+            "output_format": "png"
+        }
+
+        # 处理参考图片 - 使用GPT Image 1的原始格式
+        if reference_image_path:
+            try:
+                # 将参考图片转换为base64
+                event_bus.report_stage('uploading_reference', provider='gpt_image1')
+                normalized_path = reference_normalizer.normalize(reference_image_path, 'gpt_image1')
+                reference_image_base64 = self.image_file_to_base64(normalized_path)
+                if reference_image_base64:
+                    # 使用GPT Image 1的原始字段格式
+                    data["reference_images"] = [reference_image_base64]
+                    print(f"   已添加参考图片到请求中 (使用GPT Image 1原始格式)")
+                else:
+                    print(f"   ⚠️ 参考图片转换失败，继续使用纯文本生成")
+            except Exception as e:
+                print(f"   ⚠️ 处理参考图片时出错: {str(e)}，继续使用纯文本生成")
+
+        return data
+    
+    def _headers(self):
+        """GPT Image 1请求头"""
+        return {
+            'x-api-key': self.api_key,
+            'Content-Type': 'application/json'
+        }
+    
     def _save_generated_image(self, image_data):
         """
         保存生成的图片到本地文件
@@ -190,26 +212,23 @@ class GPTImage1Generator:
             import uuid
             from datetime import datetime
             
-            # 确保生成图片目录存在
-            generated_folder = Config.GENERATED_FOLDER
-            if not os.path.exists(generated_folder):
-                os.makedirs(generated_folder)
-            
             # 生成唯一的文件名
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             unique_id = str(uuid.uuid4())[:8]
-            filename = f"gpt_image1_{timestamp}_{unique_id}.png"
-            file_path = os.path.join(generated_folder, filename)
-            
-            # 保存图片文件
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
+            filename = f"gpt_image1_{timestamp}_{unique_id}"
+            base_path = os.path.join(Config.GENERATED_FOLDER, filename)
             
-            return file_path
+            # 保存图片文件（先检查文件头确认是图片，扩展名按实际格式确定）
+            return save_image_bytes(image_data, base_path)
             
         except Exception as e:
             print(f"💾 保存GPT Image 1生成图片失败: {str(e)}")
             return None
 
-# 创建全局实例
-gpt_image1_generator = GPTImage1Generator()
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from gpt_image1_generator import gpt_image1_generator 的写法
+def __getattr__(name):
+    if name == 'gpt_image1_generator':
+        from provider_registry import providers
+        return providers.get('gpt_image1')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AI服务健康检查
+每个服务按自己的间隔在后台检查（调用各生成器的 test_connection），
+保存最近一次的结果、检查时间和耗时；/api-status 直接读取内存中的结果，不再在请求里访问上游
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import Config
+import fork_safety
+from provider_registry import providers
+
+
+def _provider_check(name):
+    """生成一个调用指定生成器 test_connection 的检查函数"""
+    def _check():
+        return providers.get(name).test_connection()
+    return _check
+
+
+def _openrouter_check():
+    """
+    OpenRouter默认只检查密钥格式：在线检查会发送一次付费的对话请求，
+    每个工作进程都在后台定时执行，只在开启 HEALTH_CHECK_OPENROUTER_LIVE 时使用
+    """
+    if Config.HEALTH_CHECK_OPENROUTER_LIVE:
+        return providers.get('openrouter').test_connection()
+    if Config.OPENROUTER_API_KEY and Config.OPENROUTER_API_KEY.startswith('sk-or-v1-'):
+        return {'success': True, 'message': 'OpenRouter API密钥已配置（未在线检查）'}
+    return {'success': False, 'error': 'OpenRouter API密钥未设置或格式不正确'}
+
+
+def _ark_check():
+    """ARK视频服务只检查密钥是否已设置"""
+    if Config.validate_token():
+        return {'success': True, 'message': 'ByteDance ARK API已配置'}
+    return {'success': False, 'error': '需要设置ByteDance API密钥'}
+
+
+# 默认检查项：名称 -> 检查函数（返回 test_connection 格式的字典）
+DEFAULT_CHECKS = {
+    'gemini': _provider_check('gemini'),
+    'segmind': _provider_check('segmind'),
+    'gpt_image1': _provider_check('gpt_image1'),
+    'openrouter': _openrouter_check,
+    'doubao_document': _provider_check('document'),
+    'bytedance': _ark_check,
+}
+
+
+class HealthChecker:
+    """
+    后台健康检查器
+    一个调度线程负责安排到期的检查，检查本身在小线程池中执行，慢的检查不会拖住其他服务
+    """
+
+    def __init__(self, checks=None, default_interval=None, intervals=None, max_workers=None):
+        """初始化检查器（后台线程在 start 时启动）"""
+        self.default_interval = default_interval or Config.HEALTH_CHECK_INTERVAL
+        self.intervals = intervals if intervals is not None else Config.HEALTH_CHECK_INTERVALS
+        self.max_workers = max_workers or Config.HEALTH_CHECK_WORKERS
+
+        self._checks = {}   # 名称 -> 检查项状态
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = None
+
+        for name, check in (DEFAULT_CHECKS if checks is None else checks).items():
+            self.register(name, check)
+
+    def register(self, name, check, interval=None):
+        """登记一个检查项（立即安排第一次检查）"""
+        with self._cond:
+            self._checks[name] = {
+                'check': check,
+                'interval': interval or self.intervals.get(name, self.default_interval),
+                'next_run': time.monotonic(),
+                'running': False,
+                'result': None,   # 最近一次检查结果
+            }
+            self._cond.notify_all()
+
+    def start(self):
+        """启动后台检查线程（重复调用没有影响）"""
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True, name='health-checker')
+                self._thread.start()
+
+    def is_running(self):
+        """后台检查线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _get_executor(self):
+        """按需创建执行检查的线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='health-check')
+        return self._executor
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：检查线程没有被继承，由 create_app 重新启动"""
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = None
+        for item in self._checks.values():
+            item['running'] = False
+
+    def _loop(self):
+        """后台调度主循环"""
+        while True:
+            with self._cond:
+                due = self._collect_due()
+                if not due:
+                    self._cond.wait(self._seconds_until_next_run())
+                    continue
+
+            executor = self._get_executor()
+            for name in due:
+                executor.submit(self._run, name)
+
+    def _collect_due(self):
+        """找出到期的检查项并标记为运行中（调用方需持有锁）"""
+        now = time.monotonic()
+        due = []
+        for name, item in self._checks.items():
+            if not item['running'] and item['next_run'] <= now:
+                item['running'] = True
+                due.append(name)
+        return due
+
+    def _seconds_until_next_run(self):
+        """距离下一次检查的时间（调用方需持有锁）"""
+        pending = [item['next_run'] for item in self._checks.values() if not item['running']]
+        if not pending:
+            return self.default_interval
+        return max(0.05, min(pending) - time.monotonic())
+
+    def _run(self, name):
+        """执行一次检查并保存结果"""
+        with self._cond:
+            item = self._checks.get(name)
+        if item is None:
+            return
+
+        started = time.monotonic()
+        try:
+            result = item['check']()
+        except Exception as e:
+            result = {'success': False, 'error': f'健康检查出错: {str(e)}'}
+        latency = time.monotonic() - started
+
+        with self._cond:
+            item['result'] = {
+                'success': bool(result.get('success')),
+                'message': result.get('message', result.get('error', '')),
+                'checked_at': datetime.now().isoformat(),
+                'checked_monotonic': time.monotonic(),
+                'latency_ms': round(latency * 1000, 1),
+            }
+            item['running'] = False
+            item['next_run'] = time.monotonic() + item['interval']
+            self._cond.notify_all()
+
+        if not result.get('success'):
+            print(f"⚠️ 健康检查 {name} 未通过: {item['result']['message']}")
+
+    def run_due(self):
+        """
+        在当前线程中执行所有到期的检查（没有启动后台线程时，由 /api-status 按需调用）
+        结果同样按各自的间隔缓存
+        """
+        with self._cond:
+            due = self._collect_due()
+        for name in due:
+            self._run(name)
+
+    def refresh(self, name=None):
+        """让指定检查项（默认全部）尽快重新检查"""
+        with self._cond:
+            for check_name, item in self._checks.items():
+                if name is None or check_name == name:
+                    item['next_run'] = time.monotonic()
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """
+        返回所有检查项最近一次的结果
+        还没有完成第一次检查的项 result 为None；结果超过检查间隔的 STALE_FACTOR 倍时标记为过期
+        """
+        now = time.monotonic()
+        snapshot = {}
+        with self._cond:
+            for name, item in self._checks.items():
+                result = dict(item['result']) if item['result'] else None
+                if result:
+                    age = now - result.pop('checked_monotonic')
+                    result['age_seconds'] = round(age, 1)
+                    result['stale'] = age > item['interval'] * Config.HEALTH_CHECK_STALE_FACTOR
+                snapshot[name] = {'interval': item['interval'], 'result': result}
+        return snapshot
+
+
+# 全局实例
+health_checker = HealthChecker()
+fork_safety.register(health_checker)
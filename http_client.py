@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+共享HTTP连接池
+所有AI服务客户端（Segmind、OpenRouter、豆包ARK等）通过这里发送请求，
+同一个域名复用同一个keep-alive会话，避免每次生成都重新进行TCP+TLS握手
+"""
+
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+import fork_safety
+from circuit_breaker import circuit_breakers, CircuitOpenError
+from metrics import record_upstream, body_size, content_length
+
+
+class HTTPSessionPool:
+    """
+    按域名划分的线程安全会话池
+    每个域名一个 requests.Session，底层由 urllib3 连接池负责并发复用连接
+    """
+
+    def __init__(self, pool_sizes=None, default_pool_size=None):
+        """初始化会话池（会话在第一次访问对应域名时创建）"""
+        self.pool_sizes = pool_sizes if pool_sizes is not None else Config.HTTP_POOL_SIZES
+        self.default_pool_size = default_pool_size or Config.HTTP_DEFAULT_POOL_SIZE
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self, host):
+        """为指定域名创建带连接池的会话"""
+        pool_size = self.pool_sizes.get(host, self.default_pool_size)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=0,
+            pool_block=False
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Connection': 'keep-alive'})
+        return session
+
+    def get_session(self, url):
+        """获取URL所属域名的共享会话"""
+        host = urlsplit(url).netloc.lower()
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._create_session(host)
+                self._sessions[host] = session
+            return session
+
+    def request(self, method, url, provider=None, **kwargs):
+        """
+        通过共享会话发送请求，参数与 requests.request 相同
+
+        指定 provider 时会经过该服务的熔断器：熔断期间直接抛出 CircuitOpenError，
+        否则根据请求结果（超时、网络错误、5xx/429）更新熔断器统计；
+        每个请求的状态、耗时和收发字节数都会记录到运行指标
+        """
+        started = time.perf_counter()
+        try:
+            response = self._send(method, url, provider, **kwargs)
+        except Exception as e:
+            record_upstream(provider, method, type(e).__name__, time.perf_counter() - started)
+            raise
+
+        record_upstream(
+            provider, method, response.status_code, time.perf_counter() - started,
+            sent_bytes=body_size(getattr(response.request, 'body', None)),
+            received_bytes=content_length(response.headers)
+        )
+        return response
+
+    def _send(self, method, url, provider=None, **kwargs):
+        """发送请求并更新熔断器统计"""
+        session = self.get_session(url)
+        if not provider:
+            return session.request(method, url, **kwargs)
+
+        breaker = circuit_breakers.get(provider)
+        ticket = breaker.allow_request()
+        if not ticket:
+            raise CircuitOpenError(f'{provider} 服务熔断中，已跳过请求')
+
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.Timeout:
+            breaker.record_failure(timeout=True, ticket=ticket)
+            raise
+        except BaseException:
+            breaker.record_failure(ticket=ticket)
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure(ticket=ticket)
+        else:
+            breaker.record_success(ticket=ticket)
+        return response
+
+    def get(self, url, **kwargs):
+        """发送GET请求"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """发送POST请求"""
+        return self.request('POST', url, **kwargs)
+
+    def prewarm(self, urls=None, timeout=5):
+        """
+        预热连接：在后台对各服务域名发起一次轻量请求，
+        让第一次真正的生成请求可以直接复用已建立的TLS连接
+        """
+        urls = urls if urls is not None else Config.HTTP_PREWARM_URLS
+
+        def _warm(url):
+            try:
+                self.request('HEAD', url, timeout=timeout, allow_redirects=False)
+                print(f"🔥 连接预热完成: {urlsplit(url).netloc}")
+            except Exception as e:
+                print(f"⚠️ 连接预热失败 {urlsplit(url).netloc}: {str(e)}")
+
+        for url in urls:
+            threading.Thread(target=_warm, args=(url,), daemon=True, name='http-prewarm').start()
+
+    def close(self):
+        """关闭所有会话及其连接"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _reset_after_fork(self):
+        """
+        fork之后在子进程中调用：丢弃继承来的会话
+        不能关闭它们，否则会影响父进程仍在使用的同一批socket
+        """
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+
+# 全局实例
+http_pool = HTTPSessionPool()
+fork_safety.register(http_pool)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+图片文件工具函数
+根据文件头判断图片格式（不依赖文件扩展名），并把AI服务返回的图片原样保存到磁盘
+"""
+
+import os
+import itertools
+from io import BytesIO
+
+from metrics import track_file_save
+
+# 文件头 -> (MIME类型, 扩展名)
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'GIF87a', 'image/gif', '.gif'),
+    (b'GIF89a', 'image/gif', '.gif'),
+    (b'BM', 'image/bmp', '.bmp'),
+)
+
+
+def sniff_image_type(header):
+    """
+    根据文件开头的字节判断图片格式
+
+    参数:
+    - header: 文件开头至少12个字节
+
+    返回:
+    - (MIME类型, 扩展名)，无法识别时返回 (None, None)
+    """
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    for signature, mime_type, extension in _SIGNATURES:
+        if header.startswith(signature):
+            return mime_type, extension
+    return None, None
+
+
+def sniff_image_mime(header, default='image/jpeg'):
+    """根据文件开头的字节返回图片的MIME类型，无法识别时返回 default"""
+    return sniff_image_type(header)[0] or default
+
+
+def _atomic_write(path, chunks):
+    """把数据块依次写入临时文件，写完后原子地替换为目标文件"""
+    tmp_path = f'{path}.tmp'
+    try:
+        with track_file_save('generated') as stats:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    stats['bytes'] += len(chunk)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def _reencode(image_data, base_path, transform=None):
+    """解码图片（可选做变换）后重新编码为PNG，只在确实需要时使用"""
+    from PIL import Image
+
+    image = Image.open(BytesIO(image_data))
+    if transform is not None:
+        image = transform(image)
+    path = base_path + '.png'
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return _atomic_write(path, [buffer.getvalue()])
+
+
+def save_image_bytes(image_data, base_path, transform=None):
+    """
+    把AI服务返回的已编码图片直接写入磁盘（不解码、不重新编码）
+
+    参数:
+    - image_data: 图片的二进制数据
+    - base_path: 不含扩展名的目标路径，扩展名根据文件头确定
+    - transform: 可选的图片变换函数 f(PIL.Image) -> PIL.Image；只有提供时才会解码图片
+
+    返回:
+    - 保存的文件路径
+
+    异常:
+    - ValueError: 数据不是图片
+    """
+    os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+    _, extension = sniff_image_type(image_data[:16])
+    if transform is not None or extension is None:
+        # 需要变换，或者是文件头无法识别的格式（交给Pillow判断），才解码
+        try:
+            return _reencode(image_data, base_path, transform)
+        except Exception as e:
+            raise ValueError(f'返回的数据不是有效的图片: {str(e)}')
+    return _atomic_write(base_path + extension, [image_data])
+
+
+def save_image_chunks(chunks, base_path):
+    """
+    把分块到达的图片数据依次写入磁盘，不在内存中保存完整内容
+
+    参数:
+    - chunks: 依次产生图片数据块（bytes）的迭代器
+    - base_path: 不含扩展名的目标路径，扩展名根据文件头确定
+
+    返回:
+    - 保存的文件路径
+
+    异常:
+    - ValueError: 下载的内容不是图片
+    """
+    chunks = iter(chunks)
+    # 读到足够判断格式的文件头
+    header = b''
+    for chunk in chunks:
+        header += chunk
+        if len(header) >= 16:
+            break
+
+    _, extension = sniff_image_type(header[:16])
+    if extension is None:
+        # 无法从文件头识别的格式：读完整内容交给Pillow处理
+        return save_image_bytes(header + b''.join(chunks), base_path)
+
+    os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+    return _atomic_write(base_path + extension, itertools.chain([header], chunks))
+
+
+def stream_image_to_file(response, base_path, chunk_size=64 * 1024):
+    """
+    把图片下载响应（requests 的 stream=True 响应）分块写入磁盘，参数和返回值同 save_image_chunks
+
+    参数:
+    - response: 以 stream=True 发起的请求响应（写完后关闭）
+    """
+    try:
+        return save_image_chunks(response.iter_content(chunk_size=chunk_size), base_path)
+    finally:
+        response.close()
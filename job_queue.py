@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+图片生成任务队列
+/generate 接口把生成任务放进有界的后台线程池，立即返回任务ID；
+前端通过 /jobs/<id> 查询任务状态（queued / running / done / failed）
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import Config
+import fork_safety
+from event_bus import event_bus
+
+
+class QueueFullError(Exception):
+    """排队任务数已达上限"""
+
+
+class JobQueue:
+    """
+    进程内的有界任务队列
+    每个任务的记录（task_data）保存在内存中，并同步写入 jobs/ 目录下的JSON文件，
+    这样即使记录被清理出内存，也仍然可以查询到任务结果
+    """
+
+    # 任务结束后的状态
+    FINISHED_STATUSES = ('done', 'failed')
+
+    # 执行任务的进程已经不在时（重启或崩溃），未结束的任务标记为这个错误
+    INTERRUPTED_ERROR = '任务被中断（服务重启），请重新提交'
+
+    def __init__(self, max_workers=None, max_pending=None, jobs_folder=None):
+        """初始化任务队列（线程池在第一次提交任务时才创建）"""
+        self.max_workers = max_workers or Config.JOB_WORKERS
+        self.max_pending = max_pending or Config.JOB_QUEUE_SIZE
+        self.jobs_folder = jobs_folder or Config.JOBS_FOLDER
+        self.retention_seconds = Config.JOB_RETENTION_SECONDS
+        self.sweep_interval = Config.JOB_SWEEP_INTERVAL
+
+        self._jobs = {}
+        self._active = 0  # 排队中 + 运行中的任务数
+        self._lock = threading.Lock()
+        self._executor = None
+        self._last_sweep = time.monotonic()
+
+        # 生成过程中报告的阶段同步记录到任务记录里，方便 /jobs/<id> 查询
+        event_bus.add_listener(self._on_event)
+
+    def _get_executor(self):
+        """按需创建线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='generate-job'
+            )
+        return self._executor
+
+    def submit(self, task_data, job_func):
+        """
+        提交一个生成任务
+
+        参数:
+        - task_data: 任务记录字典（会作为持久化的任务记录）
+        - job_func: 在后台执行的函数，接收任务记录副本，返回生成图片的路径
+
+        返回:
+        - 任务记录副本
+
+        异常:
+        - QueueFullError: 运行和排队中的任务已满
+        """
+        with self._lock:
+            if self._active >= self.max_workers + self.max_pending:
+                raise QueueFullError('当前生成任务过多，请稍后重试')
+            self._active += 1
+
+            job = dict(task_data)
+            job.setdefault('id', str(uuid.uuid4()))
+            job.setdefault('timestamp', datetime.now().isoformat())
+            job['status'] = 'queued'
+            job['worker_pid'] = os.getpid()   # 执行任务的进程，用来识别被中断的任务
+            self._jobs[job['id']] = job
+            snapshot = dict(job)
+            executor = self._get_executor()
+
+        self._persist(snapshot)
+        self._publish_status(snapshot)
+        self._prune()
+
+        try:
+            executor.submit(self._run, job['id'], job_func)
+        except RuntimeError as e:
+            # 线程池已关闭（例如进程正在退出）
+            self._finish(job['id'], status='failed', error=f'任务提交失败: {str(e)}')
+            raise
+
+        return snapshot
+
+    def _run(self, job_id, job_func):
+        """在后台线程中执行任务（生成器代码报告的阶段事件会发布到该任务的频道）"""
+        with event_bus.bind(job_id):
+            job = self.update(job_id, status='running', started_at=datetime.now().isoformat())
+            self._publish_status(job)
+            try:
+                generated_image_path = job_func(job)
+                if generated_image_path:
+                    filename = os.path.basename(generated_image_path)
+                    self._finish(job_id, status='done', image_url=f'/generated/{filename}')
+                else:
+                    self._finish(job_id, status='failed', error='图片生成失败，请检查API设置或稍后重试')
+            except Exception as e:
+                print(f"💥 生成任务 {job_id} 执行出错: {str(e)}")
+                self._finish(job_id, status='failed', error=f'生成过程中出现错误: {str(e)}')
+
+    def _finish(self, job_id, **fields):
+        """把任务标记为结束并释放队列名额"""
+        fields['finished_at'] = datetime.now().isoformat()
+        fields['finished_ts'] = time.time()
+        if fields['status'] == 'done':
+            fields['stage'] = 'done'
+        job = self.update(job_id, **fields)
+        with self._lock:
+            self._active = max(0, self._active - 1)
+        if job:
+            self._publish_status(job)
+
+    def _publish_status(self, job):
+        """把任务状态变化发布到事件总线"""
+        data = {'job_id': job['id'], 'status': job['status']}
+        for field in ('image_url', 'error'):
+            if job.get(field):
+                data[field] = job[field]
+        event_bus.publish(job['id'], 'status', data, final=job['status'] in self.FINISHED_STATUSES)
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：父进程的线程池和内存中的任务不属于子进程"""
+        self._jobs = {}
+        self._active = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._last_sweep = time.monotonic()
+
+    def _on_event(self, channel_id, event, data):
+        """记录任务当前所处的阶段（任务结束后对冲落选的模型还可能报告阶段，忽略）"""
+        if event == 'stage':
+            with self._lock:
+                job = self._jobs.get(channel_id)
+                if job is not None and job['status'] not in self.FINISHED_STATUSES:
+                    job['stage'] = data.get('stage')
+
+    def update(self, job_id, **fields):
+        """
+        更新任务记录并写入磁盘
+
+        返回:
+        - 更新后的任务记录副本，任务不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            snapshot = dict(job)
+        self._persist(snapshot)
+        return snapshot
+
+    def get(self, job_id):
+        """
+        查询任务记录
+
+        返回:
+        - 任务记录副本，找不到时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self._load(job_id)
+
+    def stats(self):
+        """返回队列当前的负载情况"""
+        with self._lock:
+            return {
+                'active': self._active,
+                'capacity': self.max_workers + self.max_pending,
+                'workers': self.max_workers
+            }
+
+    def _job_path(self, job_id):
+        """任务记录文件路径（只接受UUID格式的任务ID，避免路径穿越）"""
+        try:
+            job_id = str(uuid.UUID(job_id))
+        except (ValueError, TypeError):
+            return None
+        return os.path.join(self.jobs_folder, f'{job_id}.json')
+
+    def _persist(self, job):
+        """把任务记录原子地写入磁盘"""
+        path = self._job_path(job['id'])
+        if not path:
+            return
+        try:
+            os.makedirs(self.jobs_folder, exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 保存任务记录失败: {str(e)}")
+
+    def _load(self, job_id):
+        """从磁盘读取任务记录（执行它的进程已经不在时标记为失败）"""
+        path = self._job_path(job_id)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except Exception as e:
+            print(f"⚠️ 读取任务记录失败: {str(e)}")
+            return None
+        return self._interrupt_if_orphaned(job)
+
+    @staticmethod
+    def _owner_alive(job):
+        """执行任务的进程是否还在运行（调用方已确认任务不在本进程内存中）"""
+        pid = job.get('worker_pid')
+        if not pid or pid == os.getpid() or os.name == 'nt':
+            # 没有记录进程（旧版本的记录）、进程号和本进程相同（重启前的进程），
+            # 或者在Windows上（os.kill 会结束进程，开发服务器只有一个进程）都视为已经不在
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        except OSError:
+            return False
+        return True
+
+    def _interrupt_if_orphaned(self, job):
+        """磁盘上未结束、但执行进程已经不在的任务标记为失败并写回磁盘"""
+        if job.get('status') in self.FINISHED_STATUSES or self._owner_alive(job):
+            return job
+        job.update(
+            status='failed',
+            error=self.INTERRUPTED_ERROR,
+            finished_at=datetime.now().isoformat(),
+            finished_ts=time.time(),
+        )
+        self._persist(job)
+        return job
+
+    def recover(self):
+        """
+        启动时整理 jobs/ 目录（由 create_app 调用）：
+        上次运行中断的排队中/运行中任务标记为失败，超过保留时间的任务记录删除
+        """
+        interrupted, removed = self._sweep()
+        if interrupted or removed:
+            print(f"🧹 任务记录整理完成：{interrupted} 个中断的任务标记为失败，删除 {removed} 个过期记录")
+
+    def _sweep(self):
+        """
+        扫描磁盘上不在本进程内存中的任务记录
+
+        返回:
+        - (标记为失败的任务数, 删除的记录数)
+        """
+        self._last_sweep = time.monotonic()
+        try:
+            names = os.listdir(self.jobs_folder)
+        except OSError:
+            return 0, 0
+
+        cutoff = time.time() - self.retention_seconds
+        interrupted = removed = 0
+        for name in names:
+            job_id, ext = os.path.splitext(name)
+            path = self._job_path(job_id)
+            if ext != '.json' or not path:
+                continue
+            with self._lock:
+                if job_id in self._jobs:
+                    continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+                finished_ts = job.get('finished_ts')
+            except (OSError, ValueError):
+                # 读不出来的记录按文件修改时间处理
+                job, finished_ts = None, None
+
+            if job is not None and job.get('status') not in self.FINISHED_STATUSES:
+                if self._interrupt_if_orphaned(job)['status'] == 'failed':
+                    interrupted += 1
+                continue
+
+            try:
+                if finished_ts is None:
+                    finished_ts = os.path.getmtime(path)
+                if finished_ts < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return interrupted, removed
+
+    def _prune(self):
+        """清理内存和磁盘上过期的已结束任务（其他进程留下的记录按 sweep_interval 定期清理）"""
+        cutoff = time.time() - self.retention_seconds
+        expired = []
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job['status'] in self.FINISHED_STATUSES and job.get('finished_ts', 0) < cutoff:
+                    expired.append(job_id)
+                    del self._jobs[job_id]
+        for job_id in expired:
+            path = self._job_path(job_id)
+            try:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._sweep()
+
+
+# 全局实例
+job_queue = JobQueue()
+fork_safety.register(job_queue)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多模式关键词改写引擎
+把关键词表编译成 Aho-Corasick 自动机，一次从左到右扫描完成全部替换：
+- 最左最长匹配：'熊猫' 不会被 '猫' 抢先替换
+- 替换后的英文不会再被后面的关键词二次匹配
+"""
+
+import threading
+
+
+class KeywordRewriter:
+    """基于 Aho-Corasick 自动机的关键词替换器"""
+
+    def __init__(self, mappings=None):
+        """
+        Args:
+            mappings (dict): 关键词 -> 替换文本
+        """
+        self._mappings = {}
+        self._lock = threading.Lock()
+        self._automaton = None  # (goto, fail, pattern_len, dict_link)
+        if mappings:
+            self.update(mappings)
+
+    def add(self, keyword, replacement):
+        """添加或覆盖一个关键词（下次使用时重新编译自动机）"""
+        if not keyword:
+            return
+        with self._lock:
+            self._mappings[keyword] = replacement
+            self._automaton = None
+
+    def update(self, mappings):
+        """批量添加关键词"""
+        with self._lock:
+            for keyword, replacement in mappings.items():
+                if keyword:
+                    self._mappings[keyword] = replacement
+            self._automaton = None
+
+    def __len__(self):
+        return len(self._mappings)
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁（编译好的自动机保留）"""
+        self._lock = threading.Lock()
+
+    def _get_automaton(self):
+        """获取编译好的自动机，需要时重新编译"""
+        automaton = self._automaton
+        if automaton is None:
+            with self._lock:
+                if self._automaton is None:
+                    self._automaton = self._build(self._mappings)
+                automaton = self._automaton
+        return automaton
+
+    @staticmethod
+    def _build(mappings):
+        """编译自动机：字典树 + 失败指针 + 输出链接"""
+        goto = [{}]         # 每个节点的子节点
+        pattern_len = [0]   # 节点对应完整关键词的长度（0表示不是关键词结尾）
+
+        for keyword in mappings:
+            node = 0
+            for char in keyword:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    pattern_len.append(0)
+                node = next_node
+            pattern_len[node] = len(keyword)
+
+        # 广度优先计算失败指针和输出链接（最近的、本身是关键词结尾的后缀节点）
+        fail = [0] * len(goto)
+        dict_link = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail_target = goto[state].get(char, 0)
+                fail[child] = fail_target if fail_target != child else 0
+                dict_link[child] = fail[child] if pattern_len[fail[child]] else dict_link[fail[child]]
+
+        return goto, fail, pattern_len, dict_link
+
+    def _longest_matches(self, text):
+        """
+        扫描文本
+
+        返回:
+        - dict: 起始位置 -> 从该位置开始的最长关键词长度
+        """
+        goto, fail, pattern_len, dict_link = self._get_automaton()
+        longest = {}
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            match = node if pattern_len[node] else dict_link[node]
+            while match:
+                length = pattern_len[match]
+                start = index - length + 1
+                if length > longest.get(start, 0):
+                    longest[start] = length
+                match = dict_link[match]
+        return longest
+
+    def _iter_matches(self, text):
+        """按最左最长规则依次产生不重叠的 (起始位置, 关键词)"""
+        longest = self._longest_matches(text)
+        position = 0
+        for start in sorted(longest):
+            if start < position:
+                continue
+            length = longest[start]
+            yield start, text[start:start + length]
+            position = start + length
+
+    def rewrite(self, text):
+        """一次扫描替换文本中的所有关键词"""
+        if not text or not self._mappings:
+            return text
+
+        pieces = []
+        position = 0
+        for start, keyword in self._iter_matches(text):
+            pieces.append(text[position:start])
+            pieces.append(self._mappings[keyword])
+            position = start + len(keyword)
+
+        if not pieces:
+            return text
+        pieces.append(text[position:])
+        return ''.join(pieces)
+
+    def find_all(self, text):
+        """返回文本中命中的关键词（按出现顺序去重）"""
+        if not text or not self._mappings:
+            return []
+        found = []
+        for _, keyword in self._iter_matches(text):
+            if keyword not in found:
+                found.append(keyword)
+        return found
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+运行指标（Prometheus文本格式）
+记录请求量、耗时、错误类型和收发字节数，按路由、AI服务和风格分类，通过 /metrics 接口输出；
+不依赖 prometheus_client。指标保存在当前进程内，多个工作进程时每个进程分别统计
+"""
+
+import os
+import time
+import inspect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+from config import Config
+import fork_safety
+
+
+def _escape(value):
+    """转义标签值中的特殊字符"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    """生成 {name="value",...} 形式的标签"""
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    """格式化数值（整数不带小数点）"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """带标签的指标基类：每组标签值对应一份数据"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}   # 标签值元组 -> 数据
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """按 labelnames 的顺序取出标签值"""
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _samples(self):
+        """返回 [(后缀, 标签值元组, 额外标签, 数值), ...]"""
+        raise NotImplementedError
+
+    def render(self):
+        """输出该指标的文本格式"""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type_name}',
+        ]
+        for suffix, values, extra, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        """清空所有数据"""
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """增加计数"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """当前计数"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """分桶统计（用于耗时、大小等分布）"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets or Config.METRICS_LATENCY_BUCKETS))
+
+    def observe(self, value, **labels):
+        """记录一次观测值"""
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = data
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data['buckets'][i] += 1
+            data['sum'] += value
+            data['count'] += 1
+
+    def count(self, **labels):
+        """观测次数"""
+        with self._lock:
+            data = self._values.get(self._key(labels))
+            return data['count'] if data else 0
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, data['buckets']):
+                    samples.append(('_bucket', key, (('le', _format_value(bound)),), bucket_count))
+                samples.append(('_bucket', key, (('le', '+Inf'),), data['count']))
+                samples.append(('_sum', key, (), data['sum']))
+                samples.append(('_count', key, (), data['count']))
+        return samples
+
+
+class MetricsRegistry:
+    """指标集合"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        """登记指标（同名指标只登记一次）"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        """创建（或获取）计数器"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        """创建（或获取）直方图"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """输出所有指标（Prometheus文本格式 0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+    def clear(self):
+        """清空所有指标的数据"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建注册表和每个指标的锁"""
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+
+
+# 全局实例
+metrics = MetricsRegistry()
+fork_safety.register(metrics)
+
+# 网站请求
+http_requests_total = metrics.counter(
+    'http_requests_total', '处理的HTTP请求数', ('route', 'method', 'status'))
+http_request_duration_seconds = metrics.histogram(
+    'http_request_duration_seconds', 'HTTP请求处理耗时（秒）', ('route', 'method'))
+http_request_bytes_total = metrics.counter(
+    'http_request_bytes_total', '接收的请求体字节数', ('route',))
+http_response_bytes_total = metrics.counter(
+    'http_response_bytes_total', '发送的响应体字节数（流式响应不计）', ('route',))
+
+# AI服务调用（生成图片、视频任务、文档分析）
+provider_calls_total = metrics.counter(
+    'provider_calls_total', 'AI服务调用次数，outcome 为 success / failed / 异常类型', ('provider', 'operation', 'style', 'outcome'))
+provider_call_duration_seconds = metrics.histogram(
+    'provider_call_duration_seconds', 'AI服务调用耗时（秒）', ('provider', 'operation', 'style'),
+    buckets=Config.METRICS_PROVIDER_BUCKETS)
+
+# 发往AI服务的HTTP请求（共享连接池）
+upstream_requests_total = metrics.counter(
+    'upstream_requests_total', '发往上游的HTTP请求数，status 为状态码或异常类型', ('provider', 'method', 'status'))
+upstream_request_duration_seconds = metrics.histogram(
+    'upstream_request_duration_seconds', '上游HTTP请求耗时（秒，到收到响应头为止）', ('provider', 'method'),
+    buckets=Config.METRICS_PROVIDER_BUCKETS)
+upstream_bytes_total = metrics.counter(
+    'upstream_bytes_total', '与上游之间收发的字节数（按请求体和Content-Length统计）', ('provider', 'direction'))
+
+# 文件保存
+file_saves_total = metrics.counter(
+    'file_saves_total', '保存文件的次数', ('kind', 'outcome'))
+file_save_bytes_total = metrics.counter(
+    'file_save_bytes_total', '写入磁盘的字节数', ('kind',))
+file_save_duration_seconds = metrics.histogram(
+    'file_save_duration_seconds', '保存文件耗时（秒）', ('kind',))
+
+
+def style_label(style):
+    """风格标签：只使用已知的风格，避免用户输入产生大量标签组合"""
+    if not style:
+        return 'none'
+    return style if style in Config.STYLE_CONFIGS else 'other'
+
+
+def is_placeholder_image(result):
+    """结果是否是示例图片（备用生成器生成的 demo_ 开头的文件）"""
+    return isinstance(result, str) and os.path.basename(result).startswith('demo_')
+
+
+def outcome_label(result, placeholder_ok=False):
+    """
+    根据返回值判断调用结果：None/False 或 success 为False的字典算作失败；
+    上游服务失败后改为返回示例图片时也算作失败（placeholder_ok 为True的本地生成器除外）
+    """
+    if isinstance(result, dict):
+        return 'success' if result.get('success') else 'failed'
+    if is_placeholder_image(result) and not placeholder_ok:
+        return 'failed'
+    return 'success' if result else 'failed'
+
+
+def record_provider_call(provider, operation, style, outcome, seconds):
+    """记录一次AI服务调用"""
+    if not Config.METRICS_ENABLED:
+        return
+    style = style_label(style)
+    provider_calls_total.inc(provider=provider, operation=operation, style=style, outcome=outcome)
+    provider_call_duration_seconds.observe(seconds, provider=provider, operation=operation, style=style)
+
+
+# 当前正在统计的AI服务调用（嵌套调用时只记录最外层）
+_provider_call = contextvars.ContextVar('provider_call', default=None)
+
+
+def instrument_provider(provider, operation, placeholder_ok=False):
+    """
+    装饰器：统计AI服务调用的次数、耗时和结果（同时支持普通函数和异步函数）
+    被装饰函数如果有 style 参数，会按风格分类；
+    一个服务内部再调用其他服务时（例如Gemini模拟调用示例图片生成器、OpenRouter失败后生成示例图片），
+    只按最外层的服务记录一次，内层调用不重复计数
+
+    参数:
+    - provider: 服务名称（segmind、gpt_image1、openrouter、gemini、fallback、doubao、ark）
+    - operation: 操作名称（generate_image、create_video_task 等）
+    - placeholder_ok: 返回示例图片是否算成功（只有本身就生成示例图片的本地生成器为True）
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        has_style = 'style' in signature.parameters
+
+        def _style(args, kwargs):
+            if not has_style:
+                return None
+            try:
+                bound = signature.bind_partial(*args, **kwargs)
+            except TypeError:
+                return None
+            return bound.arguments.get('style', signature.parameters['style'].default)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _provider_call.get() is not None:
+                    return await func(*args, **kwargs)
+                token = _provider_call.set(provider)
+                started = time.perf_counter()
+                outcome = 'failed'
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = outcome_label(result, placeholder_ok)
+                    return result
+                except BaseException as e:
+                    outcome = type(e).__name__
+                    raise
+                finally:
+                    _provider_call.reset(token)
+                    record_provider_call(provider, operation, _style(args, kwargs), outcome, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _provider_call.get() is not None:
+                return func(*args, **kwargs)
+            token = _provider_call.set(provider)
+            started = time.perf_counter()
+            outcome = 'failed'
+            try:
+                result = func(*args, **kwargs)
+                outcome = outcome_label(result, placeholder_ok)
+                return result
+            except BaseException as e:
+                outcome = type(e).__name__
+                raise
+            finally:
+                _provider_call.reset(token)
+                record_provider_call(provider, operation, _style(args, kwargs), outcome, time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+def record_request(route, method, status, seconds, request_bytes=0, response_bytes=None):
+    """记录一次网站请求（response_bytes 为None表示流式响应，不计字节数）"""
+    if not Config.METRICS_ENABLED:
+        return
+    http_requests_total.inc(route=route, method=method, status=status)
+    http_request_duration_seconds.observe(seconds, route=route, method=method)
+    if request_bytes:
+        http_request_bytes_total.inc(request_bytes, route=route)
+    if response_bytes:
+        http_response_bytes_total.inc(response_bytes, route=route)
+
+
+def record_upstream(provider, method, status, seconds, sent_bytes=0, received_bytes=0):
+    """记录一次发往上游的HTTP请求（status 为状态码或异常类型名）"""
+    if not Config.METRICS_ENABLED:
+        return
+    provider = provider or 'other'
+    upstream_requests_total.inc(provider=provider, method=method, status=status)
+    upstream_request_duration_seconds.observe(seconds, provider=provider, method=method)
+    if sent_bytes:
+        upstream_bytes_total.inc(sent_bytes, provider=provider, direction='sent')
+    if received_bytes:
+        upstream_bytes_total.inc(received_bytes, provider=provider, direction='received')
+
+
+def body_size(body):
+    """请求体的字节数（流式请求体无法得知，返回0）"""
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    return 0
+
+
+def content_length(headers):
+    """响应头中的 Content-Length（没有时返回0）"""
+    try:
+        return int(headers.get('Content-Length') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def record_file_save(kind, nbytes, seconds, outcome='success'):
+    """
+    记录一次文件保存
+
+    参数:
+    - kind: generated（生成的图片）/ upload（上传文件）/ reference（预处理后的参考图）
+    - nbytes: 写入的字节数
+    - seconds: 耗时
+    - outcome: success 或异常类型名
+    """
+    if not Config.METRICS_ENABLED:
+        return
+    file_saves_total.inc(kind=kind, outcome=outcome)
+    file_save_duration_seconds.observe(seconds, kind=kind)
+    if nbytes:
+        file_save_bytes_total.inc(nbytes, kind=kind)
+
+
+@contextmanager
+def track_file_save(kind):
+    """
+    上下文管理器：统计一次文件保存，写入时把字节数累加到 stats['bytes']
+
+    用法:
+        with track_file_save('generated') as stats:
+            f.write(data)
+            stats['bytes'] += len(data)
+    """
+    stats = {'bytes': 0}
+    started = time.perf_counter()
+    try:
+        yield stats
+    except BaseException as e:
+        record_file_save(kind, stats['bytes'], time.perf_counter() - started, type(e).__name__)
+        raise
+    record_file_save(kind, stats['bytes'], time.perf_counter() - started)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+模型路由
+用户选择的模型 -> 依次调用的生成服务；同步（app.dispatch_to_model）和异步（async_generators）两条路径共用这张表。
+智能选择模式只让真正调用上游的服务参与对冲，本地生成器（Gemini模拟、示例图片）几毫秒就能返回占位图，
+只在所有上游服务都失败后才使用
+"""
+
+import os
+import threading
+from config import Config
+import fork_safety
+from result_cache import result_cache
+
+# 用户指定模型时依次尝试的服务（provider_registry 中的名称），前面的失败才使用后面的
+MODEL_ROUTES = {
+    'segmind': ('segmind',),
+    'gpt_image1': ('gpt_image1',),
+    'gemini': ('gemini',),
+    'openrouter': ('openrouter', 'fallback'),   # OpenRouter失败时使用示例图片
+    'fallback': ('fallback',),
+}
+
+# 智能选择模式参与对冲的上游服务（按优先级排列，segmind 只在有参考图时使用）
+AUTO_UPSTREAM = ('segmind', 'openrouter')
+
+# 智能选择模式所有上游都失败后使用的本地生成器
+AUTO_LOCAL = ('gemini',)
+
+# 只在本地生成、不调用上游的服务
+LOCAL_PROVIDERS = ('gemini', 'fallback')
+
+# 需要参考图片才能工作的服务
+REFERENCE_ONLY = ('segmind',)
+
+
+def route(selected_model, has_reference):
+    """
+    计算一次生成请求要调用的服务
+
+    参数:
+    - selected_model: 用户选择的模型（auto 或 MODEL_ROUTES 中的名称）
+    - has_reference: 是否有可用的参考图片
+
+    返回:
+    - (上游服务, 本地服务)：上游服务按顺序尝试（智能选择模式下对冲执行），
+      全部失败后依次使用本地服务；未知模型返回 ((), ())
+    """
+    if selected_model == 'auto':
+        upstream = tuple(name for name in AUTO_UPSTREAM if has_reference or name not in REFERENCE_ONLY)
+        return upstream, AUTO_LOCAL
+
+    if selected_model in REFERENCE_ONLY and not has_reference:
+        # Segmind需要参考图片，没有时回退到Gemini
+        return (), ('gemini',)
+
+    chain = MODEL_ROUTES.get(selected_model, ())
+    upstream = tuple(name for name in chain if name not in LOCAL_PROVIDERS)
+    local = tuple(name for name in chain if name in LOCAL_PROVIDERS)
+    return upstream, local
+
+
+def primary_provider(selected_model, has_reference=False):
+    """请求首先调用的服务（批量生成按它排队）"""
+    upstream, local = route(selected_model, has_reference)
+    chain = upstream + local
+    return chain[0] if chain else selected_model
+
+
+def should_race(selected_model, upstream):
+    """是否对冲执行上游服务（只有智能选择模式、并且有多个上游服务时）"""
+    return selected_model == 'auto' and Config.AUTO_RACE_ENABLED and len(upstream) > 1
+
+
+def _remove_generated(path):
+    """删除 generated/ 目录中的图片，其他位置的文件不处理"""
+    if not path or not isinstance(path, str):
+        return False
+    folder = os.path.realpath(Config.GENERATED_FOLDER)
+    if os.path.dirname(os.path.realpath(path)) != folder or not os.path.exists(path):
+        return False
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def upstream_result(name, path):
+    """
+    检查上游服务的结果：上游失败时有的生成器会返回示例图片（demo_开头），
+    这不算上游成功，删除占位图并返回None，由路由表中的本地生成器接手
+    """
+    if path and not result_cache.is_cacheable(path):
+        print(f"⚠️ {name} 返回的是示例图片，不作为上游结果")
+        _remove_generated(path)
+        return None
+    return path
+
+
+def discard_image(name, path):
+    """对冲执行的落选回调：删除落选服务生成的多余图片"""
+    if _remove_generated(path):
+        print(f"🗑️ 已丢弃落选模型 {name} 的结果: {path}")
+
+
+class ProviderLimiter:
+    """
+    按服务限制同时进行的生成数量
+    限制加在实际调用的服务上（智能选择模式下对冲执行的每个候选都各自占用名额），
+    而不是用户选择的模型名称
+    """
+
+    def __init__(self, limits=None, default_limit=None):
+        self.limits = limits if limits is not None else Config.PROVIDER_CONCURRENCY
+        self.default_limit = default_limit or Config.DEFAULT_PROVIDER_CONCURRENCY
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def limit(self, provider):
+        """指定服务的并发上限"""
+        return self.limits.get(provider, self.default_limit)
+
+    def get(self, provider):
+        """获取指定服务的信号量"""
+        with self._lock:
+            semaphore = self._semaphores.get(provider)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.limit(provider))
+                self._semaphores[provider] = semaphore
+            return semaphore
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：丢弃父进程的信号量"""
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+
+# 全局实例
+provider_limiter = ProviderLimiter()
+fork_safety.register(provider_limiter)
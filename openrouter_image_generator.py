@@ -9,12 +9,13 @@ OpenRouter AI图像生成器
 
 import os
 import uuid
-import requests
 import base64
 from datetime import datetime
-from io import BytesIO
-from PIL import Image
 from config import Config
+from http_client import http_pool
+from image_utils import save_image_bytes, stream_image_to_file
+from event_bus import event_bus
+from metrics import instrument_provider
 
 class OpenRouterImageGenerator:
     """OpenRouter AI图像生成器"""
@@ -33,6 +34,7 @@ class OpenRouterImageGenerator:
         else:
             print("⚠️ OpenRouter API密钥未设置或格式不正确")
     
+    @instrument_provider('openrouter', 'generate_image')
     def generate_image(self, prompt, style=None, reference_image_path=None):
         """
         生成图像的主函数
@@ -67,40 +69,11 @@ class OpenRouterImageGenerator:
         """使用OpenRouter API生成图像"""
         
         try:
-            # 获取风格配置
-            style_config = self.config.get_style_config(style)
-            
-            # 构建完整的提示词
-            full_prompt = self._build_full_prompt(prompt, style_config)
-            
-            # 选择合适的模型
-            model = self._select_model(style)
-            
-            print(f"🤖 正在调用OpenRouter API...")
-            print(f"📡 使用模型: {model}")
-            print(f"📝 完整提示词: {full_prompt[:100]}...")
-            
-            # 使用统一的参考图处理器
-            from unified_reference_handler import unified_handler
-            
-            # 准备请求头
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "http://localhost:4000",  # 设置来源
-                "X-Title": "AI Image Generation Website"
-            }
-            
-            # 使用统一的OpenRouter格式构建请求数据
-            data = unified_handler.build_openrouter_format(
-                prompt=full_prompt,
-                reference_image_path=reference_image_path,
-                model=model
-            )
+            url, headers, data = self._build_request(prompt, style, reference_image_path)
 
             # 调用OpenRouter API
-            url = f"{self.base_url}/chat/completions"
-            response = requests.post(url, headers=headers, json=data, timeout=60)
+            event_bus.report_stage('calling_provider', provider='openrouter')
+            response = http_pool.post(url, headers=headers, json=data, timeout=60, provider='openrouter')
             
             print(f"📊 API响应状态: {response.status_code}")
             
@@ -109,6 +82,7 @@ class OpenRouterImageGenerator:
                 print(f"✅ OpenRouter API响应成功")
                 
                 # 解析响应获取图像
+                event_bus.report_stage('saving', provider='openrouter')
                 generated_image_path = self._parse_openrouter_response(result, prompt, style)
                 
                 if generated_image_path:
@@ -127,6 +101,49 @@ class OpenRouterImageGenerator:
             print(f"❌ OpenRouter API调用出错: {e}")
             return self._generate_fallback(prompt, style)
     
+    def _build_request(self, prompt, style, reference_image_path=None):
+        """
+        构建OpenRouter请求（同步和异步接口共用）
+        
+        Returns:
+            tuple: (接口URL, 请求头, 请求数据)
+        """
+        
+        # 获取风格配置
+        style_config = self.config.get_style_config(style)
+        
+        # 构建完整的提示词
+        full_prompt = self._build_full_prompt(prompt, style_config)
+        
+        # 选择合适的模型
+        model = self._select_model(style)
+        
+        print(f"🤖 正在调用OpenRouter API...")
+        print(f"📡 使用模型: {model}")
+        print(f"📝 完整提示词: {full_prompt[:100]}...")
+        
+        # 使用统一的参考图处理器
+        from unified_reference_handler import unified_handler
+        
+        # 准备请求头
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "http://localhost:4000",  # 设置来源
+            "X-Title": "AI Image Generation Website"
+        }
+        
+        # 使用统一的OpenRouter格式构建请求数据
+        if reference_image_path:
+            event_bus.report_stage('uploading_reference', provider='openrouter')
+        data = unified_handler.build_openrouter_format(
+            prompt=full_prompt,
+            reference_image_path=reference_image_path,
+            model=model
+        )
+        
+        return f"{self.base_url}/chat/completions", headers, data
+    
     def _select_model(self, style):
         """根据风格选择最适合的模型"""
         
@@ -176,44 +193,12 @@ class OpenRouterImageGenerator:
         """解析OpenRouter API响应"""
 
         try:
-            # OpenRouter的响应格式
-            choices = response_data.get('choices', [])
-
-            if not choices:
-                print("❌ 响应中没有找到choices")
-                return None
-
-            choice = choices[0]
-            message = choice.get('message', {})
-
-            # 检查是否有图像数据
-            images = message.get('images', [])
-            if images:
-                # 处理图像数据
-                for image in images:
-                    image_url = image.get('image_url', {}).get('url', '')
-                    if image_url.startswith('data:image/'):
-                        # Base64图像数据
-                        print(f"🎨 找到Base64图像数据")
-                        return self._save_base64_image(image_url, prompt, style)
-                    elif image_url.startswith('http'):
-                        # URL图像
-                        print(f"🔗 找到图像URL: {image_url}")
-                        return self._download_image_from_url(image_url, prompt, style)
-
-            # 检查文本内容中是否有图像信息
-            content = message.get('content', '')
-            if 'http' in content:
-                # 提取URL
-                import re
-                urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', content)
-                if urls:
-                    image_url = urls[0]
-                    print(f"🔗 从文本中找到图像URL: {image_url}")
-                    return self._download_image_from_url(image_url, prompt, style)
-
-            # 如果没有找到图像数据
-            print(f"📋 OpenRouter响应内容: {content[:200]}...")
+            image = self._find_image(response_data)
+            if image:
+                kind, image_url = image
+                if kind == 'base64':
+                    return self._save_base64_image(image_url, prompt, style)
+                return self._download_image_from_url(image_url, prompt, style)
             
             # 生成一个示例图片作为备用
             return self._generate_fallback(prompt, style)
@@ -222,18 +207,68 @@ class OpenRouterImageGenerator:
             print(f"❌ 解析OpenRouter响应失败: {e}")
             return None
     
+    def _find_image(self, response_data):
+        """
+        在OpenRouter响应中查找图像（同步和异步接口共用）
+        
+        Returns:
+            tuple: ('base64', data URL) 或 ('url', 图像URL)，没有找到时返回None
+        """
+        
+        # OpenRouter的响应格式
+        choices = response_data.get('choices', [])
+
+        if not choices:
+            print("❌ 响应中没有找到choices")
+            return None
+
+        choice = choices[0]
+        message = choice.get('message', {})
+
+        # 检查是否有图像数据
+        images = message.get('images', [])
+        if images:
+            # 处理图像数据
+            for image in images:
+                image_url = image.get('image_url', {}).get('url', '')
+                if image_url.startswith('data:image/'):
+                    # Base64图像数据
+                    print(f"🎨 找到Base64图像数据")
+                    return 'base64', image_url
+                elif image_url.startswith('http'):
+                    # URL图像
+                    print(f"🔗 找到图像URL: {image_url}")
+                    return 'url', image_url
+
+        # 检查文本内容中是否有图像信息
+        content = message.get('content', '')
+        if 'http' in content:
+            # 提取URL
+            import re
+            urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', content)
+            if urls:
+                image_url = urls[0]
+                print(f"🔗 从文本中找到图像URL: {image_url}")
+                return 'url', image_url
+
+        # 如果没有找到图像数据
+        print(f"📋 OpenRouter响应内容: {content[:200]}...")
+        return None
+    
     def _download_image_from_url(self, image_url, prompt, style):
         """从URL下载图像"""
         
         try:
             print(f"📥 下载图像: {image_url}")
-            response = requests.get(image_url, timeout=30)
+            response = http_pool.get(image_url, timeout=30, stream=True)
             
             if response.status_code == 200:
-                # 保存图像
-                image = Image.open(BytesIO(response.content))
-                return self._save_generated_image(image, prompt, style)
+                # 边下载边写入磁盘，不在内存中保留完整图片
+                filepath = stream_image_to_file(response, self._generated_base_path(prompt))
+                print(f"💾 图片已保存到: {filepath}")
+                return filepath
             else:
+                response.close()
                 print(f"❌ 下载图像失败: {response.status_code}")
                 return None
         
@@ -251,9 +286,8 @@ class OpenRouterImageGenerator:
                 header, data = base64_url.split(',', 1)
                 image_data = base64.b64decode(data)
 
-                # 创建PIL图像
-                image = Image.open(BytesIO(image_data))
-                return self._save_generated_image(image, prompt, style)
+                # 直接保存服务返回的已编码图片
+                return self._save_generated_image(image_data, prompt, style)
             else:
                 print(f"❌ 无效的Base64图像格式")
                 return None
@@ -262,8 +296,8 @@ class OpenRouterImageGenerator:
             print(f"❌ 处理Base64图像失败: {e}")
             return None
 
-    def _save_generated_image(self, image, prompt, style):
-        """保存生成的图像"""
+    def _generated_base_path(self, prompt):
+        """生成保存路径（不含扩展名，扩展名由图片格式决定）"""
         
         # 生成唯一文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -271,15 +305,16 @@ class OpenRouterImageGenerator:
         safe_prompt = "".join(c for c in prompt[:20] if c.isalnum() or c in " ").strip()
         safe_prompt = safe_prompt.replace(" ", "_")
         
-        filename = f"openrouter_{timestamp}_{unique_id}_{safe_prompt}.png"
-        filepath = os.path.join(self.config.GENERATED_FOLDER, filename)
-        
-        # 确保目录存在
-        os.makedirs(self.config.GENERATED_FOLDER, exist_ok=True)
-        
-        # 保存图像
-        image.save(filepath, "PNG")
-        
+        filename = f"openrouter_{timestamp}_{unique_id}_{safe_prompt}"
+        return os.path.join(self.config.GENERATED_FOLDER, filename)
+    
+    def _save_generated_image(self, image_data, prompt, style, transform=None):
+        """
+        保存生成的图像
+        服务返回的PNG/JPEG/WebP等数据原样写入磁盘；只有提供 transform 时才解码处理
+        """
+        filepath = save_image_bytes(image_data, self._generated_base_path(prompt), transform=transform)
+        print(f"💾 图片已保存到: {filepath}")
         return filepath
     
     def _generate_fallback(self, prompt, style):
@@ -318,7 +353,7 @@ class OpenRouterImageGenerator:
             }
             
             url = f"{self.base_url}/chat/completions"
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            response = http_pool.post(url, headers=headers, json=data, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -340,5 +375,10 @@ class OpenRouterImageGenerator:
                 'error': f'连接测试失败: {str(e)}'
             }
 
-# 全局实例
-openrouter_generator = OpenRouterImageGenerator()
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from openrouter_image_generator import openrouter_generator 的写法
+def __getattr__(name):
+    if name == 'openrouter_generator':
+        from provider_registry import providers
+        return providers.get('openrouter')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
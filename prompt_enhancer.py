@@ -4,8 +4,25 @@
 将用户的简短输入转换为详细的AI绘图提示词
 """
 
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+import fork_safety
+from keyword_rewriter import KeywordRewriter
+
 class PromptEnhancer:
-    def __init__(self):
+    def __init__(self, deterministic=True, memo_size=1024):
+        """
+        Args:
+            deterministic (bool): 为True时随机部分以输入内容为种子，相同输入总是得到相同结果
+            memo_size (int): 增强结果缓存的最大条目数（仅确定性模式下使用）
+        """
+        self.deterministic = deterministic
+        self.memo_size = memo_size
+        self._memo = OrderedDict()  # (user_input, style) -> 增强后的提示词
+        self._memo_lock = threading.Lock()
+        
         # 简短关键词映射表
         self.keyword_mappings = {
             # 动物类
@@ -64,10 +81,10 @@ class PromptEnhancer:
                 '紫色': 'royal purple color'
             },
             '数量': {
-                '一只': 'single',
-                '两只': 'pair of',
-                '一群': 'group of',
-                '很多': 'many'
+                '一只': 'single ',
+                '两只': 'pair of ',
+                '一群': 'group of ',
+                '很多': 'many '
             },
             '动作': {
                 '坐着': 'sitting pose',
@@ -84,6 +101,31 @@ class PromptEnhancer:
             'high quality', 'detailed', 'beautiful', 'stunning', 'amazing',
             'perfect lighting', 'sharp focus', 'professional', 'artistic'
         ]
+        
+        # 把关键词表和组合词表编译成一个自动机，一次扫描完成全部替换
+        # （组合词表先加入，关键词表后加入，同名时以关键词表为准）
+        self._keyword_rewriter = KeywordRewriter()
+        for rules in self.combination_rules.values():
+            self._keyword_rewriter.update(rules)
+        self._keyword_rewriter.update(self.keyword_mappings)
+        fork_safety.register(self)
+
+    def add_keyword(self, keyword, replacement, category=None):
+        """
+        添加或修改一个关键词映射
+        
+        Args:
+            keyword (str): 中文关键词
+            replacement (str): 替换成的英文描述
+            category (str): 组合词类别（'颜色'、'数量'、'动作'），为空时加入关键词表
+        """
+        if category:
+            self.combination_rules.setdefault(category, {})[keyword] = replacement
+        else:
+            self.keyword_mappings[keyword] = replacement
+        self._keyword_rewriter.add(keyword, replacement)
+        with self._memo_lock:
+            self._memo.clear()
 
     def enhance_prompt(self, user_input, style=None):
         """
@@ -96,21 +138,48 @@ class PromptEnhancer:
         Returns:
             str: 增强后的详细提示词
         """
+        if not self.deterministic:
+            return self._enhance(user_input, style, random)
+        
+        memo_key = (user_input, style)
+        with self._memo_lock:
+            cached = self._memo.get(memo_key)
+            if cached is not None:
+                self._memo.move_to_end(memo_key)
+                return cached
+        
+        # 以输入内容的哈希作为随机种子，保证相同输入得到相同的增强结果
+        seed_source = f"{user_input}\x00{style or ''}".encode('utf-8')
+        rng = random.Random(int.from_bytes(hashlib.sha256(seed_source).digest()[:8], 'big'))
+        enhanced = self._enhance(user_input, style, rng)
+        
+        with self._memo_lock:
+            self._memo[memo_key] = enhanced
+            self._memo.move_to_end(memo_key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        
+        return enhanced
+    
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建缓存锁和关键词改写器的锁"""
+        self._memo_lock = threading.Lock()
+        self._keyword_rewriter._reset_after_fork()
+
+    def _enhance(self, user_input, style, rng):
+        """执行增强流程，rng 用于随机选择质量增强词"""
         # 1. 基础文本处理
         enhanced = user_input.strip()
         
-        # 2. 关键词替换
-        enhanced = self._replace_keywords(enhanced)
-        
-        # 3. 组合词处理
-        enhanced = self._apply_combination_rules(enhanced)
+        # 2-3. 关键词替换和组合词处理（单次扫描，最长匹配优先）
+        enhanced = self._keyword_rewriter.rewrite(enhanced)
         
         # 4. 风格特定增强
         if style:
             enhanced = self._apply_style_enhancement(enhanced, style)
         
         # 5. 质量增强
-        enhanced = self._add_quality_enhancers(enhanced)
+        enhanced = self._add_quality_enhancers(enhanced, rng)
         
         # 6. 智能补全
         enhanced = self._intelligent_completion(enhanced)
@@ -120,32 +189,6 @@ class PromptEnhancer:
         
         return enhanced
 
-    def _replace_keywords(self, text):
-        """替换关键词"""
-        for keyword, replacement in self.keyword_mappings.items():
-            if keyword in text:
-                text = text.replace(keyword, replacement)
-        return text
-
-    def _apply_combination_rules(self, text):
-        """应用组合词规则"""
-        # 颜色组合
-        for color_cn, color_en in self.combination_rules['颜色'].items():
-            if color_cn in text:
-                text = text.replace(color_cn, color_en)
-        
-        # 数量组合
-        for num_cn, num_en in self.combination_rules['数量'].items():
-            if num_en in text:
-                text = text.replace(num_cn, num_en)
-        
-        # 动作组合
-        for action_cn, action_en in self.combination_rules['动作'].items():
-            if action_cn in text:
-                text = text.replace(action_cn, action_en)
-        
-        return text
-
     def _apply_style_enhancement(self, text, style):
         """应用风格特定增强"""
         from config import Config
@@ -154,11 +197,10 @@ class PromptEnhancer:
             text += style_config['prompt_suffix']
         return text
 
-    def _add_quality_enhancers(self, text):
+    def _add_quality_enhancers(self, text, rng=random):
         """添加质量增强词"""
         # 随机选择1-2个质量增强词
-        import random
-        selected_enhancers = random.sample(self.quality_enhancers, 2)
+        selected_enhancers = rng.sample(self.quality_enhancers, 2)
         text += ', ' + ', '.join(selected_enhancers)
         return text
 
@@ -207,8 +249,8 @@ class PromptEnhancer:
         suggestions = []
         
         # 基于关键词匹配建议
-        for keyword in self.keyword_mappings.keys():
-            if keyword in partial_input:
+        for keyword in self._keyword_rewriter.find_all(partial_input):
+            if keyword in self.keyword_mappings:
                 # 生成相关的建议
                 base_prompt = self.enhance_prompt(partial_input)
                 suggestions.append(base_prompt)
@@ -231,5 +273,10 @@ class PromptEnhancer:
         
         return variations
 
-# 创建全局实例
-prompt_enhancer = PromptEnhancer()
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from prompt_enhancer import prompt_enhancer 的写法
+def __getattr__(name):
+    if name == 'prompt_enhancer':
+        from provider_registry import providers
+        return providers.get('prompt_enhancer')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
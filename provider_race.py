@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多模型对冲（hedged）执行
+智能选择模式下先调用首选模型，如果它在对冲延迟内还没有结果，
+就并行启动下一个候选模型，谁先成功就用谁的结果
+"""
+
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import Config
+import fork_safety
+
+# 对冲执行专用线程池（按需创建）
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """获取对冲执行线程池"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=Config.AUTO_RACE_WORKERS,
+                    thread_name_prefix='provider-race'
+                )
+    return _executor
+
+
+def _reset_after_fork():
+    """fork之后在子进程中调用：丢弃父进程的线程池"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+fork_safety.register(_reset_after_fork)
+
+
+def _discard_when_done(future, name, on_discard):
+    """落选的模型完成后把它的结果交给 on_discard 处理（例如删除多余的图片）"""
+    if on_discard is None:
+        return
+
+    def _callback(done):
+        if done.cancelled() or done.exception() is not None:
+            return
+        result = done.result()
+        if result:
+            try:
+                on_discard(name, result)
+            except Exception as e:
+                print(f"⚠️ 处理落选模型 {name} 的结果出错: {str(e)}")
+
+    future.add_done_callback(_callback)
+
+
+def race_providers(candidates, hedge_delay=None, timeout=None, on_discard=None):
+    """
+    对冲执行多个候选模型
+
+    参数:
+    - candidates: [(模型名称, 无参调用函数), ...]，按优先级排列
+    - hedge_delay: 上一个模型多久没有结果就启动下一个（秒）
+    - timeout: 整体最长等待时间（秒），None表示一直等到所有模型结束
+    - on_discard: 可选回调 f(模型名称, 结果)，落选模型之后成功返回的结果交给它处理；
+      不提供时落选结果直接忽略
+
+    返回:
+    - (成功的模型名称, 生成结果)，全部失败时返回 (None, None)
+    """
+    hedge_delay = Config.AUTO_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    timeout = Config.AUTO_RACE_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout if timeout else None
+
+    executor = _get_executor()
+    pending = list(candidates)
+    running = {}
+
+    def _launch_next():
+        name, func = pending.pop(0)
+        print(f"🏁 对冲执行：启动 {name}")
+        # 复制当前上下文，让模型内部报告的进度事件仍然发到原任务的频道
+        context = contextvars.copy_context()
+        running[executor.submit(context.run, func)] = name
+
+    _launch_next()
+
+    while running:
+        # 还有候选模型时最多等待一个对冲延迟，否则等到有模型结束
+        wait_time = hedge_delay if pending else None
+        if deadline is not None:
+            remaining = max(0, deadline - time.monotonic())
+            wait_time = remaining if wait_time is None else min(wait_time, remaining)
+
+        done, _ = wait(list(running), timeout=wait_time, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            name = running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"⚠️ {name} 执行出错: {str(e)}")
+                result = None
+
+            if result:
+                print(f"🏆 对冲执行：{name} 最先成功")
+                # 取消还没开始的模型，正在运行的模型完成后交给 on_discard
+                for loser, loser_name in running.items():
+                    if not loser.cancel():
+                        _discard_when_done(loser, loser_name, on_discard)
+                return name, result
+
+            print(f"⚠️ 对冲执行：{name} 生成失败")
+
+        if deadline is not None and time.monotonic() >= deadline:
+            print("⏰ 对冲执行超时")
+            for loser, loser_name in running.items():
+                if not loser.cancel():
+                    _discard_when_done(loser, loser_name, on_discard)
+            break
+
+        # 有模型失败，或者对冲延迟已到但还没有结果：启动下一个候选
+        if pending:
+            _launch_next()
+
+    return None, None
+
+
+async def race_providers_async(candidates, hedge_delay=None, timeout=None, on_discard=None):
+    """
+    race_providers 的异步版本（用于ASGI接口）
+
+    参数:
+    - candidates: [(模型名称, 无参协程函数), ...]，按优先级排列
+    - hedge_delay / timeout / on_discard: 与 race_providers 相同
+
+    返回:
+    - (成功的模型名称, 生成结果)，全部失败时返回 (None, None)
+    """
+    hedge_delay = Config.AUTO_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    timeout = Config.AUTO_RACE_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout if timeout else None
+
+    pending = list(candidates)
+    running = {}
+
+    def _launch_next():
+        name, func = pending.pop(0)
+        print(f"🏁 对冲执行：启动 {name}")
+        running[asyncio.ensure_future(func())] = name
+
+    def _abandon_running():
+        # 取消还在运行的模型（正在保存图片的模型被取消后由生成器自己删除写出的文件，
+        # 见 async_generators._save_in_thread）；同一轮已经完成的模型的结果交给 on_discard
+        for loser, loser_name in running.items():
+            _discard_when_done(loser, loser_name, on_discard)
+            loser.cancel()
+
+    _launch_next()
+
+    try:
+        while running:
+            wait_time = hedge_delay if pending else None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+                wait_time = remaining if wait_time is None else min(wait_time, remaining)
+
+            done, _ = await asyncio.wait(list(running), timeout=wait_time, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                name = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    print(f"⚠️ {name} 执行出错: {str(e)}")
+                    result = None
+
+                if result:
+                    print(f"🏆 对冲执行：{name} 最先成功")
+                    _abandon_running()
+                    return name, result
+
+                print(f"⚠️ 对冲执行：{name} 生成失败")
+
+            if deadline is not None and time.monotonic() >= deadline:
+                print("⏰ 对冲执行超时")
+                _abandon_running()
+                break
+
+            if pending:
+                _launch_next()
+    except asyncio.CancelledError:
+        # 客户端断开等原因被取消时，不留下还在运行的模型
+        _abandon_running()
+        raise
+
+    return None, None
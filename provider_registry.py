@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AI服务提供者注册表
+各个生成器按 "模块:类名" 登记，第一次使用时才导入模块并创建实例（每个进程只创建一次）；
+导入 app 时不再加载PIL、初始化所有生成器，工作进程可以更快地启动
+"""
+
+import importlib
+import threading
+import fork_safety
+
+# 服务名称 -> "模块:类名"（也可以登记任何无参可调用对象）
+PROVIDERS = {
+    'segmind': 'segmind_image_generator:SegmindImageGenerator',
+    'gpt_image1': 'gpt_image1_generator:GPTImage1Generator',
+    'openrouter': 'openrouter_image_generator:OpenRouterImageGenerator',
+    'ai': 'ai_image_generator:AIImageGenerator',            # OpenRouter，失败时使用示例图片
+    'gemini': 'gemini_image_generator:GeminiImageGenerator',
+    'fallback': 'fallback_generator:FallbackImageGenerator',
+    'video': 'ai_video_generator:AIVideoGenerator',
+    'document': 'document_processor:DocumentProcessor',
+    'prompt_enhancer': 'prompt_enhancer:PromptEnhancer',
+}
+
+
+class ProviderRegistry:
+    """
+    按需创建的单例集合
+    创建生成器时可能会再去获取其他生成器（例如 ai 依赖 openrouter），所以使用可重入锁
+    """
+
+    def __init__(self, factories=None):
+        """初始化注册表（不会创建任何实例）"""
+        self._factories = dict(PROVIDERS if factories is None else factories)
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        """
+        登记（或替换）一个服务
+
+        参数:
+        - name: 服务名称
+        - factory: "模块:类名" 字符串，或者无参可调用对象
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name):
+        """获取服务实例（第一次调用时创建）"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                instance = self._create(name)
+                self._instances[name] = instance
+            return instance
+
+    def _create(self, name):
+        """导入模块并创建实例"""
+        factory = self._factories.get(name)
+        if factory is None:
+            raise KeyError(f'未登记的服务: {name}')
+        if isinstance(factory, str):
+            module_name, attr = factory.split(':', 1)
+            factory = getattr(importlib.import_module(module_name), attr)
+        return factory()
+
+    def is_loaded(self, name):
+        """服务是否已经创建"""
+        return name in self._instances
+
+    def names(self):
+        """所有登记的服务名称"""
+        return list(self._factories)
+
+    def preload(self, names=None):
+        """提前创建服务（例如在接收请求之前预热），返回创建的服务名称"""
+        names = self.names() if names is None else names
+        for name in names:
+            self.get(name)
+        return list(names)
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁（已创建的实例保留，它们各自登记了重置）"""
+        self._lock = threading.RLock()
+
+
+# 全局实例
+providers = ProviderRegistry()
+fork_safety.register(providers)
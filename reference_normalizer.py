@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+参考图片预处理
+上传给AI服务之前，按EXIF方向摆正图片、去掉元数据、缩小到该服务需要的最长边，
+并重新编码为体积较小的JPEG（有透明通道时用PNG）；处理结果按内容哈希缓存
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from config import Config
+import fork_safety
+from upload_store import upload_store
+from metrics import track_file_save
+
+# EXIF中表示图片方向的标签
+_EXIF_ORIENTATION = 0x0112
+
+
+class ReferenceNormalizer:
+    """参考图片预处理器"""
+
+    def __init__(self, cache_folder=None):
+        """初始化预处理器"""
+        self.enabled = Config.REFERENCE_NORMALIZE_ENABLED
+        self.cache_folder = cache_folder or os.path.join(Config.UPLOAD_FOLDER, '.normalized')
+        self.max_edges = Config.REFERENCE_MAX_EDGE
+        self.default_max_edge = Config.REFERENCE_DEFAULT_MAX_EDGE
+        self.passthrough_bytes = Config.REFERENCE_PASSTHROUGH_BYTES
+        self.jpeg_quality = Config.REFERENCE_JPEG_QUALITY
+        self.cache_max_bytes = Config.REFERENCE_CACHE_MAX_BYTES
+        self.in_use_seconds = Config.REFERENCE_CACHE_IN_USE_SECONDS
+        self.touch_interval = Config.REFERENCE_CACHE_TOUCH_INTERVAL
+        self._entries = OrderedDict()  # 缓存文件路径 -> {'size', 'last_used'}，按最近使用排序
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def max_edge_for(self, provider):
+        """指定AI服务允许的参考图片最长边"""
+        return self.max_edges.get(provider, self.default_max_edge)
+
+    def normalize(self, image_path, provider=None):
+        """
+        预处理参考图片
+
+        参数:
+        - image_path: 原始参考图片路径
+        - provider: AI服务名称（决定最长边）
+
+        返回:
+        - 处理后的图片路径；不需要处理或处理失败时返回原始路径
+        """
+        if not self.enabled or not image_path or not os.path.exists(image_path):
+            return image_path
+
+        max_edge = self.max_edge_for(provider)
+        try:
+            digest = upload_store.file_digest(image_path)
+            cached_path = self._cached(digest, max_edge)
+            if cached_path:
+                return cached_path
+
+            from PIL import Image  # 按需导入，不使用参考图片时不加载PIL
+            with Image.open(image_path) as img:
+                if self._can_pass_through(image_path, img, max_edge):
+                    return image_path
+                normalized_path = self._normalize_image(img, digest, max_edge)
+
+            print(f"🗜️ 参考图片已预处理（{provider or '默认'}，最长边{max_edge}）: "
+                  f"{os.path.getsize(image_path)} -> {os.path.getsize(normalized_path)} 字节")
+            stat = os.stat(normalized_path)
+            self._touch(normalized_path, stat.st_size, stat.st_mtime)
+            self._prune()
+            return normalized_path
+
+        except Exception as e:
+            print(f"⚠️ 参考图片预处理失败，使用原图: {str(e)}")
+            return image_path
+
+    def _can_pass_through(self, image_path, img, max_edge):
+        """已经足够小、方向正确且没有EXIF的JPEG/PNG直接使用原图"""
+        return (
+            img.format in ('JPEG', 'PNG')
+            and max(img.size) <= max_edge
+            and 'exif' not in img.info
+            and os.path.getsize(image_path) <= self.passthrough_bytes
+        )
+
+    def _normalize_image(self, img, digest, max_edge):
+        """摆正、缩小并重新编码图片，原子地写入缓存目录"""
+        from PIL import Image, ImageOps
+        if img.format == 'JPEG':
+            # JPEG解码时直接按比例缩小，大图可以少解码很多像素
+            img.draft('RGB', (max_edge, max_edge))
+        orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+        image = ImageOps.exif_transpose(img) if orientation != 1 else img
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        os.makedirs(self.cache_folder, exist_ok=True)
+        if has_alpha:
+            path = os.path.join(self.cache_folder, f'{digest}_{max_edge}.png')
+            image, save_kwargs = image.convert('RGBA'), {'format': 'PNG', 'optimize': True}
+        else:
+            path = os.path.join(self.cache_folder, f'{digest}_{max_edge}.jpg')
+            image, save_kwargs = image.convert('RGB'), {'format': 'JPEG', 'quality': self.jpeg_quality, 'optimize': True}
+
+        # 不传exif/icc等参数，保存结果中不会带原图的元数据
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with track_file_save('reference') as stats:
+            image.save(tmp_path, **save_kwargs)
+            stats['bytes'] = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        return path
+
+    def _cached(self, digest, max_edge):
+        """查找已有的预处理结果，找到时记录这次使用"""
+        for ext in ('.jpg', '.png'):
+            path = os.path.join(self.cache_folder, f'{digest}_{max_edge}{ext}')
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self._touch(path, stat.st_size, stat.st_mtime)
+            return path
+        return None
+
+    def _touch(self, path, size, mtime=None):
+        """
+        记录一次使用：在内存中移到最近使用的位置；
+        文件修改时间超过 touch_interval 时更新它，让其他工作进程清理时也知道它最近被使用过。
+        不每次都更新：upload_store.file_digest 按修改时间缓存文件哈希，修改时间一变就要重新读文件计算
+        """
+        with self._lock:
+            self._load_index()
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._total_bytes -= entry['size']
+            self._entries[path] = {'size': size, 'last_used': time.monotonic()}
+            self._total_bytes += size
+        if mtime is not None and time.time() - mtime < self.touch_interval:
+            return
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _load_index(self):
+        """第一次使用时扫描一次缓存目录（按修改时间排序），之后只在内存中维护（调用方需持有锁）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            names = os.listdir(self.cache_folder)
+        except OSError:
+            return
+
+        entries = []
+        for name in names:
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.cache_folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        for _, size, path in sorted(entries):
+            # last_used 为None：本进程还没有把它交给过调用方
+            self._entries[path] = {'size': size, 'last_used': None}
+            self._total_bytes += size
+
+    def _prune(self):
+        """
+        缓存超过大小上限时，按最近使用顺序删除最久没有使用的预处理结果
+        最近交给调用方的文件（调用方可能还在读取或上传）不删除
+        """
+        with self._lock:
+            if self._total_bytes <= self.cache_max_bytes:
+                return
+
+            now_monotonic = time.monotonic()
+            now = time.time()
+            for path in list(self._entries):
+                # 留出一些空间，避免每次写入都触发清理
+                if self._total_bytes <= self.cache_max_bytes * 0.8:
+                    break
+                entry = self._entries[path]
+                if entry['last_used'] is not None and now_monotonic - entry['last_used'] < self.in_use_seconds:
+                    continue
+                try:
+                    # 其他工作进程最近使用过的文件也不删除（修改时间最多 touch_interval 更新一次）
+                    if now - os.path.getmtime(path) < self.in_use_seconds + self.touch_interval:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                del self._entries[path]
+                self._total_bytes -= entry['size']
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁"""
+        self._lock = threading.Lock()
+
+
+# 全局实例
+reference_normalizer = ReferenceNormalizer()
+fork_safety.register(reference_normalizer)
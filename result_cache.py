@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+生成结果缓存
+相同的请求（增强后的提示词、风格、模型、参考图内容）直接返回之前生成的图片，
+不再重复调用付费的AI服务
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from config import Config
+import fork_safety
+from upload_store import upload_store
+
+
+class ResultCache:
+    """
+    内容寻址的生成结果缓存
+    缓存键是请求输入的哈希，值是 generated/ 目录中已有的图片文件；
+    条目超过有效期或索引的文件总大小超过上限时，按最近最少使用的顺序淘汰条目。
+    淘汰只移除索引，不删除图片：这些文件已经作为 /generated/... 地址返回给用户，
+    也记录在任务和批量结果里，必须一直可以访问
+    """
+
+    def __init__(self, ttl_seconds=None, max_bytes=None):
+        """初始化结果缓存"""
+        self.ttl_seconds = ttl_seconds or Config.RESULT_CACHE_TTL_SECONDS
+        self.max_bytes = max_bytes or Config.RESULT_CACHE_MAX_BYTES
+        self._entries = OrderedDict()  # 缓存键 -> {'path', 'size', 'created'}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, style, model, reference_image_path=None, variant=0):
+        """根据请求输入计算缓存键（variant 区分同一请求的不同变体）"""
+        sha256 = hashlib.sha256()
+        sha256.update(json.dumps([prompt, style, model, variant], ensure_ascii=False).encode('utf-8'))
+        if reference_image_path and os.path.exists(reference_image_path):
+            sha256.update(upload_store.file_digest(reference_image_path).encode('ascii'))
+        return sha256.hexdigest()
+
+    @staticmethod
+    def is_cacheable(path):
+        """备用生成器的示例图片（demo_开头）不是真正的生成结果，不缓存"""
+        return bool(path) and not os.path.basename(path).startswith('demo_')
+
+    def get(self, key):
+        """
+        查询缓存
+
+        返回:
+        - 命中时返回图片路径，否则返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expired = time.time() - entry['created'] > self.ttl_seconds
+            if expired or not os.path.exists(entry['path']):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry['path']
+
+    def put(self, key, path):
+        """把生成结果加入缓存"""
+        if not self.is_cacheable(path) or not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'path': path, 'size': size, 'created': time.time()}
+            self._total_bytes += size
+            self._evict()
+
+    def stats(self):
+        """返回缓存使用情况"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _evict(self):
+        """淘汰过期条目，再按LRU顺序淘汰直到总大小不超过上限（调用方需持有锁）"""
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e['created'] > self.ttl_seconds]:
+            self._remove(key)
+        while self._entries and self._total_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def _remove(self, key):
+        """移除缓存条目（只移除索引，图片文件保留；调用方需持有锁）"""
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry['size']
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁（缓存索引保留）"""
+        self._lock = threading.Lock()
+
+
+# 全局实例
+result_cache = ResultCache()
+fork_safety.register(result_cache)
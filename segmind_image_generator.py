@@ -9,11 +9,13 @@ Segmind AI图像生成器
 
 import os
 import uuid
-import requests
 from datetime import datetime
-from io import BytesIO
-from PIL import Image
 from config import Config
+from http_client import http_pool
+from event_bus import event_bus
+from metrics import instrument_provider
+from reference_normalizer import reference_normalizer
+from image_utils import save_image_bytes
 
 class SegmindImageGenerator:
     """Segmind AI图像生成器"""
@@ -30,6 +32,7 @@ class SegmindImageGenerator:
         else:
             print("⚠️ Segmind API密钥未设置或格式不正确")
     
+    @instrument_provider('segmind', 'generate_image')
     def generate_image(self, prompt, style=None, reference_image_path=None):
         """
         生成图像的主函数
@@ -76,19 +79,12 @@ class SegmindImageGenerator:
             print(f"📝 转换提示词: {full_prompt}")
             
             # 准备请求数据
-            data = {}
+            data = self._build_request_data(full_prompt)
             files = {}
             
-            # 设置Segmind参数
-            data['seed'] = None  # 让API自动生成种子
-            data['prompt'] = full_prompt  # 使用我们构建的提示词
-            data['aspect_ratio'] = "match_input_image"  # 保持输入图片的宽高比
-            data['output_format'] = "png"  # 输出PNG格式
-            data['safety_tolerance'] = 5  # 提高安全容忍度，避免误判
-            data['guidance_scale'] = 7.5  # 增加引导强度，更好地遵循提示词
-            data['num_inference_steps'] = 20  # 增加推理步数，提高质量
-            
-            # 添加输入图片
+            # 添加输入图片（先缩小并重新编码，减少上传时间）
+            event_bus.report_stage('uploading_reference', provider='segmind')
+            reference_image_path = reference_normalizer.normalize(reference_image_path, 'segmind')
             with open(reference_image_path, 'rb') as img_file:
                 files['input_image'] = img_file
                 
@@ -96,9 +92,10 @@ class SegmindImageGenerator:
                 headers = {'x-api-key': self.api_key}
                 
                 print(f"📤 发送请求到Segmind API...")
+                event_bus.report_stage('calling_provider', provider='segmind')
                 
                 # 发送请求（增加超时时间，因为图片生成可能需要更长时间）
-                response = requests.post(self.base_url, data=data, files=files, headers=headers, timeout=120)
+                response = http_pool.post(self.base_url, data=data, files=files, headers=headers, timeout=120, provider='segmind')
             
             print(f"📊 API响应状态: {response.status_code}")
             
@@ -110,6 +107,7 @@ class SegmindImageGenerator:
                 
                 if image_data:
                     # 保存图片
+                    event_bus.report_stage('saving', provider='segmind')
                     generated_image_path = self._save_generated_image(image_data, prompt, style)
                     
                     if generated_image_path:
@@ -131,6 +129,20 @@ class SegmindImageGenerator:
             print(f"❌ Segmind API调用出错: {e}")
             return None
     
+    def _build_request_data(self, full_prompt):
+        """构建Segmind请求参数（同步和异步接口共用）"""
+        data = {}
+        
+        # 设置Segmind参数
+        data['seed'] = None  # 让API自动生成种子
+        data['prompt'] = full_prompt  # 使用我们构建的提示词
+        data['aspect_ratio'] = "match_input_image"  # 保持输入图片的宽高比
+        data['output_format'] = "png"  # 输出PNG格式
+        data['safety_tolerance'] = 5  # 提高安全容忍度，避免误判
+        data['guidance_scale'] = 7.5  # 增加引导强度，更好地遵循提示词
+        data['num_inference_steps'] = 20  # 增加推理步数，提高质量
+        return data
+    
     def _build_segmind_prompt(self, prompt, style):
         """构建适合Segmind的提示词"""
         
@@ -188,15 +200,11 @@ class SegmindImageGenerator:
             safe_prompt = "".join(c for c in prompt[:20] if c.isalnum() or c in " ").strip()
             safe_prompt = safe_prompt.replace(" ", "_")
             
-            filename = f"segmind_{timestamp}_{unique_id}_{safe_prompt}.png"
-            filepath = os.path.join(self.config.GENERATED_FOLDER, filename)
-            
-            # 确保目录存在
-            os.makedirs(self.config.GENERATED_FOLDER, exist_ok=True)
+            filename = f"segmind_{timestamp}_{unique_id}_{safe_prompt}"
+            base_path = os.path.join(self.config.GENERATED_FOLDER, filename)
             
-            # 直接保存二进制数据
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
+            # 直接保存二进制数据（先检查文件头确认是图片，扩展名按实际格式确定）
+            filepath = save_image_bytes(image_data, base_path)
             
             print(f"💾 图片已保存到: {filepath}")
             return filepath
@@ -229,5 +237,10 @@ class SegmindImageGenerator:
                 'error': f'连接测试失败: {str(e)}'
             }
 
-# 全局实例
-segmind_generator = SegmindImageGenerator()
+# 全局实例由 provider_registry 在第一次使用时创建；
+# 保留原来的模块属性，兼容 from segmind_image_generator import segmind_generator 的写法
+def __getattr__(name):
+    if name == 'segmind_generator':
+        from provider_registry import providers
+        return providers.get('segmind')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
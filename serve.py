@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+生产环境启动脚本
+按 Config 中的 SERVER_* 设置启动WSGI服务器，依次尝试:
+1. gunicorn（多进程 + 每进程多线程，支持平滑重启：kill -HUP <主进程ID>）
+2. waitress（单进程多线程，Windows上也能使用）
+3. Werkzeug（Flask自带的服务器，只在前两者都没有安装时使用）
+SERVER_BACKEND=uvicorn 时改为启动 asgi.py（/async/* 异步接口 + 原来的Flask接口）
+
+使用方法:
+    python serve.py
+    SERVER_WORKERS=2 SERVER_THREADS=32 python serve.py
+"""
+
+import sys
+from config import Config
+
+
+def load_app():
+    """导入应用（gunicorn在每个工作进程fork之后调用，生成器等单例都在工作进程里创建）"""
+    from wsgi import app
+    return app
+
+
+def gunicorn_options():
+    """gunicorn配置"""
+    return {
+        'bind': f'{Config.SERVER_HOST}:{Config.SERVER_PORT}',
+        'workers': Config.SERVER_WORKERS,
+        'worker_class': 'gthread',
+        'threads': Config.SERVER_THREADS,
+        'keepalive': Config.SERVER_KEEPALIVE,
+        'timeout': Config.SERVER_TIMEOUT,
+        'graceful_timeout': Config.SERVER_GRACEFUL_TIMEOUT,
+        'max_requests': Config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': Config.SERVER_MAX_REQUESTS_JITTER,
+        'reload': Config.SERVER_RELOAD,
+        # 不预加载应用：主进程不导入app，避免线程池、HTTP连接等被fork到工作进程
+        'preload_app': False,
+        'accesslog': '-',
+    }
+
+
+def run_gunicorn():
+    """使用gunicorn启动"""
+    from gunicorn.app.base import BaseApplication
+
+    class StandaloneApplication(BaseApplication):
+        """以代码方式配置的gunicorn应用"""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return load_app()
+
+    options = gunicorn_options()
+    print(f"🚀 使用gunicorn启动: {options['bind']}，{options['workers']}个进程 × {options['threads']}个线程")
+    StandaloneApplication(options).run()
+
+
+def run_waitress():
+    """使用waitress启动（单进程）"""
+    from waitress import serve
+
+    print(f"🚀 使用waitress启动: {Config.SERVER_HOST}:{Config.SERVER_PORT}，{Config.SERVER_THREADS}个线程")
+    serve(
+        load_app(),
+        host=Config.SERVER_HOST,
+        port=Config.SERVER_PORT,
+        threads=Config.SERVER_THREADS,
+        channel_timeout=Config.SERVER_TIMEOUT,
+        # SSE等长连接也占用连接数，留出余量
+        connection_limit=max(100, Config.SERVER_THREADS * 8),
+    )
+
+
+def run_werkzeug():
+    """使用Werkzeug启动（没有安装生产环境服务器时的兜底方案）"""
+    from werkzeug.serving import run_simple
+
+    print(f"⚠️ 没有安装gunicorn或waitress，使用Werkzeug服务器: {Config.SERVER_HOST}:{Config.SERVER_PORT}")
+    print("   建议安装: pip install gunicorn（Linux/macOS）或 pip install waitress（Windows）")
+    run_simple(
+        Config.SERVER_HOST,
+        Config.SERVER_PORT,
+        load_app(),
+        threaded=True,
+        use_reloader=Config.SERVER_RELOAD,
+    )
+
+
+def run_uvicorn():
+    """使用uvicorn启动ASGI应用（asgi.py）"""
+    import uvicorn
+
+    print(f"🚀 使用uvicorn启动: {Config.SERVER_HOST}:{Config.SERVER_PORT}，{Config.SERVER_WORKERS}个进程")
+    uvicorn.run(
+        'asgi:app',
+        host=Config.SERVER_HOST,
+        port=Config.SERVER_PORT,
+        # 开启自动重新加载时uvicorn只能使用单进程
+        workers=None if Config.SERVER_RELOAD else Config.SERVER_WORKERS,
+        timeout_keep_alive=Config.SERVER_KEEPALIVE,
+        timeout_graceful_shutdown=Config.SERVER_GRACEFUL_TIMEOUT,
+        limit_max_requests=Config.SERVER_MAX_REQUESTS or None,
+        reload=Config.SERVER_RELOAD,
+    )
+
+
+SERVERS = {
+    'gunicorn': run_gunicorn,
+    'waitress': run_waitress,
+    'werkzeug': run_werkzeug,
+    'uvicorn': run_uvicorn,
+}
+
+
+def main():
+    """按配置选择服务器；auto 时按 gunicorn → waitress → Werkzeug 的顺序尝试"""
+    backend = Config.SERVER_BACKEND.lower()
+    if backend != 'auto':
+        runner = SERVERS.get(backend)
+        if runner is None:
+            print(f"❌ 未知的服务器类型: {backend}（可选: auto、{'、'.join(SERVERS)}）")
+            sys.exit(1)
+        runner()
+        return
+
+    for name in ('gunicorn', 'waitress'):
+        if name == 'gunicorn' and sys.platform == 'win32':
+            continue
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        SERVERS[name]()
+        return
+    run_werkzeug()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""熔断器状态切换测试"""
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    """可以手动拨动的 time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', fake)
+    return fake
+
+
+def make_breaker(probes=1):
+    return CircuitBreaker('test', window_seconds=60, min_requests=4,
+                          failure_rate=0.5, open_seconds=30, half_open_probes=probes)
+
+
+def trip(breaker):
+    """连续失败直到熔断器打开"""
+    for _ in range(breaker.min_requests):
+        breaker.record_failure(ticket=breaker.allow_request())
+    assert breaker.state == 'open'
+
+
+def test_opens_when_failure_rate_reached(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(ticket=breaker.allow_request())
+    # 请求数还没到 min_requests，不熔断
+    assert breaker.state == 'closed'
+
+    breaker.record_failure(ticket=breaker.allow_request())
+    assert breaker.state == 'open'
+    assert breaker.allow_request() is False
+
+
+def test_successes_keep_circuit_closed(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_success(ticket=breaker.allow_request())
+    for _ in range(2):
+        breaker.record_failure(ticket=breaker.allow_request())
+    # 5 次中失败 2 次，低于失败率阈值
+    assert breaker.state == 'closed'
+
+
+def test_failures_outside_window_are_forgotten(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(ticket=breaker.allow_request())
+    clock.now += 61
+    breaker.record_failure(ticket=breaker.allow_request())
+    assert breaker.state == 'closed'
+
+
+def test_half_open_after_cooldown_limits_probes(clock):
+    breaker = make_breaker(probes=1)
+    trip(breaker)
+
+    clock.now += 29
+    assert breaker.allow_request() is False
+
+    clock.now += 1
+    probe = breaker.allow_request()
+    assert probe
+    assert breaker.state == 'half_open'
+    # 探测名额已用完
+    assert breaker.allow_request() is False
+
+    breaker.record_success(ticket=probe)
+    assert breaker.state == 'closed'
+    assert breaker.allow_request()
+
+
+def test_half_open_needs_all_probes_to_succeed(clock):
+    breaker = make_breaker(probes=2)
+    trip(breaker)
+    clock.now += 30
+
+    first, second = breaker.allow_request(), breaker.allow_request()
+    breaker.record_success(ticket=first)
+    assert breaker.state == 'half_open'
+    breaker.record_success(ticket=second)
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 30
+
+    probe = breaker.allow_request()
+    breaker.record_failure(timeout=True, ticket=probe)
+    assert breaker.state == 'open'
+    assert breaker.allow_request() is False
+    # 重新冷却
+    clock.now += 30
+    assert breaker.allow_request()
+
+
+def test_release_probe_returns_slot(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 30
+
+    probe = breaker.allow_request()
+    assert breaker.allow_request() is False
+
+    # 被取消的探测不计成功也不计失败
+    breaker.release_probe(ticket=probe)
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request()
+
+
+def test_release_probe_outside_half_open_is_noop(clock):
+    breaker = make_breaker()
+    ticket = breaker.allow_request()
+    breaker.release_probe(ticket=ticket)
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()['requests'] == 0
+
+
+def test_success_from_request_admitted_while_closed_is_not_a_probe(clock):
+    breaker = make_breaker(probes=1)
+    slow = breaker.allow_request()     # 熔断之前发出、很久才返回的请求
+    trip(breaker)
+    clock.now += 30
+
+    probe = breaker.allow_request()
+    breaker.record_success(ticket=slow)
+    # 旧请求的成功不能关闭熔断器，也不能归还探测名额
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request() is False
+
+    breaker.record_success(ticket=probe)
+    assert breaker.state == 'closed'
+
+
+def test_failure_from_request_admitted_while_closed_does_not_reopen(clock):
+    breaker = make_breaker()
+    slow = breaker.allow_request()
+    trip(breaker)
+    clock.now += 30
+
+    probe = breaker.allow_request()
+    breaker.record_failure(ticket=slow)
+    assert breaker.state == 'half_open'
+    breaker.record_success(ticket=probe)
+    assert breaker.state == 'closed'
+
+
+def test_probe_from_previous_half_open_round_is_ignored(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 30
+    stale_probe = breaker.allow_request()
+    breaker.release_probe(ticket=stale_probe)
+    breaker.record_failure(ticket=breaker.allow_request())   # 第二个探测失败，重新熔断
+    clock.now += 30
+
+    probe = breaker.allow_request()
+    breaker.record_success(ticket=stale_probe)
+    assert breaker.state == 'half_open'
+    breaker.record_success(ticket=probe)
+    assert breaker.state == 'closed'
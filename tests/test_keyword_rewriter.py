@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""关键词改写引擎测试：和原来逐个 str.replace 的实现对比匹配语义"""
+
+import random
+
+from keyword_rewriter import KeywordRewriter
+
+
+def sequential_replace(text, mappings):
+    """原来 PromptEnhancer._replace_keywords 的实现：按字典顺序逐个替换"""
+    for keyword, replacement in mappings.items():
+        if keyword in text:
+            text = text.replace(keyword, replacement)
+    return text
+
+
+def leftmost_longest(text, mappings):
+    """逐个位置暴力查找的最左最长替换，作为自动机的参照实现"""
+    pieces = []
+    position = 0
+    while position < len(text):
+        matches = [keyword for keyword in mappings if text.startswith(keyword, position)]
+        if matches:
+            keyword = max(matches, key=len)
+            pieces.append(mappings[keyword])
+            position += len(keyword)
+        else:
+            pieces.append(text[position])
+            position += 1
+    return ''.join(pieces)
+
+
+def test_same_result_as_sequential_replace_without_overlaps():
+    mappings = {'猫': 'cat', '狗': 'dog', '红色': 'red', '跑步': 'running'}
+    text = '红色的猫和狗在跑步，猫很开心'
+    assert KeywordRewriter(mappings).rewrite(text) == sequential_replace(text, mappings)
+
+
+def test_longest_match_wins_regardless_of_order():
+    mappings = {'猫': 'cat', '熊猫': 'panda'}
+    rewriter = KeywordRewriter(mappings)
+    assert rewriter.rewrite('熊猫和猫') == 'panda和cat'
+    # 原来的实现先替换 '猫'，'熊猫' 变成了 '熊cat'
+    assert sequential_replace('熊猫和猫', mappings) == '熊cat和cat'
+
+
+def test_overlapping_keywords_use_leftmost_match():
+    mappings = {'惊喜': 'surprise', '喜欢': 'like'}
+    assert KeywordRewriter(mappings).rewrite('惊喜欢') == 'surprise欢'
+
+
+def test_replacement_text_is_not_rewritten_again():
+    mappings = {'猫': 'cute cat', 'cat': 'feline'}
+    rewriter = KeywordRewriter(mappings)
+    assert rewriter.rewrite('猫') == 'cute cat'
+    # 原来的实现会把替换出来的英文再替换一次
+    assert sequential_replace('猫', mappings) == 'cute feline'
+
+
+def test_matches_brute_force_leftmost_longest():
+    rng = random.Random(7)
+    alphabet = 'abcd'
+    for _ in range(200):
+        mappings = {
+            ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))): f'<{index}>'
+            for index in range(rng.randint(1, 8))
+        }
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert KeywordRewriter(mappings).rewrite(text) == leftmost_longest(text, mappings), (mappings, text)
+
+
+def test_add_rebuilds_automaton():
+    rewriter = KeywordRewriter({'猫': 'cat'})
+    assert rewriter.rewrite('熊猫') == '熊cat'
+    rewriter.add('熊猫', 'panda')
+    assert rewriter.rewrite('熊猫') == 'panda'
+    rewriter.add('猫', 'kitty')
+    assert rewriter.rewrite('猫和熊猫') == 'kitty和panda'
+
+
+def test_find_all_in_order_without_duplicates():
+    rewriter = KeywordRewriter({'猫': 'cat', '熊猫': 'panda', '狗': 'dog'})
+    assert rewriter.find_all('狗追熊猫，猫追狗') == ['狗', '熊猫', '猫']
+
+
+def test_empty_inputs():
+    assert KeywordRewriter().rewrite('猫') == '猫'
+    assert KeywordRewriter({'猫': 'cat'}).rewrite('') == ''
+    assert KeywordRewriter({'猫': 'cat'}).find_all('') == []
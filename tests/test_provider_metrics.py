@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""AI服务调用指标测试：同步和异步接口对同一种失败记录相同的结果"""
+
+import asyncio
+
+import pytest
+
+from metrics import provider_calls_total, style_label
+from openrouter_image_generator import OpenRouterImageGenerator
+from async_generators import AsyncOpenRouterGenerator
+
+
+def outcomes(style):
+    """当前 openrouter 调用按结果分类的次数"""
+    return {
+        outcome: provider_calls_total.value(
+            provider='openrouter', operation='generate_image', style=style_label(style), outcome=outcome)
+        for outcome in ('success', 'failed')
+    }
+
+
+def recorded(call, style):
+    """执行一次调用，返回这次新增的结果分类"""
+    before = outcomes(style)
+    call()
+    after = outcomes(style)
+    return {outcome for outcome in after if after[outcome] != before[outcome]}
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    sync = OpenRouterImageGenerator()
+    # 同步接口失败后会生成示例图片，这里直接返回示例图片路径，不实际绘图
+    monkeypatch.setattr(sync, '_generate_fallback', lambda prompt, style: 'generated/demo_test.png')
+    return sync
+
+
+def broken_request(*args, **kwargs):
+    raise RuntimeError('upstream error')
+
+
+@pytest.mark.parametrize('failure', ['missing_key', 'exception'])
+def test_sync_and_async_record_same_outcome_when_openrouter_fails(generator, monkeypatch, failure):
+    if failure == 'missing_key':
+        monkeypatch.setattr(generator, 'api_key', None)
+    else:
+        monkeypatch.setattr(generator, 'api_key', 'sk-or-v1-test')
+        monkeypatch.setattr(generator, '_build_request', broken_request)
+    async_generator = AsyncOpenRouterGenerator(generator=generator)
+
+    sync_outcome = recorded(lambda: generator.generate_image('cat', 'disney'), 'disney')
+    async_outcome = recorded(lambda: asyncio.run(async_generator.generate_image('cat', 'disney')), 'disney')
+
+    assert sync_outcome == async_outcome == {'failed'}
+
+
+def test_long_document_records_each_doubao_call():
+    from config import Config
+    from document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    processor._chat_completion = lambda prompt, max_tokens=1000, temperature=0.7: '要点'
+    operations = ('summarize_document_chunk', 'reduce_document_summaries')
+
+    def calls():
+        return {
+            operation: provider_calls_total.value(
+                provider='doubao', operation=operation, style='none', outcome='success')
+            for operation in operations
+        }
+
+    before = calls()
+    text = '文档内容。' * (Config.DOCUMENT_CHUNK_TOKENS * 2)
+    assert processor._analyze_long_document(text) == '要点'
+    after = calls()
+    assert after['summarize_document_chunk'] - before['summarize_document_chunk'] > 1
+    assert after['reduce_document_summaries'] - before['reduce_document_summaries'] == 1
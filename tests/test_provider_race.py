@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""对冲执行测试：胜出、落选结果的处理和超时"""
+
+import time
+import asyncio
+import threading
+
+from provider_race import race_providers, race_providers_async
+
+
+class Discarded:
+    """收集 on_discard 回调收到的落选结果"""
+
+    def __init__(self):
+        self.items = []
+        self.event = threading.Event()
+
+    def __call__(self, name, result):
+        self.items.append((name, result))
+        self.event.set()
+
+
+def returning(value, delay=0.0, started=None):
+    """延迟 delay 秒后返回 value 的候选函数"""
+    def func():
+        if started is not None:
+            started.append(value)
+        time.sleep(delay)
+        return value
+    return func
+
+
+def failing(delay=0.0):
+    def func():
+        time.sleep(delay)
+        raise RuntimeError('upstream error')
+    return func
+
+
+def test_fast_primary_wins_without_hedging():
+    started = []
+    name, result = race_providers(
+        [('a', returning('a.png', started=started)), ('b', returning('b.png', started=started))],
+        hedge_delay=0.5, timeout=5)
+    assert (name, result) == ('a', 'a.png')
+    assert started == ['a.png']
+
+
+def test_slow_primary_is_hedged_and_loser_discarded():
+    discarded = Discarded()
+    name, result = race_providers(
+        [('a', returning('a.png', delay=0.3)), ('b', returning('b.png'))],
+        hedge_delay=0.05, timeout=5, on_discard=discarded)
+    assert (name, result) == ('b', 'b.png')
+    # 落选的 a 完成后结果交给 on_discard
+    assert discarded.event.wait(2)
+    assert discarded.items == [('a', 'a.png')]
+
+
+def test_failure_launches_next_candidate_immediately():
+    started_at = time.monotonic()
+    name, result = race_providers(
+        [('a', failing()), ('b', returning(None)), ('c', returning('c.png'))],
+        hedge_delay=5, timeout=10)
+    assert (name, result) == ('c', 'c.png')
+    # 没有等待对冲延迟
+    assert time.monotonic() - started_at < 2
+
+
+def test_all_candidates_fail():
+    assert race_providers([('a', failing()), ('b', returning(None))], hedge_delay=0.01, timeout=5) == (None, None)
+
+
+def test_timeout_returns_nothing_and_discards_late_results():
+    discarded = Discarded()
+    started_at = time.monotonic()
+    result = race_providers(
+        [('a', returning('a.png', delay=0.4))],
+        hedge_delay=0.05, timeout=0.1, on_discard=discarded)
+    assert result == (None, None)
+    assert time.monotonic() - started_at < 0.35
+    assert discarded.event.wait(2)
+    assert discarded.items == [('a', 'a.png')]
+
+
+def test_failed_loser_is_not_discarded():
+    discarded = Discarded()
+    name, _ = race_providers(
+        [('a', failing(delay=0.2)), ('b', returning('b.png'))],
+        hedge_delay=0.05, timeout=5, on_discard=discarded)
+    assert name == 'b'
+    time.sleep(0.3)
+    assert discarded.items == []
+
+
+def async_returning(value, delay=0.0, cancelled=None):
+    async def func():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(value)
+            raise
+        return value
+    return func
+
+
+def test_async_hedged_winner_cancels_loser():
+    cancelled = []
+    discarded = Discarded()
+
+    async def main():
+        return await race_providers_async(
+            [('a', async_returning('a.png', delay=1, cancelled=cancelled)), ('b', async_returning('b.png'))],
+            hedge_delay=0.05, timeout=5, on_discard=discarded)
+
+    assert asyncio.run(main()) == ('b', 'b.png')
+    # 还在等待上游的落选者被取消，没有结果需要丢弃
+    assert cancelled == ['a.png']
+    assert discarded.items == []
+
+
+def test_async_timeout():
+    cancelled = []
+
+    async def main():
+        return await race_providers_async(
+            [('a', async_returning('a.png', delay=1, cancelled=cancelled))],
+            hedge_delay=0.05, timeout=0.1)
+
+    assert asyncio.run(main()) == (None, None)
+    assert cancelled == ['a.png']
+
+
+def test_async_cancelled_race_cancels_running_candidates():
+    cancelled = []
+
+    async def main():
+        task = asyncio.ensure_future(race_providers_async(
+            [('a', async_returning('a.png', delay=1, cancelled=cancelled))],
+            hedge_delay=0.05, timeout=5))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == ['a.png']
+
+
+def test_async_loser_finishing_save_after_winner_is_removed(tmp_path, monkeypatch):
+    from config import Config
+    from async_generators import _save_in_thread
+    monkeypatch.setattr(Config, 'GENERATED_FOLDER', str(tmp_path))
+
+    saving = threading.Event()
+    saved = threading.Event()
+    loser_path = tmp_path / 'loser.png'
+
+    def slow_save():
+        # 模拟已经在线程池中写文件的落选模型：赢家返回之后才写完
+        saving.set()
+        time.sleep(0.2)
+        loser_path.write_bytes(b'png')
+        saved.set()
+        return str(loser_path)
+
+    async def loser():
+        return await _save_in_thread('a', slow_save)
+
+    async def winner():
+        while not saving.is_set():
+            await asyncio.sleep(0.01)
+        return 'b.png'
+
+    async def main():
+        result = await race_providers_async([('a', loser), ('b', winner)], hedge_delay=0, timeout=5)
+        # 等落选者的线程写完，回调在事件循环中执行
+        while not saved.is_set():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        return result
+
+    assert asyncio.run(main()) == ('b', 'b.png')
+    assert not loser_path.exists()
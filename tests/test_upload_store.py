@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""上传文件存储测试：多个进程共用 uploads/ 目录时互不删除对方正在使用的文件"""
+
+import io
+import os
+
+from upload_store import UploadStore
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 64
+
+
+def test_same_content_is_shared_but_each_upload_has_its_own_path(tmp_path):
+    store = UploadStore(folder=str(tmp_path))
+    first = store.save(io.BytesIO(PNG), 'a.png')
+    second = store.save(io.BytesIO(PNG), 'b.png')
+
+    assert first != second
+    assert os.path.samefile(first, second)
+    assert store.file_digest(first) == store.file_digest(second)
+
+
+def test_release_in_one_process_keeps_other_process_file(tmp_path):
+    # 两个存储实例模拟两个工作进程（引用计数各自独立）
+    worker_a = UploadStore(folder=str(tmp_path))
+    worker_b = UploadStore(folder=str(tmp_path))
+    path_a = worker_a.save(io.BytesIO(PNG), 'a.png')
+    path_b = worker_b.save(io.BytesIO(PNG), 'a.png')
+
+    worker_a.release(path_a)
+    assert not os.path.exists(path_a)
+    with open(path_b, 'rb') as f:
+        assert f.read() == PNG
+
+    worker_b.release(path_b)
+    assert os.listdir(tmp_path) == []
+
+
+def test_acquired_path_survives_until_last_release(tmp_path):
+    store = UploadStore(folder=str(tmp_path))
+    path = store.save(io.BytesIO(PNG), 'a.png')
+    store.acquire(path)
+
+    store.release(path)
+    assert os.path.exists(path)
+    store.release(path)
+    assert not os.path.exists(path)
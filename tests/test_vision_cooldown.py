@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""豆包视觉模型冷却测试：截止时间截短的超时不算模型失败"""
+
+import time
+
+import pytest
+import requests
+
+import document_processor
+from document_processor import DocumentProcessor
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    def timeout_post(*args, **kwargs):
+        raise requests.exceptions.Timeout('read timed out')
+    monkeypatch.setattr(document_processor.http_pool, 'post', timeout_post)
+    return DocumentProcessor()
+
+
+def test_timeout_clipped_by_deadline_does_not_cool_down_model(processor):
+    deadline = time.monotonic() + processor.timeout / 2
+    assert processor._call_vision_model('model-a', 'data:image/png;base64,', deadline) is None
+    assert 'model-a' not in processor._vision_failed_until
+
+
+def test_model_own_timeout_still_cools_down_model(processor):
+    deadline = time.monotonic() + processor.timeout * 2
+    assert processor._call_vision_model('model-a', 'data:image/png;base64,', deadline) is None
+    assert processor._vision_failed_until['model-a'] > time.monotonic()
@@ -7,8 +7,9 @@
 """
 
 import os
-import base64
 from typing import Optional, Dict, Any, List
+from encoding_cache import encoding_cache
+from reference_normalizer import reference_normalizer
 
 class UnifiedReferenceHandler:
     """统一参考图处理器"""
@@ -29,11 +30,31 @@ class UnifiedReferenceHandler:
                 print(f"⚠️ 图片文件不存在: {image_path}")
                 return None
             
-            with open(image_path, 'rb') as img_file:
-                img_data = img_file.read()
-                base64_data = base64.b64encode(img_data).decode('utf-8')
-                print(f"✅ 图片Base64转换成功，数据长度: {len(base64_data)}")
-                return base64_data
+            base64_data = encoding_cache.base64(image_path)
+            print(f"✅ 图片Base64转换成功，数据长度: {len(base64_data)}")
+            return base64_data
+                
+        except Exception as e:
+            print(f"❌ 图片Base64转换失败: {e}")
+            return None
+    
+    @staticmethod
+    def image_to_data_url(image_path: str) -> Optional[str]:
+        """
+        将图片文件转换为data URL（MIME类型根据文件头判断）
+        
+        Args:
+            image_path: 图片文件路径
+            
+        Returns:
+            data URL字符串，失败时返回None
+        """
+        try:
+            if not os.path.exists(image_path):
+                print(f"⚠️ 图片文件不存在: {image_path}")
+                return None
+            
+            return encoding_cache.data_url(image_path)
                 
         except Exception as e:
             print(f"❌ 图片Base64转换失败: {e}")
@@ -74,11 +95,12 @@ class UnifiedReferenceHandler:
         
         # 添加参考图片（如果提供）
         if reference_image_path:
-            base64_data = UnifiedReferenceHandler.image_to_base64(reference_image_path)
-            if base64_data:
+            normalized_path = reference_normalizer.normalize(reference_image_path, 'openrouter')
+            data_url = UnifiedReferenceHandler.image_to_data_url(normalized_path)
+            if data_url:
                 data["messages"][0]["content"].append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_data}"}
+                    "image_url": {"url": data_url}
                 })
                 print(f"📸 已添加参考图片到OpenRouter格式请求中")
             else:
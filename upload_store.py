@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内容寻址的上传文件存储
+上传文件按内容的SHA-256命名保存在 uploads/ 目录（<sha256><扩展名>），同样的文件上传多次只保存一份；
+每次上传另外得到一个指向这份内容的硬链接（<sha256>_<uuid><扩展名>），请求只使用、只删除自己的链接。
+多个工作进程共用 uploads/ 目录，某个进程用完删除自己的链接不会影响其他进程正在使用的同一张图片
+"""
+
+import os
+import re
+import uuid
+import hashlib
+import tempfile
+import threading
+from config import Config
+import fork_safety
+from metrics import track_file_save
+
+# 内容寻址文件名：64位十六进制SHA-256 + 可选的每次上传的链接后缀 + 可选扩展名
+_BLOB_NAME = re.compile(r'^([0-9a-f]{64})(_[0-9a-f]{32})?(\.[a-z0-9]+)?$')
+
+
+def _hash_file(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class UploadStore:
+    """
+    上传文件存储
+    写入时边读边计算哈希，内容已存在时丢弃新写入的临时文件；
+    save 返回本次上传自己的链接，acquire/release 维护这个链接在当前进程内的引用计数，
+    不再被引用时删除链接；共享的内容文件在最后一个链接（任何进程的）删除后才删除
+    """
+
+    def __init__(self, folder=None, chunk_size=1024 * 1024):
+        """初始化上传文件存储"""
+        self.folder = folder or Config.UPLOAD_FOLDER
+        self.chunk_size = chunk_size
+        self._refcounts = {}  # 文件路径 -> 引用计数
+        self._digests = {}    # (路径, 修改时间, 大小) -> SHA-256，用于非内容寻址的文件
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _extension(filename):
+        """取出允许的扩展名（小写），不允许的扩展名返回空字符串"""
+        ext = os.path.splitext(filename or '')[1].lower()
+        return ext if ext[1:] in Config.ALLOWED_EXTENSIONS else ''
+
+    def save(self, file, filename=None):
+        """
+        保存上传的文件并增加一次引用
+
+        参数:
+        - file: Flask的FileStorage对象（或任何带 read 方法的文件对象）
+        - filename: 原始文件名（用于确定扩展名），默认取 file.filename
+
+        返回:
+        - 本次上传的文件路径（指向共享内容的链接），用完后需要调用 release
+        """
+        filename = filename or getattr(file, 'filename', '')
+        stream = getattr(file, 'stream', file)
+        os.makedirs(self.folder, exist_ok=True)
+
+        # 边写入临时文件边计算哈希
+        sha256 = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.upload_', suffix='.tmp')
+        try:
+            with track_file_save('upload') as stats, os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    sha256.update(chunk)
+                    tmp_file.write(chunk)
+                    stats['bytes'] += len(chunk)
+
+            digest, ext = sha256.hexdigest(), self._extension(filename)
+            blob_path = os.path.join(self.folder, digest + ext)
+            path = os.path.join(self.folder, f'{digest}_{uuid.uuid4().hex}{ext}')
+            self._link(tmp_path, blob_path, path)
+            with self._lock:
+                self._refcounts[path] = self._refcounts.get(path, 0) + 1
+            return path
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _link(tmp_path, blob_path, path):
+        """
+        让 path 指向上传的内容：相同内容已经保存过时链接到已有文件并丢弃这次写入，
+        否则把临时文件保存为共享的内容文件；文件系统不支持硬链接时 path 直接使用临时文件
+        """
+        try:
+            os.link(blob_path, path)
+            os.remove(tmp_path)
+            print(f"♻️ 上传文件已存在，复用: {blob_path}")
+            return
+        except FileNotFoundError:
+            pass    # 还没有保存过（或者刚被其他进程删除），使用这次写入的文件
+        except OSError:
+            os.replace(tmp_path, path)
+            return
+
+        # 先建立本次的链接再放到共享位置，共享文件出现时至少已经有两个链接，不会被其他进程当作无人使用删除
+        os.link(tmp_path, path)
+        os.replace(tmp_path, blob_path)
+
+    def acquire(self, path):
+        """增加一次引用"""
+        with self._lock:
+            self._refcounts[path] = self._refcounts.get(path, 0) + 1
+
+    def release(self, path):
+        """减少一次引用，不再被引用时删除本次上传的链接（共享内容没有其他链接时一起删除）"""
+        if not path:
+            return
+        with self._lock:
+            count = self._refcounts.get(path, 0) - 1
+            if count > 0:
+                self._refcounts[path] = count
+                return
+            self._refcounts.pop(path, None)
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"⚠️ 删除上传文件失败: {str(e)}")
+            self._remove_unlinked_blob(path)
+
+    def _remove_unlinked_blob(self, path):
+        """
+        删除已经没有任何上传链接的共享内容文件
+        其他进程即使在检查之后又链接到了它，它们的链接仍然指向同一份数据，删除共享文件名不影响它们
+        """
+        match = _BLOB_NAME.match(os.path.basename(path))
+        if not match or not match.group(2):
+            return
+        blob_path = os.path.join(os.path.dirname(path), match.group(1) + (match.group(3) or ''))
+        try:
+            if os.stat(blob_path).st_nlink <= 1:
+                os.remove(blob_path)
+        except OSError:
+            pass
+
+    def file_digest(self, path):
+        """
+        获取文件内容的SHA-256
+        存储中的文件直接从文件名读取，其他文件计算一次后按修改时间和大小缓存
+        """
+        match = _BLOB_NAME.match(os.path.basename(path))
+        if match and os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.folder):
+            return match.group(1)
+
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = _hash_file(path, self.chunk_size)
+            with self._lock:
+                if len(self._digests) >= 1024:
+                    self._digests.clear()
+                self._digests[key] = digest
+        return digest
+
+    def stats(self):
+        """返回当前被引用的文件数"""
+        with self._lock:
+            return {'referenced_files': len(self._refcounts)}
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：重新创建锁（引用计数和哈希缓存保留）"""
+        self._lock = threading.Lock()
+
+
+# 全局实例
+upload_store = UploadStore()
+fork_safety.register(upload_store)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+视频任务后台轮询器
+由一个后台线程统一查询所有进行中的ARK视频任务，结果写入内存缓存；
+/check_video_task 直接从缓存读取，上游请求量只和任务数有关，与前端轮询次数无关
+"""
+
+import time
+import threading
+from config import Config
+import fork_safety
+from provider_registry import providers
+from event_bus import event_bus
+
+
+class VideoTaskPoller:
+    """ARK视频任务状态轮询器"""
+
+    # 任务结束后不再需要查询的状态
+    TERMINAL_STATUSES = {'completed', 'succeeded', 'failed', 'cancelled', 'canceled', 'expired'}
+
+    def __init__(self, generator=None):
+        """初始化轮询器（后台线程在第一次跟踪任务时启动）"""
+        self._generator = generator
+        self.min_interval = Config.VIDEO_POLL_MIN_INTERVAL
+        self.max_interval = Config.VIDEO_POLL_MAX_INTERVAL
+        self.backoff = Config.VIDEO_POLL_BACKOFF
+        self.max_errors = Config.VIDEO_POLL_MAX_ERRORS
+        self.retention_seconds = Config.VIDEO_STATUS_RETENTION_SECONDS
+
+        self._tasks = {}  # task_id -> 跟踪状态
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def generator(self):
+        """查询任务状态使用的视频生成器（默认从注册表获取）"""
+        return self._generator or providers.get('video')
+
+    def _new_task(self):
+        """新的跟踪状态（立即安排第一次查询）"""
+        return {
+            'result': None,           # 最近一次成功查询的结果
+            'status': None,
+            'interval': self.min_interval,
+            'next_poll': time.monotonic(),
+            'errors': 0,
+            'finished_at': None,
+            'checked_at': None
+        }
+
+    def track(self, task_id):
+        """
+        开始跟踪一个视频任务（立即安排第一次查询）
+        只用于 create_video_task 刚返回的任务ID；客户端传来的ID通过 get_status 查询
+        """
+        with self._cond:
+            if task_id not in self._tasks:
+                self._tasks[task_id] = self._new_task()
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def adopt(self, task_id, result):
+        """
+        接管一个直接查询过的任务：只有查询成功（ARK确认任务存在）时才保存并开始跟踪，
+        失败的查询什么也不保存，编造的任务ID不会占用内存，也不会触发后台查询
+        """
+        if not result.get('success'):
+            return
+        status = result.get('status')
+        with self._cond:
+            if task_id in self._tasks:
+                return
+            task = self._new_task()
+            task['result'] = result
+            task['status'] = status
+            task['checked_at'] = time.time()
+            if status in self.TERMINAL_STATUSES:
+                task['finished_at'] = time.monotonic()
+            else:
+                task['next_poll'] = time.monotonic() + task['interval']
+            self._tasks[task_id] = task
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def get_status(self, task_id, wait_timeout=None):
+        """
+        查询任务状态（从缓存读取）
+
+        - 正在跟踪的任务：返回缓存结果，还没有结果时最多等待 wait_timeout 秒拿到第一次结果；
+          之前因为连续查询失败停止跟踪的任务会重新开始查询（ARK可能已经恢复）
+        - 没有跟踪的任务：直接向ARK查询一次，查询成功才开始跟踪
+
+        返回:
+        - 与 AIVideoGenerator.check_task_status 相同格式的字典
+        """
+        wait_timeout = Config.VIDEO_POLL_FIRST_WAIT if wait_timeout is None else wait_timeout
+
+        with self._cond:
+            task = self._tasks.get(task_id)
+            revived_from = None
+            if task is not None and task['finished_at'] is not None and task['status'] not in self.TERMINAL_STATUSES:
+                task['errors'] = 0
+                task['finished_at'] = None
+                task['interval'] = self.min_interval
+                task['next_poll'] = time.monotonic()
+                revived_from = task['checked_at']
+                self._ensure_thread()
+                self._cond.notify_all()
+
+        if task is None:
+            result = self.generator.check_task_status(task_id)
+            self.adopt(task_id, result)
+            return dict(result, checked_at=time.time() if result.get('success') else None)
+
+        deadline = time.monotonic() + wait_timeout
+        with self._cond:
+            while True:
+                task = self._tasks.get(task_id)
+                if task is None:
+                    break
+                fresh = revived_from is None or task['checked_at'] != revived_from
+                if task['result'] is not None and fresh:
+                    return dict(task['result'], checked_at=task['checked_at'])
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if task['result'] is not None:
+                        return dict(task['result'], checked_at=task['checked_at'])
+                    break
+                self._cond.wait(remaining)
+
+        return {
+            'success': True,
+            'status': 'queued',
+            'data': {},
+            'checked_at': None
+        }
+
+    def _ensure_thread(self):
+        """启动后台轮询线程（调用方需持有锁）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, daemon=True, name='video-task-poller')
+            self._thread.start()
+
+    def _reset_after_fork(self):
+        """fork之后在子进程中调用：轮询线程没有被继承，下次跟踪任务时重新启动"""
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _loop(self):
+        """后台轮询主循环"""
+        while True:
+            with self._cond:
+                due = self._collect_due_tasks()
+                if not due:
+                    self._cond.wait(self._seconds_until_next_poll())
+                    continue
+
+            for task_id in due:
+                self._poll(task_id)
+
+    def _collect_due_tasks(self):
+        """找出到期需要查询的任务，并清理过期的已结束任务（调用方需持有锁）"""
+        now = time.monotonic()
+        due = []
+        for task_id, task in list(self._tasks.items()):
+            if task['finished_at'] is not None:
+                if now - task['finished_at'] > self.retention_seconds:
+                    del self._tasks[task_id]
+                continue
+            if task['next_poll'] <= now:
+                due.append(task_id)
+        return due
+
+    def _seconds_until_next_poll(self):
+        """距离下一次需要查询的时间（调用方需持有锁）"""
+        now = time.monotonic()
+        pending = [task['next_poll'] for task in self._tasks.values() if task['finished_at'] is None]
+        if pending:
+            return max(0.05, min(pending) - now)
+        # 没有进行中的任务时，定期醒来清理过期记录
+        return self.retention_seconds
+
+    def _poll(self, task_id):
+        """查询一个任务并更新缓存，状态有变化时发布事件"""
+        try:
+            result = self.generator.check_task_status(task_id)
+        except Exception as e:
+            result = {'success': False, 'error': f'查询出错: {str(e)}'}
+
+        now = time.monotonic()
+        event = None
+        with self._cond:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return
+
+            if result.get('success'):
+                status = result.get('status')
+                changed = status != task['status']
+                task['result'] = result
+                task['status'] = status
+                task['errors'] = 0
+                task['checked_at'] = time.time()
+                if status in self.TERMINAL_STATUSES:
+                    task['finished_at'] = now
+                if changed:
+                    event = ({'task_id': task_id, 'status': status, 'data': result.get('data', {})},
+                             status in self.TERMINAL_STATUSES)
+                # 状态有变化时恢复最短间隔，否则逐步拉长查询间隔
+                task['interval'] = self.min_interval if changed else min(task['interval'] * self.backoff, self.max_interval)
+            else:
+                task['errors'] += 1
+                task['interval'] = min(task['interval'] * self.backoff, self.max_interval)
+                if task['result'] is None or task['errors'] >= self.max_errors:
+                    # 查询失败：把错误作为结果返回给前端；连续失败太多次就停止跟踪
+                    task['result'] = result
+                    task['checked_at'] = time.time()
+                if task['errors'] >= self.max_errors:
+                    task['finished_at'] = now
+                    event = ({'task_id': task_id, 'status': 'error', 'error': result.get('error')}, True)
+
+            task['next_poll'] = now + task['interval']
+            self._cond.notify_all()
+
+        if event:
+            data, final = event
+            event_bus.publish(task_id, 'video_status', data, final=final)
+
+    def final_event(self, task_id):
+        """
+        已结束任务的最终 video_status 事件数据（任务还在进行或没有跟踪时返回None）
+        用于事件频道已经清理、订阅者收不到历史事件的情况
+        """
+        with self._cond:
+            task = self._tasks.get(task_id)
+            if task is None or task['finished_at'] is None or task['result'] is None:
+                return None
+            if task['status'] in self.TERMINAL_STATUSES:
+                return {'task_id': task_id, 'status': task['status'], 'data': task['result'].get('data', {})}
+            return {'task_id': task_id, 'status': 'error', 'error': task['result'].get('error')}
+
+    def is_tracking(self, task_id):
+        """是否正在跟踪（或缓存着）该任务"""
+        with self._cond:
+            return task_id in self._tasks
+
+
+# 全局实例
+video_task_poller = VideoTaskPoller()
+fork_safety.register(video_task_poller)
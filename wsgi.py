@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+WSGI入口
+供gunicorn、waitress等生产环境服务器加载，例如:
+    gunicorn -k gthread --threads 16 -b 0.0.0.0:4000 wsgi:app
+推荐直接使用 python serve.py，它会按 Config 中的 SERVER_* 设置启动服务器
+"""
+
+from app import create_app
+
+app = create_app()